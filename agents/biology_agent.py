@@ -57,7 +57,7 @@ def register_biology_agent(agent_registry: AgentRegistry) -> bool:
 
 async def execute_biology_task(input_data: Dict[str, Any]) -> Dict[str, Any]:
     """
-    执行生物学任务的具体逻辑，优先使用Qwen大模型
+    执行生物学任务，提示词、采样参数和结果结构见领域智能体定义文件
     
     Args:
         input_data: 输入数据，包含查询和其他相关信息
@@ -65,16 +65,6 @@ async def execute_biology_task(input_data: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: 处理结果
     """
-    # 导入Qwen客户端
-    from core.qwen_client import QwenClient
-    
-    # 获取查询内容
-    query = input_data.get("query", "")
-    
-    # 创建Qwen客户端实例
-    qwen_client = QwenClient()
-    
-    # 调用Qwen模型执行生物学任务
-    result = await qwen_client.execute_biology_task(query)
-    
-    return result
+    from core.domain_agents import get_domain_agent_engine
+
+    return await get_domain_agent_engine().execute_by_name(BIOLOGY_AGENT_CONFIG["name"], input_data)
@@ -6,14 +6,20 @@
 """
 import asyncio
 import httpx
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, Optional
 from core.agent_registry import AgentRegistry
 from schemas.agent import AgentExecutionRequest, AgentExecutionResponse
 import json
-from core.utils.log_utils import info, debug, error
+from core.utils.log_utils import info, debug, error, truncate
+from core.metrics import stage_timer
+from core.deadline import check_deadline, remaining_timeout
 from core.config import settings
 # 外部API基础URL
 EXTERNAL_API_URL = settings.EXTERNAL_API_URL
+# 单次外部API调用的默认超时时间（秒）
+EXTERNAL_CALL_TIMEOUT = 30.0
+# 流式执行时请求外部API优先返回分块的流式响应
+STREAM_ACCEPT = "application/x-ndjson, text/event-stream, application/json"
 
 
 class ExternalAgentProcessor:
@@ -31,7 +37,7 @@ class ExternalAgentProcessor:
             registry: 智能体注册表实例
         """
         self.registry = registry
-        self.client = httpx.AsyncClient(timeout=30.0)  # 设置30秒超时
+        self.client = httpx.AsyncClient(timeout=EXTERNAL_CALL_TIMEOUT)  # 设置30秒超时
 
     async def execute_agent_task(self, agent_id: str, execution_request: AgentExecutionRequest) -> AgentExecutionResponse:
         """
@@ -118,11 +124,15 @@ class ExternalAgentProcessor:
             "user_question": self._extract_user_question(execution_request)
         }
         
-        info(f"调用外部API: {api_endpoint}, 请求数据: {request_data}")
+        info("调用外部API: %s, 请求数据: %s", api_endpoint, truncate(request_data))
         
         try:
             # 发送POST请求到外部API
-            response = await self.client.post(api_endpoint, json=request_data)
+            with stage_timer("external_api", agent=agent.name):
+                # 单次调用最多30秒，且不超过请求的剩余时间
+                response = await self.client.post(
+                    api_endpoint, json=request_data, timeout=remaining_timeout(EXTERNAL_CALL_TIMEOUT)
+                )
             response.raise_for_status()  # 如果状态码不是2xx会抛出异常
             
             # 解析响应数据
@@ -132,7 +142,7 @@ class ExternalAgentProcessor:
             if not isinstance(response_data, dict):
                 raise ValueError(f"外部API返回的数据格式不正确，期望是字典，实际是 {type(response_data)}")
             
-            info(f"外部API调用成功，响应数据: {response_data}")
+            info("外部API调用成功，响应数据: %s", truncate(response_data))
             return response_data
             
         except httpx.RequestError as e:
@@ -148,6 +158,65 @@ class ExternalAgentProcessor:
             error(f"调用外部API时发生未知错误: {e}")
             raise Exception(f"未知错误: {str(e)}")
 
+    async def stream_agent_task(self, agent, execution_request: AgentExecutionRequest) -> AsyncIterator[Any]:
+        """
+        以流式方式执行外部智能体任务
+
+        外部API返回分块的流式响应（非JSON）时，每收到一块就原样产出，最后产出包含完整内容的结果；
+        返回普通JSON时直接产出解析后的结果
+
+        Args:
+            agent: 智能体对象
+            execution_request: 任务执行请求
+
+        Yields:
+            Any: 外部API返回的文本块（str），最后产出任务结果（dict）
+
+        Raises:
+            Exception: 调用外部API失败
+            DeadlineExceeded: 读取响应时超过请求截止时间
+        """
+        api_endpoint = self._get_api_endpoint_by_agent_name(agent.name)
+        request_data = {
+            "user_question": self._extract_user_question(execution_request)
+        }
+        info("流式调用外部API: %s, 请求数据: %s", api_endpoint, truncate(request_data))
+
+        try:
+            with stage_timer("external_api", agent=agent.name):
+                async with self.client.stream(
+                    "POST", api_endpoint, json=request_data, headers={"Accept": STREAM_ACCEPT},
+                    timeout=remaining_timeout(EXTERNAL_CALL_TIMEOUT)
+                ) as response:
+                    if response.is_error:
+                        await response.aread()
+                    response.raise_for_status()
+
+                    content_type = response.headers.get("content-type", "")
+                    if "json" in content_type and "ndjson" not in content_type:
+                        response_data = json.loads(await response.aread())
+                        if not isinstance(response_data, dict):
+                            raise ValueError(f"外部API返回的数据格式不正确，期望是字典，实际是 {type(response_data)}")
+                        yield response_data
+                        return
+
+                    parts = []
+                    async for text in response.aiter_text():
+                        check_deadline()
+                        if text:
+                            parts.append(text)
+                            yield text
+                    yield {"output": "".join(parts)}
+        except httpx.RequestError as e:
+            error(f"流式请求外部API时发生网络错误: {e}")
+            raise Exception(f"网络错误: {str(e)}")
+        except httpx.HTTPStatusError as e:
+            error(f"外部API返回错误状态码 {e.response.status_code}: {e.response.text}")
+            raise Exception(f"HTTP错误 {e.response.status_code}: {e.response.text}")
+        except json.JSONDecodeError as e:
+            error(f"解析外部API响应JSON时发生错误: {e}")
+            raise Exception(f"JSON解析错误: {str(e)}")
+
     def _get_api_endpoint_by_agent_name(self, agent_name: str) -> str:
         """
         根据智能体名称获取API端点URL
@@ -3,6 +3,9 @@
 from fastapi import APIRouter, HTTPException, Depends
 from schemas.agent import AgentCreate, AgentUpdate, AgentInDB, TaskRequest
 from core.registry_manager import agent_registry
+from core.utils.prompt_utils import reload_prompts
+from core.agent_handlers import agent_handlers
+from core.domain_agents import get_domain_agent_engine
 from agents.math_agent import register_math_agent
 from agents.poetry_agent import register_poetry_agent
 from typing import List
@@ -22,6 +25,13 @@ def register_default_agents():
     # 注册古诗智能体
     register_poetry_agent(agent_registry)
 
+# 注册默认智能体处理函数的函数
+def register_default_agent_handlers():
+    """
+    注册领域智能体定义文件中全部智能体的处理函数，系统启动时调用一次
+    """
+    get_domain_agent_engine().register_handlers(agent_handlers)
+
 @manager_router.get("/agents/", response_model=List[AgentInDB])
 async def list_agents():
     """
@@ -82,4 +92,24 @@ async def heartbeat(agent_id: str):
     success = agent_registry.update_heartbeat(agent_id, datetime.utcnow())
     if not success:
         raise HTTPException(status_code=404, detail="Agent not found")
-    return {"message": "Heartbeat updated"}
\ No newline at end of file
+    return {"message": "Heartbeat updated"}
+
+@manager_router.post("/prompts/reload")
+async def reload_prompt_files():
+    """
+    重新加载prompt目录下的全部提示词文件
+    """
+    return reload_prompts()
+
+@manager_router.post("/domain-agents/reload")
+async def reload_domain_agents():
+    """
+    重新加载领域智能体定义文件，并更新领域智能体的处理函数
+    """
+    engine = get_domain_agent_engine()
+    try:
+        result = engine.load()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    engine.register_handlers(agent_handlers)
+    return result
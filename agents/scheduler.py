@@ -1,249 +1,704 @@
 # -*- coding: utf-8 -*-
 
-import os
-from fastapi import APIRouter, HTTPException
-from schemas.agent import TaskRequest, TaskResponse
+import asyncio
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from schemas.agent import (
+    TaskRequest, TaskResponse, BatchTaskRequest, BatchTaskItem, BatchTaskResponse,
+    AgentExecutionRequest, AgentExecutionResponse
+)
+from agents.worker import run_agent_task
 from core.llm_client import LLMClient
-from core.utils.log_utils import info, error
+from core.utils.log_utils import debug, info, error
+from core.utils.stream_utils import STREAM_HEADERS, format_sse, wants_event_stream
+from core.utils.prompt_utils import PromptTemplate, get_prompt_template
+import time
 import uuid
-from typing import List
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from core.config import settings
 from core.registry_manager import agent_registry
-
-# 获取项目根目录
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+from core.capability_index import capability_index
+from core.session_store import session_store
+from core.metrics import stage_timer
+from core.llm_admission import AdmissionRejected, PRIORITY_BATCH, set_llm_priority, reset_llm_priority
+from core.deadline import DeadlineExceeded
+from core.llm_endpoints import set_llm_session
 
 scheduler_router = APIRouter()
 llm_client = LLMClient()
 
-# 存储对话历史的字典
-conversation_history = {}
 
-def read_prompt_template(template_name: str) -> str:
+# 各路由来源的累计次数，用于衡量能力索引和缓存替代了多少大模型调用
+routing_source_counts = Counter()
+
+def read_prompt_template(template_name: str) -> PromptTemplate:
     """
-    从文件中读取提示词模板
+    获取预编译的提示词模板
+    
+    模板在启动时已加载到内存，文件修改后自动重新加载
     
     Args:
         template_name: 模板文件名
         
     Returns:
-        str: 提示词模板内容
+        PromptTemplate: 提示词模板
         
     Raises:
-        Exception: 当文件不存在或读取失败时抛出异常
+        FileNotFoundError: 当文件不存在或内容为空时抛出异常
     """
-    template_path = os.path.join(PROJECT_ROOT, "prompt", template_name)
-    
+    template = get_prompt_template(template_name)
+    if template is None or template.is_empty:
+        raise FileNotFoundError(f"提示词模板文件不存在或为空: {template_name}")
+    return template
+
+# 生成引导性问题失败时使用的默认回复
+DEFAULT_GUIDANCE_TEXT = "请告诉我您需要哪个领域的专业帮助？例如：数学、古诗或生物等"
+
+
+def build_guidance_prompt(user_query: str, is_first_query: bool) -> str:
+    """
+    构建生成引导性问题的提示词
+
+    Args:
+        user_query: 用户查询
+        is_first_query: 是否为会话中的第一次查询
+
+    Returns:
+        str: 引导提示词
+    """
+    template_name = "guidance_first_query.txt" if is_first_query else "guidance_subsequent_query.txt"
+    query_desc = "第一次查询" if is_first_query else "非首次查询"
     try:
-        if not os.path.exists(template_path):
-            error(f"提示词模板文件不存在: {template_path}")
-            raise FileNotFoundError(f"提示词模板文件不存在: {template_path}")
+        # 获取内存中的提示词模板
+        guidance_prompt_template = read_prompt_template(template_name)
+        return guidance_prompt_template.format(user_query=user_query)
+    except Exception as e:
+        error(f"读取{query_desc}引导提示词模板失败，使用默认提示词: {str(e)}")
+        option_count = "2-3" if is_first_query else "3"
+        return f"""你是一个智能助手，需要根据用户的询问生成引导性问题。根据以下用户查询，生成合适的引导词并进行确认性询问：
+
+用户查询: "{user_query}"
+
+请分析用户可能的意图，并提供{option_count}个可能的选项供用户确认。按照以下格式回复：
+"根据您的询问，您可能是想了解以下内容：
+1. [数学相关问题]
+2. [古诗相关问题] 
+3. [生物相关问题]
+请问您是想了解上述哪个方面的问题呢？请明确告知您的需求。"
+"""
+
+
+async def generate_guidance(user_query: str, is_first_query: bool) -> str:
+    """
+    使用LLM生成引导性问题，失败时返回默认提示
+
+    Args:
+        user_query: 用户查询
+        is_first_query: 是否为会话中的第一次查询
+
+    Returns:
+        str: 引导性问题文本
+    """
+    guidance_prompt = build_guidance_prompt(user_query, is_first_query)
+    try:
+        from core.qwen_client import get_qwen_client
+        qwen_client = get_qwen_client()
         
-        with open(template_path, "r", encoding="utf-8") as f:
-            template_content = f.read()
-            info(f"成功读取提示词模板: {template_name}")
-            return template_content
+        with stage_timer("guidance", model=qwen_client.model_name):
+            guidance_response = await qwen_client.chat_completion(
+                messages=[
+                    {"role": "system", "content": "你是一个专业的智能助手，能够根据用户问题生成引导性问题和选项。"},
+                    {"role": "user", "content": guidance_prompt}
+                ],
+                temperature=0.3,
+                max_tokens=300
+            )
+        
+        return guidance_response.choices[0].message.content or DEFAULT_GUIDANCE_TEXT
+    except (AdmissionRejected, DeadlineExceeded):
+        # 准入控制拒绝和超过请求截止时间时交给接口返回503/504
+        raise
     except Exception as e:
-        error(f"读取提示词模板文件失败: {template_path}, 错误: {str(e)}")
+        # 如果生成引导性问题失败，则使用默认提示
+        error(f"生成引导性问题失败: {e}")
+        return DEFAULT_GUIDANCE_TEXT
+
+
+async def stream_guidance(user_query: str, is_first_query: bool) -> AsyncIterator[str]:
+    """
+    以流式方式生成引导性问题，模型每输出一段内容就返回一段
+
+    生成失败且尚未输出任何内容时返回默认提示，准入控制拒绝或超过请求截止时间时抛出异常
+
+    Args:
+        user_query: 用户查询
+        is_first_query: 是否为会话中的第一次查询
+
+    Yields:
+        str: 引导性问题的文本片段
+    """
+    guidance_prompt = build_guidance_prompt(user_query, is_first_query)
+    produced = False
+    try:
+        from core.qwen_client import get_qwen_client
+        qwen_client = get_qwen_client()
+        
+        with stage_timer("guidance_stream", model=qwen_client.model_name):
+            guidance_stream = qwen_client.stream_chat_completion(
+                messages=[
+                    {"role": "system", "content": "你是一个专业的智能助手，能够根据用户问题生成引导性问题和选项。"},
+                    {"role": "user", "content": guidance_prompt}
+                ],
+                temperature=0.3,
+                max_tokens=300
+            )
+            async for chunk in guidance_stream:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    produced = True
+                    yield content
+    except (AdmissionRejected, DeadlineExceeded):
         raise
+    except Exception as e:
+        error(f"流式生成引导性问题失败: {e}")
+    if not produced:
+        yield DEFAULT_GUIDANCE_TEXT
+
+
+class GuidanceStream:
+    """
+    在后台消费引导词流并缓冲输出
+
+    用于在意图识别进行的同时预先开始生成引导词，需要时再读取已缓冲的内容
+    """
+
+    def __init__(self, user_query: str, is_first_query: bool):
+        """
+        立即启动后台生成任务
+
+        Args:
+            user_query: 用户查询
+            is_first_query: 是否为会话中的第一次查询
+        """
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._error: Optional[Exception] = None
+        self._task = asyncio.create_task(self._produce(user_query, is_first_query))
+
+    async def _produce(self, user_query: str, is_first_query: bool):
+        """
+        将引导词片段写入缓冲队列，结束时写入None
+        """
+        try:
+            async for content in stream_guidance(user_query, is_first_query):
+                self._queue.put_nowait(content)
+        except (AdmissionRejected, DeadlineExceeded) as e:
+            # 留给读取方抛出
+            self._error = e
+        finally:
+            self._queue.put_nowait(None)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        """
+        依次读取已缓冲和后续生成的引导词片段
+        """
+        while True:
+            content = await self._queue.get()
+            if content is None:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield content
+
+    async def cancel(self):
+        """
+        取消后台生成任务
+        """
+        await _cancel_task(self._task)
+
+
+async def stream_query_events(task_id: str, session_id: str, query: str,
+                              is_first_query: bool) -> AsyncIterator[str]:
+    """
+    以SSE事件流的形式处理用户查询
+
+    引导词逐段以 token 事件发送，最后发送携带 task_id、session_id 和 target_agents 的 done 事件，
+    处理失败时发送 error 事件
+
+    Args:
+        task_id: 任务ID
+        session_id: 会话ID
+        query: 用户查询
+        is_first_query: 是否为会话中的第一次查询
+
+    Yields:
+        str: SSE事件文本
+    """
+    guidance_stream: Optional[GuidanceStream] = None
+    routing_source = None
+    try:
+        if not is_first_query:
+            # 预先启动引导词生成，与意图识别并发执行
+            if settings.SPECULATIVE_GUIDANCE:
+                guidance_stream = GuidanceStream(query, is_first_query=False)
+            
+            target_agents, routing_source = await route_query(query)
+            routing_source_counts[routing_source] += 1
+            with stage_timer("validate"):
+                validated_agents = validate_target_agents(target_agents)
+            info("验证智能体是否存在：%s,is_first_query:%s", validated_agents, is_first_query, sample_rate=settings.LOG_SAMPLE_RATE)
+            
+            if validated_agents:
+                if guidance_stream is not None:
+                    await guidance_stream.cancel()
+                session_store.append(session_id, "system", "已识别到您的专业需求，正在为您匹配相关智能体")
+                yield format_sse("done", {
+                    "task_id": task_id,
+                    "session_id": session_id,
+                    "target_agents": validated_agents,
+                    "response": "已找到相关智能体",
+                    "routing_source": routing_source
+                })
+                return
+        
+        if guidance_stream is None:
+            guidance_stream = GuidanceStream(query, is_first_query)
+        
+        guidance_parts = []
+        try:
+            async for content in guidance_stream:
+                guidance_parts.append(content)
+                yield format_sse("token", {"content": content})
+        finally:
+            # 客户端中途断开时也保留已生成的内容
+            if guidance_parts:
+                session_store.append(session_id, "system", "".join(guidance_parts))
+        
+        yield format_sse("done", {
+            "task_id": task_id,
+            "session_id": session_id,
+            "target_agents": [],
+            "response": "".join(guidance_parts),
+            "routing_source": routing_source
+        })
+    except Exception as e:
+        error(f"流式处理查询时发生错误: {e}")
+        yield format_sse("error", {
+            "task_id": task_id,
+            "session_id": session_id,
+            "detail": f"处理查询时发生错误: {str(e)}"
+        })
+    finally:
+        if guidance_stream is not None:
+            await guidance_stream.cancel()
+
+
+async def route_query(query: str) -> Tuple[List[Dict[str, str]], str]:
+    """
+    确定查询的目标智能体
+
+    优先使用能力索引快速路由，查询明确指向单个智能体时跳过大模型
+
+    Args:
+        query: 用户查询
+
+    Returns:
+        Tuple[List[Dict[str, str]], str]: 智能体列表（{name, id}）和路由来源
+    """
+    if settings.FAST_ROUTE_ENABLED:
+        with stage_timer("fast_route"):
+            fast_route_agent = capability_index.route(
+                query,
+                settings.FAST_ROUTE_MIN_SCORE,
+                settings.FAST_ROUTE_MARGIN
+            )
+        if fast_route_agent:
+            info("能力索引快速路由命中: %s", fast_route_agent, sample_rate=settings.LOG_SAMPLE_RATE)
+            return [fast_route_agent], "capability_index"
+    
+    # 使用Qwen模型解析用户意图，缓存命中时同样计入该阶段
+    with stage_timer("intent", model=llm_client.model_name):
+        target_agents, routing_source = await llm_client.route_intent(query)
+    info("大模型返回的agents: %s", target_agents, sample_rate=settings.LOG_SAMPLE_RATE)
+    return target_agents, routing_source
+
+
+def validate_target_agents(target_agents: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    验证目标智能体是否存在且处于活动状态
+
+    Args:
+        target_agents: 意图识别得到的智能体列表
+
+    Returns:
+        List[Dict[str, str]]: 通过验证的智能体信息
+    """
+    all_agents = agent_registry.list_agents()
+    debug("注册表中共有 %d 个智能体", len(all_agents))
+    
+    validated_agents = []
+    for agent_info in target_agents:
+        agent_id: str = agent_info.get("id", "")
+        agent_name: str = agent_info.get("name", "")
+        if agent_id:
+            agent = agent_registry.get_agent(agent_id)
+            if not agent and agent_name:
+                # 如果通过ID没有找到agent，尝试通过名称查找
+                for a in all_agents:
+                    if a.name == agent_name:
+                        agent = a
+                        break
+            
+            if agent and agent.status.value == "active":
+                validated_agents.append({
+                    "id": agent.id,
+                    "name": agent.name,
+                    "description": agent.description,
+                    "source": agent.source.value  # 添加智能体来源信息
+                })
+    return validated_agents
+
+
+async def _cancel_task(task: Optional[asyncio.Task]):
+    """
+    取消尚未完成的任务并等待其结束
+    """
+    if task is None:
+        return
+    if task.done():
+        # 读取已结束任务的异常，避免未被读取的异常产生警告
+        if not task.cancelled():
+            task.exception()
+        return
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+
+
+def start_turn(task_id: str, task_request: TaskRequest) -> Tuple[str, bool]:
+    """
+    将用户查询写入对话历史，并让当前请求之后的大模型调用固定到该会话对应的模型副本
+
+    Args:
+        task_id: 任务ID
+        task_request: 任务请求
+
+    Returns:
+        Tuple[str, bool]: 会话ID，以及是否是该会话的第一次查询
+    """
+    # 获取或创建会话ID
+    # 如果用户没有提供session_id，则使用task_id作为临时session_id
+    # 这样可以确保在单次交互中保持一致性，但无法跨多次独立请求保持会话
+    info("session_id: %s", task_request.session_id, sample_rate=settings.LOG_SAMPLE_RATE)
+    session_id = task_request.session_id if task_request.session_id else task_id
+    set_llm_session(session_id)
+    
+    # 添加当前查询到对话历史，会话不存在时自动创建
+    with stage_timer("session"):
+        message_count = session_store.append(session_id, "user", task_request.query)
+    
+    # 检查是否是第一次查询
+    return session_id, message_count == 1
+
+
+async def answer_query(task_id: str, session_id: str, query: str, is_first_query: bool) -> TaskResponse:
+    """
+    为已写入对话历史的查询确定目标智能体或生成引导词
+
+    Args:
+        task_id: 任务ID
+        session_id: 会话ID
+        query: 用户查询
+        is_first_query: 是否是第一次查询
+
+    Returns:
+        TaskResponse: 任务响应
+    """
+    # 第一次查询强制返回引导性问题，意图识别结果不会被使用，因此直接跳过
+    if is_first_query:
+        guidance_text = await generate_guidance(query, is_first_query=True)
+        session_store.append(session_id, "system", guidance_text)
+        
+        # 第一次查询不返回任何智能体，但需要返回session_id供客户端后续使用
+        return TaskResponse(
+            task_id=task_id,
+            session_id=session_id,  # 返回session_id供客户端后续使用
+            target_agents=[],  # 第一次查询不返回任何智能体
+            response=guidance_text
+        )
+    
+    # 非第一次查询，预先启动引导词生成，与意图识别并发执行
+    guidance_task = None
+    if settings.SPECULATIVE_GUIDANCE:
+        guidance_task = asyncio.create_task(generate_guidance(query, is_first_query=False))
+    
+    try:
+        target_agents, routing_source = await route_query(query)
+        routing_source_counts[routing_source] += 1
+        
+        # 验证智能体是否存在
+        with stage_timer("validate"):
+            validated_agents = validate_target_agents(target_agents)
+        info("验证智能体是否存在：%s,is_first_query:%s", validated_agents, is_first_query, sample_rate=settings.LOG_SAMPLE_RATE)
+    except BaseException:
+        await _cancel_task(guidance_task)
+        raise
+    
+    # 如果找到匹配的智能体，取消引导词生成并添加系统回复到对话历史
+    if validated_agents:
+        await _cancel_task(guidance_task)
+        session_store.append(session_id, "system", "已识别到您的专业需求，正在为您匹配相关智能体")
+        return TaskResponse(
+            task_id=task_id,
+            session_id=session_id,  # 返回session_id供客户端后续使用
+            target_agents=validated_agents,
+            response="已找到相关智能体",
+            routing_source=routing_source
+        )
+    
+    # 如果没有找到明确的智能体需求，使用引导性问题
+    if guidance_task is not None:
+        guidance_text = await guidance_task
+    else:
+        guidance_text = await generate_guidance(query, is_first_query=False)
+    
+    session_store.append(session_id, "system", guidance_text)
+    
+    return TaskResponse(
+        task_id=task_id,
+        session_id=session_id,  # 返回session_id供客户端后续使用
+        target_agents=[],
+        response=guidance_text,
+        routing_source=routing_source
+    )
+
 
 @scheduler_router.post("/process_query", response_model=TaskResponse)
-async def process_user_query(task_request: TaskRequest):
+async def process_user_query(task_request: TaskRequest, request: Request):
     """
     处理用户查询，调度合适的智能体
     
     1. 维护对话历史
-    2. 解析用户意图，确定目标智能体
-    3. 验证目标智能体是否存在且处于活动状态
-    4. 第一次查询强制不返回智能体，返回引导词供用户确认
-    5. 后续查询按照正常逻辑推荐智能体
+    2. 第一次查询不做意图识别，直接返回引导词供用户确认
+    3. 后续查询解析用户意图，同时预先启动引导词生成
+    4. 验证目标智能体是否存在且处于活动状态
+    5. 找到智能体时取消引导词生成，否则返回引导词
     6. 返回任务响应
+    
+    请求头 Accept 为 text/event-stream 时以SSE事件流逐段返回引导词
     """
     task_id = str(uuid.uuid4())
     
     try:
-        # 获取或创建会话ID
-        # 如果用户没有提供session_id，则使用task_id作为临时session_id
-        # 这样可以确保在单次交互中保持一致性，但无法跨多次独立请求保持会话
-        info(f"session_id: {task_request.session_id}")
-        session_id = task_request.session_id if task_request.session_id else task_id
-        
-        # 更新对话历史
-        if session_id not in conversation_history:
-            conversation_history[session_id] = []
-        
-        # 添加当前查询到对话历史
-        conversation_history[session_id].append({
-            "role": "user",
-            "content": task_request.query
-        })
-        
-        # 检查是否是第一次查询
-        is_first_query = len(conversation_history[session_id]) == 1
-        # print(f"是否是第一次查询：{is_first_query},conversation_history{conversation_history}")
-        # 使用最后一次用户输入作为意图识别的上下文
-        last_user_input = task_request.query
-        
-        # 使用Qwen模型解析用户意图
-        target_agents = await llm_client.parse_intent(last_user_input)
-        info(f"大模型返回的agents: {target_agents}")
+        session_id, is_first_query = start_turn(task_id, task_request)
         
-        # 打印注册表中的所有agents信息
-        all_agents = agent_registry.list_agents()
-        info("注册表中的所有agents:")
-        for agent in all_agents:
-            info(f"  ID: {agent.id}, Name: {agent.name}, Description: {agent.description}")
+        if wants_event_stream(request.headers.get("accept", "")):
+            return StreamingResponse(
+                stream_query_events(task_id, session_id, task_request.query, is_first_query),
+                media_type="text/event-stream",
+                headers=STREAM_HEADERS
+            )
         
-        # 验证智能体是否存在
-        validated_agents = []
-        for agent_info in target_agents:
-            agent_id: str = agent_info.get("id", "")
-            agent_name: str = agent_info.get("name", "")
-            if agent_id:
-                # 延迟导入避免循环导入
-                agent = agent_registry.get_agent(agent_id)
-                if not agent and agent_name:
-                    # 如果通过ID没有找到agent，尝试通过名称查找
-                    all_agents = agent_registry.list_agents()
-                    for a in all_agents:
-                        if a.name == agent_name:
-                            agent = a
-                            break
-                
-                if agent and agent.status.value == "active":
-                    validated_agents.append({
-                        "id": agent.id,
-                        "name": agent.name,
-                        "description": agent.description,
-                        "source": agent.source.value  # 添加智能体来源信息
-                    })
-        info(f"验证智能体是否存在：{validated_agents},is_first_query:{is_first_query}")
-        # 如果是第一次查询，强制不返回智能体，而是生成引导性问题
-        if is_first_query:
-            # 使用LLM生成引导性问题
-            try:
-                # 从文件读取提示词模板
-                guidance_prompt_template = read_prompt_template("guidance_first_query.txt")
-                guidance_prompt = guidance_prompt_template.format(user_query=task_request.query)
-                info("成功加载第一次查询引导提示词模板")
-            except Exception as e:
-                error(f"读取第一次查询引导提示词模板失败，使用默认提示词: {str(e)}")
-                guidance_prompt = f"""你是一个智能助手，需要根据用户的询问生成引导性问题。根据以下用户查询，生成合适的引导词并进行确认性询问：
-
-用户查询: "{task_request.query}"
-
-请分析用户可能的意图，并提供2-3个可能的选项供用户确认。按照以下格式回复：
-"根据您的询问，您可能是想了解以下内容：
-1. [数学相关问题]
-2. [古诗相关问题] 
-3. [生物相关问题]
-请问您是想了解上述哪个方面的问题呢？请明确告知您的需求。"
-"""
+        return await answer_query(task_id, session_id, task_request.query, is_first_query)
+    except (HTTPException, AdmissionRejected, DeadlineExceeded):
+        # 重新抛出HTTP异常、准入控制拒绝和请求超时
+        raise
+    except Exception as e:
+        # 其他异常处理
+        raise HTTPException(
+            status_code=500,
+            detail=f"处理查询时发生错误: {str(e)}"
+        )
 
-            try:
-                from core.qwen_client import QwenClient
-                qwen_client = QwenClient()
-                
-                guidance_response = qwen_client.client.chat.completions.create(
-                    model=qwen_client.model_name,
-                    messages=[
-                        {"role": "system", "content": "你是一个专业的智能助手，能够根据用户问题生成引导性问题和选项。"},
-                        {"role": "user", "content": guidance_prompt}
-                    ],
-                    temperature=0.3,
-                    max_tokens=300
-                )
-                
-                guidance_text = guidance_response.choices[0].message.content
-            except Exception as e:
-                # 如果生成引导性问题失败，则使用默认提示
-                guidance_text = "请告诉我您需要哪个领域的专业帮助？例如：数学、古诗或生物等"
-            
-            conversation_history[session_id].append({
-                "role": "system",
-                "content": guidance_text
-            })
-            
-            # 第一次查询不返回任何智能体，但需要返回s   ession_id供客户端后续使用
-            return TaskResponse(
-                task_id=task_id,
-                session_id=session_id,  # 返回session_id供客户端后续使用
-                target_agents=[],  # 第一次查询不返回任何智能体
-                response=guidance_text
-            )
-        else:
-            # 不是第一次查询，按照正常逻辑处理
-            # 如果找到匹配的智能体，添加系统回复到对话历史
-            if validated_agents:
-                conversation_history[session_id].append({
-                    "role": "system",
-                    "content": "已识别到您的专业需求，正在为您匹配相关智能体"
-                })
-            
-            # 如果没有找到明确的智能体需求，生成引导性问题
-            if not validated_agents:
-                # 使用LLM生成引导性问题
+
+@scheduler_router.post("/process_query_batch", response_model=BatchTaskResponse)
+async def process_user_query_batch(batch_request: BatchTaskRequest):
+    """
+    批量处理用户查询
+
+    各查询与单条接口的处理逻辑相同，共享意图缓存、请求合并和提示词，
+    最多同时处理 BATCH_MAX_CONCURRENCY 条查询；同一会话的查询按请求顺序依次处理，
+    保证对话历史的顺序。单条查询失败不影响其他查询，结果按请求顺序返回。
+    批量查询的大模型调用以最低优先级排队，不会挤占交互请求
+    """
+    task_requests = batch_request.requests
+    if len(task_requests) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多处理 {settings.BATCH_MAX_ITEMS} 条查询"
+        )
+    
+    results: List[Optional[BatchTaskItem]] = [None] * len(task_requests)
+    semaphore = asyncio.Semaphore(max(1, settings.BATCH_MAX_CONCURRENCY))
+    
+    # 按会话分组，未提供会话ID的查询各自独立
+    groups: Dict[str, List[int]] = {}
+    for index, task_request in enumerate(task_requests):
+        group_key = task_request.session_id or f"\x00{index}"
+        groups.setdefault(group_key, []).append(index)
+    
+    async def process_group(indexes: List[int]):
+        for index in indexes:
+            task_request = task_requests[index]
+            async with semaphore:
+                task_id = str(uuid.uuid4())
                 try:
-                    # 从文件读取提示词模板
-                    guidance_prompt_template = read_prompt_template("guidance_subsequent_query.txt")
-                    guidance_prompt = guidance_prompt_template.format(user_query=task_request.query)
-                    info("成功加载非首次查询引导提示词模板")
+                    session_id, is_first_query = start_turn(task_id, task_request)
+                    response = await answer_query(task_id, session_id, task_request.query, is_first_query)
+                    results[index] = BatchTaskItem(index=index, result=response)
                 except Exception as e:
-                    error(f"读取非首次查询引导提示词模板失败，使用默认提示词: {str(e)}")
-                    guidance_prompt = f"""你是一个智能助手，需要根据用户的询问生成引导性问题。根据以下用户查询，生成合适的引导词并进行确认性询问：
+                    error(f"批量处理第 {index} 条查询时发生错误: {e}")
+                    results[index] = BatchTaskItem(index=index, error=f"处理查询时发生错误: {str(e)}")
+    
+    token = set_llm_priority(PRIORITY_BATCH)
+    try:
+        await asyncio.gather(*(process_group(indexes) for indexes in groups.values()))
+    finally:
+        reset_llm_priority(token)
+    
+    failed = sum(1 for item in results if item.error is not None)
+    return BatchTaskResponse(
+        results=results,
+        succeeded=len(results) - failed,
+        failed=failed
+    )
 
-用户查询: "{task_request.query}"
+async def _run_agent_safely(agent_id: str, execution_request: AgentExecutionRequest) -> AgentExecutionResponse:
+    """
+    执行单个智能体的任务，失败时返回状态为error的执行响应而不抛出异常
+    """
+    start_time = time.time()
+    try:
+        return await run_agent_task(agent_id, execution_request)
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        error(f"智能体 {agent_id} 执行任务失败: {detail}")
+        return AgentExecutionResponse(
+            task_id=execution_request.task_id,
+            agent_id=agent_id,
+            output_data={"error": detail},
+            execution_time=time.time() - start_time,
+            status="error"
+        )
 
-请分析用户可能的意图，并提供3个可能的选项供用户确认。按照以下格式回复：
-"根据您的询问，您可能是想了解以下内容：
-1. [数学相关问题]
-2. [古诗相关问题] 
-3. [生物相关问题]
-请问您是想了解上述哪个方面的问题呢？请明确告知您的需求。"
-"""
 
-                try:
-                    from core.qwen_client import QwenClient
-                    qwen_client = QwenClient()
-                    
-                    guidance_response = qwen_client.client.chat.completions.create(
-                        model=qwen_client.model_name,
-                        messages=[
-                            {"role": "system", "content": "你是一个专业的智能助手，能够根据用户问题生成引导性问题和选项。"},
-                            {"role": "user", "content": guidance_prompt}
-                        ],
-                        temperature=0.3,
-                        max_tokens=300
-                    )
-                    
-                    guidance_text = guidance_response.choices[0].message.content
-                except Exception as e:
-                    # 如果生成引导性问题失败，则使用默认提示
-                    guidance_text = "请告诉我您需要哪个领域的专业帮助？例如：数学、古诗或生物等"
-                
-                conversation_history[session_id].append({
-                    "role": "system",
-                    "content": guidance_text
-                })
-                
-                return TaskResponse(
-                    task_id=task_id,
-                    session_id=session_id,  # 返回session_id供客户端后续使用
-                    target_agents=[],
-                    response=guidance_text
-                )
-            
-            return TaskResponse(
-                task_id=task_id,
-                session_id=session_id,  # 返回session_id供客户端后续使用
-                target_agents=validated_agents,
-                response="已找到相关智能体"
-            )
-    except HTTPException:
-        # 重新抛出HTTP异常
-        raise
+async def stream_route_and_execute_events(task_id: str, session_id: str, task_request: TaskRequest,
+                                          is_first_query: bool) -> AsyncIterator[str]:
+    """
+    路由查询后并发执行全部目标智能体，以SSE事件流返回
+
+    先发送携带路由结果的 routed 事件，之后每个智能体完成时立即发送 agent_result 事件，
+    最后发送汇总全部结果的 done 事件；客户端断开时取消尚未完成的智能体任务
+
+    Args:
+        task_id: 任务ID
+        session_id: 会话ID
+        task_request: 任务请求
+        is_first_query: 是否为会话中的第一次查询
+
+    Yields:
+        str: SSE事件文本
+    """
+    pending: List[asyncio.Task] = []
+    try:
+        task_response = await answer_query(task_id, session_id, task_request.query, is_first_query)
+        yield format_sse("routed", task_response.model_dump())
+        
+        start_time = time.time()
+        execution_request = AgentExecutionRequest(
+            task_id=task_id,
+            input_data={"query": task_request.query, "context": task_request.context or {}},
+            metadata={"session_id": session_id}
+        )
+        # 同一智能体只执行一次
+        agent_ids = list(dict.fromkeys(agent["id"] for agent in task_response.target_agents))
+        pending = [
+            asyncio.create_task(_run_agent_safely(agent_id, execution_request))
+            for agent_id in agent_ids
+        ]
+        
+        results: Dict[str, Dict[str, Any]] = {}
+        for next_done in asyncio.as_completed(pending):
+            response = await next_done
+            results[response.agent_id] = response.model_dump()
+            yield format_sse("agent_result", results[response.agent_id])
+        
+        # 汇总结果按路由得到的智能体顺序排列
+        ordered_results = [results[agent_id] for agent_id in agent_ids]
+        failed = sum(1 for result in ordered_results if result["status"] != "success")
+        yield format_sse("done", {
+            "task_id": task_id,
+            "session_id": session_id,
+            "response": task_response.response,
+            "routing_source": task_response.routing_source,
+            "results": ordered_results,
+            "succeeded": len(ordered_results) - failed,
+            "failed": failed,
+            "execution_time": time.time() - start_time
+        })
+    except Exception as e:
+        error(f"路由并执行查询时发生错误: {e}")
+        yield format_sse("error", {
+            "task_id": task_id,
+            "session_id": session_id,
+            "detail": f"处理查询时发生错误: {str(e)}"
+        })
+    finally:
+        for task in pending:
+            await _cancel_task(task)
+
+
+@scheduler_router.post("/route_and_execute")
+async def route_and_execute(task_request: TaskRequest):
+    """
+    路由用户查询并在服务端并发执行全部目标智能体
+
+    路由逻辑与 process_query 相同，找到智能体后直接调用内部或外部智能体执行任务，
+    各智能体的执行结果完成即以SSE事件推送，最后推送汇总事件，省去客户端逐个调用执行接口的往返
+    """
+    task_id = str(uuid.uuid4())
+    try:
+        session_id, is_first_query = start_turn(task_id, task_request)
     except Exception as e:
-        # 其他异常处理
         raise HTTPException(
             status_code=500,
             detail=f"处理查询时发生错误: {str(e)}"
-        )
\ No newline at end of file
+        )
+    return StreamingResponse(
+        stream_route_and_execute_events(task_id, session_id, task_request, is_first_query),
+        media_type="text/event-stream",
+        headers=STREAM_HEADERS
+    )
+
+@scheduler_router.get("/stats")
+async def get_scheduler_stats():
+    """
+    获取调度器的缓存、索引、路由来源、请求合并、大模型副本、准入控制、调用结果缓存、异步任务、限流和会话统计信息
+    """
+    from core.completion_cache import completion_cache
+    from core.job_queue import job_queue
+    from core.qwen_client import get_qwen_client
+    from core.llm_admission import admission_stats
+    from core.rate_limit import rate_limit_stats
+    from core.intent_cache import intent_cache
+    from core.semantic_cache import semantic_intent_cache
+    from core.single_flight import intent_single_flight
+    from core.agent_vector_index import agent_vector_index
+    return {
+        "intent_cache": intent_cache.stats(),
+        "semantic_cache": semantic_intent_cache.stats(),
+        "capability_index": capability_index.stats(),
+        "agent_vector_index": agent_vector_index.stats(),
+        "routing_sources": dict(routing_source_counts),
+        "intent_single_flight": intent_single_flight.stats(),
+        "llm_endpoints": get_qwen_client().endpoints.stats(),
+        "llm_admission": admission_stats(),
+        "completion_cache": completion_cache.stats(),
+        "jobs": job_queue.stats(),
+        "rate_limits": rate_limit_stats(),
+        "sessions": session_store.stats()
+    }
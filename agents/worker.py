@@ -1,20 +1,35 @@
 # -*- coding: utf-8 -*-
 
-from fastapi import APIRouter, HTTPException
-from schemas.agent import AgentExecutionRequest, AgentExecutionResponse
+from contextlib import contextmanager
+from fastapi import APIRouter, HTTPException, Request, Response, WebSocket
+from fastapi.responses import StreamingResponse
+from schemas.agent import AgentExecutionRequest, AgentExecutionResponse, AgentInDB, JobState, JobStatus
 from core.llm_client import LLMClient
+from core.llm_admission import (
+    AdmissionRejected, PRIORITY_AGENT, current_llm_priority, set_llm_priority, reset_llm_priority
+)
+from core.llm_endpoints import set_llm_session, reset_llm_session
+from core.completion_cache import set_completion_cache, reset_completion_cache
+from core.config import settings
+from core.deadline import DeadlineExceeded, remaining
+from core.job_queue import JobQueueFull, job_queue
+from core.utils.log_utils import error
+from core.utils.stream_utils import NDJSON_MEDIA_TYPE, STREAM_HEADERS, format_stream_event, stream_format
+from typing import Any, AsyncIterator, Dict, Optional
+import asyncio
 import time
 
 worker_router = APIRouter()
 llm_client = LLMClient()
 
 
-@worker_router.post("/execute/{agent_id}", response_model=AgentExecutionResponse)
-async def execute_agent_task(agent_id: str, execution_request: AgentExecutionRequest):
+def _get_active_agent(agent_id: str) -> AgentInDB:
     """
-    执行指定智能体的任务
+    获取处于活动状态的智能体
+
+    Raises:
+        HTTPException: 智能体不存在或未处于活动状态
     """
-    # 检查智能体是否存在且活跃
     from core.registry_manager import agent_registry
     agent = agent_registry.get_agent(agent_id)
     if not agent:
@@ -22,29 +37,272 @@ async def execute_agent_task(agent_id: str, execution_request: AgentExecutionReq
     
     if agent.status.value != "active":
         raise HTTPException(status_code=400, detail="Agent is not active")
+    return agent
+
+
+# metadata.cache 接受的字符串取值
+_TRUE_STRINGS = ("true", "1", "yes", "on")
+_FALSE_STRINGS = ("false", "0", "no", "off")
+
+
+def parse_cache_flag(metadata: Optional[Dict[str, Any]]) -> Optional[bool]:
+    """
+    解析任务执行请求元数据中的 cache 选项
+
+    接受布尔值、0/1 以及 "true"/"false"、"1"/"0"、"yes"/"no"、"on"/"off"（不区分大小写）
+
+    Args:
+        metadata: 任务执行请求的元数据
+
+    Returns:
+        Optional[bool]: 是否使用大模型调用结果缓存，未指定或为null时返回None
+
+    Raises:
+        HTTPException: cache 的取值无法识别
+    """
+    value = (metadata or {}).get("cache")
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        normalized = value.strip().lower()
+        if normalized in _TRUE_STRINGS:
+            return True
+        if normalized in _FALSE_STRINGS:
+            return False
+    raise HTTPException(status_code=400, detail=f"Invalid metadata.cache value: {value!r}, expected a boolean")
+
+
+@contextmanager
+def agent_call_context(metadata: Optional[Dict[str, Any]]):
+    """
+    在智能体执行期间设置大模型调用的优先级、会话和结果缓存选项，结束后恢复
+
+    Args:
+        metadata: 任务执行请求的元数据
+    """
+    # 智能体执行的大模型调用排在路由和引导词之后，批量任务中保持批量优先级
+    priority_token = set_llm_priority(max(current_llm_priority(), PRIORITY_AGENT))
+    # 同一会话的大模型调用发往同一副本
+    metadata = metadata or {}
+    session_id = metadata.get("session_id")
+    session_token = set_llm_session(str(session_id)) if session_id else None
+    # 请求可以通过 metadata.cache 指定是否使用大模型调用结果缓存，未指定时由智能体决定
+    cache = parse_cache_flag(metadata)
+    cache_token = set_completion_cache(cache) if cache is not None else None
+    try:
+        yield
+    finally:
+        reset_llm_priority(priority_token)
+        if session_token is not None:
+            reset_llm_session(session_token)
+        if cache_token is not None:
+            reset_completion_cache(cache_token)
+
+
+async def run_agent_task(agent_id: str, execution_request: AgentExecutionRequest) -> AgentExecutionResponse:
+    """
+    执行指定智能体的任务，内部和外部智能体均可
+
+    Args:
+        agent_id: 智能体ID
+        execution_request: 任务执行请求
+
+    Returns:
+        AgentExecutionResponse: 任务执行响应
+
+    Raises:
+        HTTPException: 智能体不存在、未处于活动状态、元数据无效或任务执行失败
+        AdmissionRejected: 大模型调用被准入控制拒绝
+        DeadlineExceeded: 超过请求截止时间
+    """
+    # 检查智能体是否存在且活跃
+    agent = _get_active_agent(agent_id)
+    # 元数据无效时返回400，而不是当作执行失败
+    parse_cache_flag(execution_request.metadata)
     
     start_time = time.time()
     
     try:
-        # 检查是否为外部智能体，如果是则使用外部处理器
-        if agent.source.value == "external":
-            # 导入外部智能体处理器
-            from agents.external_agent_processor import execute_external_agent_task
-            response = await execute_external_agent_task(agent_registry, agent_id, execution_request)
-            return response
-        else:
-            # 执行内部智能体任务，这里调用LLM客户端处理
-            output_data = await llm_client.execute_task(agent_id, execution_request.input_data)
-            
-            execution_time = time.time() - start_time
-            
-            return AgentExecutionResponse(
-                task_id=execution_request.task_id,
-                agent_id=agent_id,
-                output_data=output_data,
-                execution_time=execution_time,
-                status="success"
-            )
+        with agent_call_context(execution_request.metadata):
+            # 检查是否为外部智能体，如果是则使用外部处理器
+            if agent.source.value == "external":
+                # 导入外部智能体处理器
+                from core.registry_manager import agent_registry
+                from agents.external_agent_processor import execute_external_agent_task
+                response = await execute_external_agent_task(agent_registry, agent_id, execution_request)
+                return response
+            else:
+                # 执行内部智能体任务，这里调用LLM客户端处理
+                output_data = await llm_client.execute_task(agent_id, execution_request.input_data)
+                
+                execution_time = time.time() - start_time
+                
+                return AgentExecutionResponse(
+                    task_id=execution_request.task_id,
+                    agent_id=agent_id,
+                    output_data=output_data,
+                    execution_time=execution_time,
+                    status="success"
+                )
+    except (AdmissionRejected, DeadlineExceeded):
+        raise
     except Exception as e:
         execution_time = time.time() - start_time
-        raise HTTPException(status_code=500, detail=f"Task execution failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Task execution failed: {str(e)}")
+
+
+async def stream_agent_task_events(agent: AgentInDB, execution_request: AgentExecutionRequest,
+                                   fmt: str) -> AsyncIterator[str]:
+    """
+    以流式方式执行智能体任务
+
+    内部智能体在模型生成内容时逐段发送 token 事件；外部API返回分块响应时每收到一块发送一个 token 事件。
+    最后发送与 AgentExecutionResponse 结构相同的 done 事件，包含完整结果、execution_time 和 status，
+    执行失败时 status 为 error，output_data 中为错误信息
+
+    Args:
+        agent: 智能体
+        execution_request: 任务执行请求
+        fmt: 流式响应格式，sse 或 ndjson
+
+    Yields:
+        str: 事件文本
+    """
+    start_time = time.time()
+    output_data: Dict[str, Any] = {}
+    status = "success"
+    try:
+        with agent_call_context(execution_request.metadata):
+            if agent.source.value == "external":
+                from core.registry_manager import agent_registry
+                from agents.external_agent_processor import get_external_agent_processor
+                stream = get_external_agent_processor(agent_registry).stream_agent_task(agent, execution_request)
+            else:
+                stream = llm_client.stream_task(agent.id, execution_request.input_data)
+            async for item in stream:
+                if isinstance(item, str):
+                    yield format_stream_event(fmt, "token", {"content": item})
+                else:
+                    output_data = item
+    except Exception as e:
+        error(f"流式执行智能体 {agent.id} 的任务失败: {e}")
+        status = "error"
+        output_data = {"error": str(e) if isinstance(e, (AdmissionRejected, DeadlineExceeded)) else f"Task execution failed: {str(e)}"}
+    yield format_stream_event(fmt, "done", AgentExecutionResponse(
+        task_id=execution_request.task_id,
+        agent_id=agent.id,
+        output_data=output_data,
+        execution_time=time.time() - start_time,
+        status=status
+    ).model_dump())
+
+
+@worker_router.post("/execute/{agent_id}", response_model=AgentExecutionResponse)
+async def execute_agent_task(agent_id: str, execution_request: AgentExecutionRequest, request: Request):
+    """
+    执行指定智能体的任务
+
+    请求头 Accept 为 text/event-stream 或 application/x-ndjson 时以流式响应逐段返回模型生成的内容，
+    最后返回包含执行时间和状态的汇总事件
+    """
+    fmt = stream_format(request.headers.get("accept", ""))
+    if fmt is not None:
+        agent = _get_active_agent(agent_id)
+        parse_cache_flag(execution_request.metadata)
+        return StreamingResponse(
+            stream_agent_task_events(agent, execution_request, fmt),
+            media_type="text/event-stream" if fmt == "sse" else NDJSON_MEDIA_TYPE,
+            headers=STREAM_HEADERS
+        )
+    return await run_agent_task(agent_id, execution_request)
+
+
+@worker_router.post("/jobs/{agent_id}", response_model=JobStatus, status_code=202)
+async def submit_agent_job(agent_id: str, execution_request: AgentExecutionRequest, response: Response):
+    """
+    提交异步任务，立即返回任务状态，由后台worker执行
+
+    同一 task_id 的任务在结果过期前重复提交时返回已有任务的状态（200），不会重复执行
+    """
+    agent = _get_active_agent(agent_id)
+    parse_cache_flag(execution_request.metadata)
+    try:
+        job, created = job_queue.submit(agent_id, agent.name, execution_request)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    if job.agent_id != agent_id:
+        raise HTTPException(status_code=409, detail="Task ID is already used by another agent")
+    if not created:
+        response.status_code = 200
+    return job.to_status()
+
+
+@worker_router.get("/jobs/{task_id}", response_model=JobStatus)
+async def get_agent_job(task_id: str, wait: float = 0):
+    """
+    查询异步任务的状态和结果
+
+    wait 大于0时为长轮询：任务未结束时最多等待 wait 秒（不超过 JOB_MAX_WAIT 和请求的剩余时间），
+    任务结束后立即返回
+    """
+    job = job_queue.get(task_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if wait > 0 and not job.done:
+        timeout = min(wait, settings.JOB_MAX_WAIT)
+        left = remaining()
+        if left is not None:
+            # 留出返回响应的时间，避免请求先超时
+            timeout = min(timeout, max(0.0, left - 1))
+        await job.wait(timeout)
+    return job.to_status()
+
+
+@worker_router.delete("/jobs/{task_id}", response_model=JobStatus)
+async def cancel_agent_job(task_id: str):
+    """
+    取消异步任务：排队中的任务不再执行，执行中的任务被中断；已结束的任务返回409
+    """
+    job = job_queue.get(task_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.done:
+        if job.state == JobState.CANCELLED:
+            return job.to_status()
+        raise HTTPException(status_code=409, detail=f"Job already {job.state.value}")
+    job_queue.cancel(task_id)
+    # 执行中的任务在下一次调度时才结束，稍等片刻以便返回取消后的状态
+    await job.wait(1)
+    return job.to_status()
+
+
+@worker_router.websocket("/jobs/{task_id}/ws")
+async def watch_agent_job(websocket: WebSocket, task_id: str):
+    """
+    通过WebSocket等待异步任务结束
+
+    连接后先发送一次当前状态，任务结束时发送最终状态并关闭连接；任务不存在时以1008关闭
+    """
+    await websocket.accept()
+    job = job_queue.get(task_id)
+    if job is None:
+        await websocket.close(code=1008, reason="Job not found")
+        return
+    if not job.done:
+        await websocket.send_json(job.to_status().model_dump(mode="json"))
+        waiter = asyncio.ensure_future(job.wait())
+        try:
+            while not waiter.done():
+                receiver = asyncio.ensure_future(websocket.receive())
+                await asyncio.wait({waiter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                if not receiver.done():
+                    receiver.cancel()
+                elif receiver.result()["type"] == "websocket.disconnect":
+                    # 客户端已断开，任务继续执行
+                    return
+        finally:
+            waiter.cancel()
+    await websocket.send_json(job.to_status().model_dump(mode="json"))
+    await websocket.close()
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+自适应并发上限模拟测试
+
+用本地模拟的大模型后端对比固定并发上限和自适应并发上限。模拟后端的处理能力（可同时处理的调用数）
+按阶段变化，同时处理的调用超过处理能力时延迟按比例增加，超过处理能力的 OVERLOAD_FACTOR 倍时直接返回错误。
+请求以固定速率到达，经过与服务相同的准入控制器后调用模拟后端，超过处理时限的请求被取消。
+最后检查调用构成变化（大部分调用换成耗时长得多的另一类调用、后端并未变慢）时自适应上限是否保持不变
+
+在项目根目录运行:
+    python -m benchmarks.adaptive_limit_sim
+    python -m benchmarks.adaptive_limit_sim --rate 400 --phase-seconds 10 --fixed-limit 16
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import List, Optional, Tuple
+
+from core.adaptive_limit import AdaptiveConcurrencyLimit
+from core.deadline import DeadlineExceeded, reset_deadline, set_deadline
+from core.llm_admission import AdmissionRejected, LLMAdmissionController
+
+# 同时处理的调用超过处理能力的多少倍时后端开始返回错误
+OVERLOAD_FACTOR = 2.0
+
+# 各阶段后端的处理能力，每个阶段持续 --phase-seconds 秒
+DEFAULT_CAPACITIES = (8, 32, 4, 16)
+
+
+class MockBackendOverloaded(Exception):
+    """模拟后端过载"""
+
+
+class MockBackend:
+    """
+    处理能力按阶段变化的模拟大模型后端
+    """
+
+    def __init__(self, capacities: Tuple[int, ...], phase_seconds: float, base_latency: float):
+        """
+        Args:
+            capacities: 各阶段的处理能力
+            phase_seconds: 每个阶段的持续时间（秒）
+            base_latency: 未过载时的调用延迟（秒）
+        """
+        self.capacities = capacities
+        self.phase_seconds = phase_seconds
+        self.base_latency = base_latency
+        self.in_flight = 0
+        self.start = time.monotonic()
+
+    def phase(self) -> int:
+        """
+        当前所处的阶段序号
+        """
+        index = int((time.monotonic() - self.start) / self.phase_seconds)
+        return min(index, len(self.capacities) - 1)
+
+    async def call(self):
+        """
+        模拟一次大模型调用
+        """
+        capacity = self.capacities[self.phase()]
+        self.in_flight += 1
+        try:
+            if self.in_flight > capacity * OVERLOAD_FACTOR:
+                await asyncio.sleep(self.base_latency * 0.2)
+                raise MockBackendOverloaded("backend overloaded")
+            slowdown = max(1.0, self.in_flight / capacity)
+            await asyncio.sleep(self.base_latency * slowdown * random.uniform(0.9, 1.1))
+        finally:
+            self.in_flight -= 1
+
+
+class PhaseStats:
+    """
+    单个阶段的请求结果统计
+    """
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.rejected = 0
+        self.expired = 0
+        self.limits: List[int] = []
+
+    @staticmethod
+    def _percentile(values: List[float], ratio: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+    def row(self, phase: int, capacity: int, seconds: float) -> str:
+        average_limit = sum(self.limits) / len(self.limits) if self.limits else 0.0
+        return (
+            f"{phase:>5} {capacity:>8} {len(self.latencies) / seconds:>9.1f} {self.errors:>7} "
+            f"{self.rejected:>8} {self.expired:>8} {self._percentile(self.latencies, 0.5) * 1000:>8.0f} "
+            f"{self._percentile(self.latencies, 0.99) * 1000:>8.0f} {average_limit:>6.1f}"
+        )
+
+
+async def run_simulation(controller: LLMAdmissionController, args: argparse.Namespace) -> List[PhaseStats]:
+    """
+    以固定速率发送请求直到所有阶段结束
+
+    Returns:
+        List[PhaseStats]: 各阶段的统计结果
+    """
+    backend = MockBackend(DEFAULT_CAPACITIES, args.phase_seconds, args.base_latency)
+    phases = [PhaseStats() for _ in DEFAULT_CAPACITIES]
+    total_seconds = args.phase_seconds * len(DEFAULT_CAPACITIES)
+    tasks: List[asyncio.Task] = []
+
+    async def request():
+        stats = phases[backend.phase()]
+        arrived = time.monotonic()
+        token = set_deadline(args.timeout)
+        try:
+            async with controller.slot():
+                await backend.call()
+            stats.latencies.append(time.monotonic() - arrived)
+        except AdmissionRejected:
+            stats.rejected += 1
+        except DeadlineExceeded:
+            stats.expired += 1
+        except MockBackendOverloaded:
+            stats.errors += 1
+        finally:
+            reset_deadline(token)
+
+    async def request_with_timeout():
+        stats = phases[backend.phase()]
+        try:
+            # 与服务中的请求截止时间中间件一样，超时后取消请求
+            await asyncio.wait_for(request(), args.timeout)
+        except asyncio.TimeoutError:
+            stats.expired += 1
+
+    async def sample_limit():
+        while True:
+            phases[backend.phase()].limits.append(controller.limit)
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.ensure_future(sample_limit())
+    interval = 1.0 / args.rate
+    next_arrival = time.monotonic()
+    while time.monotonic() - backend.start < total_seconds:
+        tasks.append(asyncio.ensure_future(request_with_timeout()))
+        next_arrival += interval
+        await asyncio.sleep(max(0.0, next_arrival - time.monotonic()))
+    await asyncio.gather(*tasks)
+    sampler.cancel()
+    return phases
+
+
+def print_report(name: str, phases: List[PhaseStats], phase_seconds: float):
+    print(f"\n== {name} ==")
+    print(f"{'phase':>5} {'capacity':>8} {'ok/s':>9} {'errors':>7} {'rejected':>8} {'expired':>8} "
+          f"{'p50(ms)':>8} {'p99(ms)':>8} {'limit':>6}")
+    for index, (stats, capacity) in enumerate(zip(phases, DEFAULT_CAPACITIES)):
+        print(stats.row(index, capacity, phase_seconds))
+    total_ok = sum(len(stats.latencies) for stats in phases)
+    total_errors = sum(stats.errors for stats in phases)
+    print(f"total ok: {total_ok}, backend errors: {total_errors}")
+
+
+async def main(args: argparse.Namespace):
+    random.seed(args.seed)
+    fixed = LLMAdmissionController("sim-fixed", args.fixed_limit, args.max_queue)
+    print_report(f"fixed limit {args.fixed_limit}", await run_simulation(fixed, args), args.phase_seconds)
+
+    random.seed(args.seed)
+    limiter = AdaptiveConcurrencyLimit(initial=args.fixed_limit, min_limit=2, max_limit=100)
+    adaptive = LLMAdmissionController("sim-adaptive", args.fixed_limit, args.max_queue, limiter)
+    print_report("adaptive limit", await run_simulation(adaptive, args), args.phase_seconds)
+    print(f"adaptive limiter: {limiter.stats()}")
+    run_mix_check(args)
+
+
+def run_mix_check(args: argparse.Namespace):
+    """
+    后端健康时调用构成从短调用变为以长调用为主，自适应上限不应下降
+    """
+    random.seed(args.seed)
+    limiter = AdaptiveConcurrencyLimit(initial=args.fixed_limit, min_limit=2, max_limit=100)
+    for _ in range(2000):
+        limiter.on_sample(random.uniform(0.85, 1.05), limiter.limit, False, 500)
+    before = limiter.stats()
+    for _ in range(4000):
+        if random.random() < 0.7:
+            limiter.on_sample(random.uniform(10.0, 14.0), limiter.limit, False, 1500)
+        else:
+            limiter.on_sample(random.uniform(0.85, 1.05), limiter.limit, False, 500)
+    after = limiter.stats()
+    print("\n== traffic mix shift (70% of calls 10-14s, backend healthy) ==")
+    print(f"limit {before['limit']} -> {after['limit']}, decreases {after['decreases'] - before['decreases']}, "
+          f"baselines {after['baselines']}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="固定并发上限与自适应并发上限的模拟对比")
+    parser.add_argument("--rate", type=float, default=300.0, help="每秒到达的请求数")
+    parser.add_argument("--phase-seconds", type=float, default=5.0, help="每个处理能力阶段的持续时间（秒）")
+    parser.add_argument("--base-latency", type=float, default=0.05, help="后端未过载时的调用延迟（秒）")
+    parser.add_argument("--timeout", type=float, default=2.0, help="请求处理时限（秒）")
+    parser.add_argument("--fixed-limit", type=int, default=32, help="固定并发上限，也是自适应上限的初始值")
+    parser.add_argument("--max-queue", type=int, default=256, help="准入等待队列长度")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
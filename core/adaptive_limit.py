@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+自适应并发上限模块
+
+按窗口统计大模型调用的延迟和错误率，延迟接近基线且并发已被用满时逐步调高上限（加性增加），
+延迟明显高于基线或错误率升高时按比例调低上限（乘性减少），使并发上限跟随后端的实际处理能力变化。
+不同类别的调用（如意图识别和领域智能体任务的 max_tokens 不同）耗时相差很大，每个类别单独统计窗口和基线，
+流量构成变化不会被误认为后端变慢
+"""
+import threading
+from typing import Any, Dict, Hashable, List, Optional
+
+
+class _CallClassWindow:
+    """
+    一个调用类别的延迟基线和当前窗口
+    """
+    __slots__ = ("baseline", "latencies", "errors", "max_in_flight")
+
+    def __init__(self):
+        self.baseline: float = 0.0
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.max_in_flight = 0
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    基于延迟的AIMD并发上限
+
+    每个调用类别每收集 window 个样本做一次调整：窗口内延迟中位数超过该类别基线的 tolerance 倍，
+    或错误率超过 max_error_rate 时，上限乘以 backoff；否则在窗口内的最大并发达到上限一半时加1。
+    基线取该类别各窗口延迟中位数的最小值，并每个窗口略微上浮，后端长期变慢后可以重新找到基线
+    """
+
+    # 基线每个窗口上浮的比例，约70个窗口翻倍
+    BASELINE_DRIFT = 0.01
+
+    # 最多单独统计的调用类别数，超出后的新类别合并统计
+    MAX_CALL_CLASSES = 64
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, window: int = 20,
+                 tolerance: float = 1.5, backoff: float = 0.8, max_error_rate: float = 0.1):
+        """
+        初始化自适应上限
+
+        Args:
+            initial: 初始上限
+            min_limit: 上限的最小值
+            max_limit: 上限的最大值
+            window: 每次调整所需的样本数
+            tolerance: 延迟中位数相对基线的容忍倍数
+            backoff: 调低上限时的乘数
+            max_error_rate: 窗口内允许的最大错误率
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial))
+        self.window = max(1, window)
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.max_error_rate = max_error_rate
+        self._classes: Dict[Optional[Hashable], _CallClassWindow] = {}
+        self.increases = 0
+        self.decreases = 0
+        self._lock = threading.Lock()
+
+    def on_sample(self, latency: float, in_flight: int, failed: bool, kind: Optional[Hashable] = None) -> int:
+        """
+        记录一次调用结果，该类别的窗口已满时调整上限
+
+        Args:
+            latency: 调用耗时（秒），不含排队时间
+            in_flight: 本次调用开始时正在进行的调用数（含本次）
+            failed: 调用是否失败
+            kind: 调用类别（如 max_tokens），同一类别的调用耗时相近
+
+        Returns:
+            int: 调整后的上限
+        """
+        with self._lock:
+            window = self._classes.get(kind)
+            if window is None:
+                if len(self._classes) >= self.MAX_CALL_CLASSES:
+                    kind = None
+                window = self._classes.setdefault(kind, _CallClassWindow())
+            if failed:
+                window.errors += 1
+            else:
+                window.latencies.append(latency)
+            window.max_in_flight = max(window.max_in_flight, in_flight)
+            if len(window.latencies) + window.errors >= self.window:
+                self._adjust(window)
+            return self.limit
+
+    def _adjust(self, window: _CallClassWindow):
+        """
+        按调用类别当前窗口的统计结果调整上限并开始新窗口，调用方需持有锁
+        """
+        total = len(window.latencies) + window.errors
+        error_rate = window.errors / total
+        median = sorted(window.latencies)[len(window.latencies) // 2] if window.latencies else 0.0
+        if median > 0:
+            if window.baseline <= 0:
+                window.baseline = median
+            else:
+                window.baseline = min(window.baseline * (1 + self.BASELINE_DRIFT), median)
+
+        if error_rate > self.max_error_rate or (window.baseline > 0 and median > window.baseline * self.tolerance):
+            limit = max(self.min_limit, int(self.limit * self.backoff))
+            if limit < self.limit:
+                self.decreases += 1
+            self.limit = limit
+        elif window.max_in_flight * 2 >= self.limit and self.limit < self.max_limit:
+            # 并发没有用到一半时延迟正常不能说明后端还有余量，不调高
+            self.limit += 1
+            self.increases += 1
+
+        window.latencies = []
+        window.errors = 0
+        window.max_in_flight = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取自适应上限统计信息
+
+        Returns:
+            Dict[str, Any]: 当前上限、上下限、各调用类别的延迟基线以及调高和调低次数
+        """
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "baselines": {
+                    str(kind): round(window.baseline, 4) for kind, window in self._classes.items()
+                },
+                "increases": self.increases,
+                "decreases": self.decreases
+            }
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+内部智能体处理函数注册表
+
+启动时各领域智能体模块把自己的处理函数按智能体ID注册到这里，执行任务时按ID直接取出处理函数，
+没有注册处理函数的内部智能体使用通用处理逻辑。新增领域智能体只需注册处理函数，不需要修改 LLMClient。
+支持流式输出的智能体还可以注册流式处理函数，供执行接口的流式模式使用
+"""
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+# 处理函数：接收任务输入数据，返回任务结果
+AgentHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+# 流式处理函数：接收任务输入数据，依次产出模型生成的文本片段（str），最后产出任务结果（dict）
+AgentStreamHandler = Callable[[Dict[str, Any]], AsyncIterator[Any]]
+
+
+class AgentHandlerRegistry:
+    """
+    智能体ID到处理函数的映射
+    """
+
+    def __init__(self):
+        """
+        初始化处理函数注册表
+        """
+        self._handlers: Dict[str, AgentHandler] = {}
+        self._stream_handlers: Dict[str, AgentStreamHandler] = {}
+
+    def register(self, agent_id: str, handler: AgentHandler, stream_handler: Optional[AgentStreamHandler] = None):
+        """
+        注册智能体的处理函数，已注册的处理函数会被替换
+
+        Args:
+            agent_id: 智能体ID
+            handler: 处理函数
+            stream_handler: 可选的流式处理函数
+        """
+        self._handlers[agent_id] = handler
+        if stream_handler is not None:
+            self._stream_handlers[agent_id] = stream_handler
+        else:
+            self._stream_handlers.pop(agent_id, None)
+
+    def unregister(self, agent_id: str):
+        """
+        移除智能体的处理函数和流式处理函数
+
+        Args:
+            agent_id: 智能体ID
+        """
+        self._handlers.pop(agent_id, None)
+        self._stream_handlers.pop(agent_id, None)
+
+    def get(self, agent_id: str) -> Optional[AgentHandler]:
+        """
+        获取智能体的处理函数
+
+        Args:
+            agent_id: 智能体ID
+
+        Returns:
+            Optional[AgentHandler]: 处理函数，未注册时返回None
+        """
+        return self._handlers.get(agent_id)
+
+    def get_stream(self, agent_id: str) -> Optional[AgentStreamHandler]:
+        """
+        获取智能体的流式处理函数
+
+        Args:
+            agent_id: 智能体ID
+
+        Returns:
+            Optional[AgentStreamHandler]: 流式处理函数，未注册时返回None
+        """
+        return self._stream_handlers.get(agent_id)
+
+    def __len__(self) -> int:
+        return len(self._handlers)
+
+
+# 全局处理函数注册表
+agent_handlers = AgentHandlerRegistry()
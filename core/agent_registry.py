@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from schemas.agent import AgentCreate, AgentUpdate, AgentInDB, AgentStatus
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 import uuid
 from datetime import datetime
 import hashlib
@@ -10,6 +10,32 @@ import hashlib
 class AgentRegistry:
     def __init__(self):
         self.agents: Dict[str, AgentInDB] = {}
+        # 注册表版本号，每次注册、更新、注销智能体时递增，供缓存判断是否失效
+        self.version: int = 0
+        # 注册表变化监听函数，参数为事件类型和智能体
+        self._listeners: List[Callable[[str, AgentInDB], None]] = []
+
+    def _bump_version(self):
+        """
+        递增注册表版本号
+        """
+        self.version += 1
+
+    def add_listener(self, listener: Callable[[str, AgentInDB], None]):
+        """
+        添加注册表变化监听函数
+
+        Args:
+            listener: 监听函数，事件类型为 registered/updated/unregistered
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, event: str, agent: AgentInDB):
+        """
+        通知所有监听函数
+        """
+        for listener in self._listeners:
+            listener(event, agent)
 
     def _generate_consistent_id(self, agent_name: str) -> str:
         """
@@ -49,6 +75,8 @@ class AgentRegistry:
             **agent_create.model_dump()
         )
         self.agents[agent_id] = agent_in_db
+        self._bump_version()
+        self._notify("registered", agent_in_db)
         return agent_in_db
 
     def get_agent(self, agent_id: str) -> Optional[AgentInDB]:
@@ -80,6 +108,8 @@ class AgentRegistry:
         for field, value in update_data.items():
             setattr(agent, field, value)
         
+        self._bump_version()
+        self._notify("updated", agent)
         return agent
 
     def unregister_agent(self, agent_id: str) -> bool:
@@ -87,7 +117,9 @@ class AgentRegistry:
         注销智能体
         """
         if agent_id in self.agents:
-            del self.agents[agent_id]
+            agent = self.agents.pop(agent_id)
+            self._bump_version()
+            self._notify("unregistered", agent)
             return True
         return False
 
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+智能体向量索引模块
+
+为每个活动智能体预先计算名称、描述和能力列表的哈希n-gram向量，按字段加权合成一行存入矩阵。
+意图识别前用一次矩阵乘法为全部智能体打分，只把得分最高的候选放入提示词，
+注册表较大时可以显著缩短意图识别提示词
+"""
+import threading
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from core.config import settings
+from core.utils.text_utils import extract_query_core
+from core.utils.vector_utils import hashed_ngram_vector
+from schemas.agent import AgentInDB, AgentStatus
+
+# 各字段向量合成时的权重，与能力倒排索引保持一致
+NAME_WEIGHT = 3.0
+CAPABILITY_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+# 矩阵容量不足时的最小扩容行数
+_MIN_CAPACITY = 64
+
+
+class AgentVectorIndex:
+    """
+    智能体向量矩阵
+
+    每个智能体占用矩阵的一行，注册表事件到来时只更新对应的行，删除后的空行留给后续注册的智能体复用
+    """
+
+    def __init__(self, dim: int):
+        """
+        初始化向量索引
+
+        Args:
+            dim: 向量维度
+        """
+        self.dim = dim
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        # 各行是否有智能体，打分时空行不参与排序
+        self._used = np.zeros(0, dtype=bool)
+        # 行号 -> 智能体ID，空行为None
+        self._row_ids: List[Any] = []
+        self._row_by_id: Dict[str, int] = {}
+        self._free_rows: List[int] = []
+        self._lock = threading.Lock()
+
+    def _agent_vector(self, agent: AgentInDB) -> np.ndarray:
+        """
+        按字段加权合成智能体向量，各字段与查询一样先提取核心内容
+        """
+        vector = NAME_WEIGHT * hashed_ngram_vector(extract_query_core(agent.name), self.dim)
+        vector += DESCRIPTION_WEIGHT * hashed_ngram_vector(extract_query_core(agent.description), self.dim)
+        if agent.capabilities:
+            capabilities = extract_query_core(" ".join(agent.capabilities))
+            vector += CAPABILITY_WEIGHT * hashed_ngram_vector(capabilities, self.dim)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def _allocate_row(self) -> int:
+        """
+        分配一个空行，矩阵已满时按倍数扩容，调用方需持有锁
+        """
+        if self._free_rows:
+            return self._free_rows.pop()
+        row = len(self._row_ids)
+        if row >= self._matrix.shape[0]:
+            capacity = max(_MIN_CAPACITY, self._matrix.shape[0] * 2)
+            matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+            matrix[:self._matrix.shape[0]] = self._matrix
+            self._matrix = matrix
+            used = np.zeros(capacity, dtype=bool)
+            used[:self._used.shape[0]] = self._used
+            self._used = used
+        self._row_ids.append(None)
+        return row
+
+    def _remove(self, agent_id: str):
+        """
+        释放智能体占用的行，调用方需持有锁
+        """
+        row = self._row_by_id.pop(agent_id, None)
+        if row is None:
+            return
+        self._matrix[row] = 0.0
+        self._used[row] = False
+        self._row_ids[row] = None
+        self._free_rows.append(row)
+
+    def add_agent(self, agent: AgentInDB):
+        """
+        加入或更新智能体，非活动状态的智能体从索引中移除
+
+        Args:
+            agent: 智能体对象
+        """
+        vector = self._agent_vector(agent) if agent.status == AgentStatus.ACTIVE else None
+        with self._lock:
+            if vector is None:
+                self._remove(agent.id)
+                return
+            row = self._row_by_id.get(agent.id)
+            if row is None:
+                row = self._allocate_row()
+                self._row_by_id[agent.id] = row
+                self._row_ids[row] = agent.id
+                self._used[row] = True
+            self._matrix[row] = vector
+
+    def remove_agent(self, agent_id: str):
+        """
+        从索引中移除智能体
+
+        Args:
+            agent_id: 智能体ID
+        """
+        with self._lock:
+            self._remove(agent_id)
+
+    def on_registry_event(self, event: str, agent: AgentInDB):
+        """
+        注册表事件监听函数
+
+        Args:
+            event: 事件类型，registered/updated/unregistered
+            agent: 发生变化的智能体
+        """
+        if event == "unregistered":
+            self.remove_agent(agent.id)
+        else:
+            self.add_agent(agent)
+
+    def __len__(self) -> int:
+        """
+        已索引的智能体数
+        """
+        return len(self._row_by_id)
+
+    def top_k(self, query: str, k: int, min_score: float) -> List[Tuple[str, float]]:
+        """
+        选出与查询最相近的k个智能体
+
+        Args:
+            query: 用户查询
+            k: 最多返回的智能体数
+            min_score: 余弦相似度下限，低于下限的智能体不返回
+
+        Returns:
+            List[Tuple[str, float]]: (智能体ID, 相似度)列表，按相似度从高到低排列
+        """
+        text = extract_query_core(query)
+        if not text or k <= 0:
+            return []
+        vector = hashed_ngram_vector(text, self.dim)
+        with self._lock:
+            row_count = len(self._row_ids)
+            if not self._row_by_id:
+                return []
+            # 空行的得分置为-inf，不会占用前k个位置
+            scores = np.where(self._used[:row_count], self._matrix[:row_count] @ vector, -np.inf)
+            row_ids = list(self._row_ids)
+        if k < row_count:
+            candidates = np.argpartition(-scores, k)[:k]
+        else:
+            candidates = np.arange(row_count)
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [
+            (row_ids[row], float(scores[row]))
+            for row in candidates
+            if scores[row] >= min_score
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取索引统计信息
+
+        Returns:
+            Dict[str, Any]: 已索引的智能体数和矩阵容量
+        """
+        with self._lock:
+            return {
+                "agents": len(self._row_by_id),
+                "capacity": self._matrix.shape[0],
+                "dim": self.dim
+            }
+
+
+# 全局智能体向量索引实例
+agent_vector_index = AgentVectorIndex(settings.AGENT_VECTOR_DIM)
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+智能体能力倒排索引模块
+
+对智能体名称、能力列表和描述建立倒排索引，中文按字符二元组切分。
+索引通过注册表事件增量维护，调度器可以据此在查询明确指向某个智能体时跳过大模型意图识别
+"""
+import math
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.utils.text_utils import extract_query_core, tokenize_terms
+from schemas.agent import AgentInDB, AgentStatus
+
+# 各字段命中时的权重，同一检索词在多个字段出现时取最大值
+NAME_WEIGHT = 3.0
+CAPABILITY_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+class CapabilityIndex:
+    """
+    智能体能力倒排索引
+
+    只索引处于活动状态的智能体，检索结果无需再做状态过滤
+    """
+
+    def __init__(self):
+        """
+        初始化倒排索引
+        """
+        # 检索词 -> {智能体ID: 权重}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        # 智能体ID -> {检索词: 权重}，用于增量删除
+        self._agent_terms: Dict[str, Dict[str, float]] = {}
+        self._agent_names: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _extract_terms(agent: AgentInDB) -> Dict[str, float]:
+        """
+        提取智能体的检索词及其权重，各字段与查询一样先提取核心内容，去除疑问词和语气词的位置不产生跨越的二元组
+        """
+        terms: Dict[str, float] = {}
+        fields = [(agent.name, NAME_WEIGHT), (agent.description, DESCRIPTION_WEIGHT)]
+        fields.extend((capability, CAPABILITY_WEIGHT) for capability in agent.capabilities)
+        for text, weight in fields:
+            for term in tokenize_terms(extract_query_core(text)):
+                if weight > terms.get(term, 0.0):
+                    terms[term] = weight
+        return terms
+
+    def add_agent(self, agent: AgentInDB):
+        """
+        将智能体加入索引，已存在时先移除旧的检索词
+
+        Args:
+            agent: 智能体对象
+        """
+        with self._lock:
+            self._remove(agent.id)
+            if agent.status != AgentStatus.ACTIVE:
+                return
+            terms = self._extract_terms(agent)
+            for term, weight in terms.items():
+                self._postings.setdefault(term, {})[agent.id] = weight
+            self._agent_terms[agent.id] = terms
+            self._agent_names[agent.id] = agent.name
+
+    def remove_agent(self, agent_id: str):
+        """
+        从索引中移除智能体
+
+        Args:
+            agent_id: 智能体ID
+        """
+        with self._lock:
+            self._remove(agent_id)
+
+    def _remove(self, agent_id: str):
+        """
+        移除智能体的全部检索词，调用方需持有锁
+        """
+        terms = self._agent_terms.pop(agent_id, None)
+        self._agent_names.pop(agent_id, None)
+        if not terms:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(agent_id, None)
+            if not postings:
+                del self._postings[term]
+
+    def on_registry_event(self, event: str, agent: AgentInDB):
+        """
+        注册表事件监听函数
+
+        Args:
+            event: 事件类型，registered/updated/unregistered
+            agent: 发生变化的智能体
+        """
+        if event == "unregistered":
+            self.remove_agent(agent.id)
+        else:
+            self.add_agent(agent)
+
+    def search(self, query: str) -> List[Tuple[str, float]]:
+        """
+        按TF-IDF思路为各智能体打分
+
+        查询中的每个不同检索词只计一次，得分为 idf * 字段权重 之和
+
+        Args:
+            query: 用户查询
+
+        Returns:
+            List[Tuple[str, float]]: (智能体ID, 得分)列表，按得分从高到低排列
+        """
+        query_terms = set(tokenize_terms(extract_query_core(query)))
+        scores: Dict[str, float] = {}
+        with self._lock:
+            agent_count = len(self._agent_terms)
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1.0 + agent_count / len(postings))
+                for agent_id, weight in postings.items():
+                    scores[agent_id] = scores.get(agent_id, 0.0) + idf * weight
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    def route(self, query: str, min_score: float, margin: float) -> Optional[Dict[str, str]]:
+        """
+        查询明确指向单个智能体时返回该智能体
+
+        Args:
+            query: 用户查询
+            min_score: 最高得分需达到的下限
+            margin: 最高得分与第二名得分之比需达到的倍数
+
+        Returns:
+            Optional[Dict[str, str]]: 与parse_intent结果格式相同的 {name, id}，没有明确胜出者时返回None
+        """
+        ranked = self.search(query)
+        if not ranked:
+            return None
+        best_id, best_score = ranked[0]
+        runner_up_score = ranked[1][1] if len(ranked) > 1 else 0.0
+        if best_score < min_score or best_score < runner_up_score * margin:
+            return None
+        name = self._agent_names.get(best_id)
+        if name is None:
+            return None
+        return {"name": name, "id": best_id}
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取索引统计信息
+
+        Returns:
+            Dict[str, Any]: 已索引的智能体数和检索词数
+        """
+        with self._lock:
+            return {
+                "agents": len(self._agent_terms),
+                "terms": len(self._postings)
+            }
+
+
+# 全局能力索引实例
+capability_index = CapabilityIndex()
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+大模型调用结果缓存模块
+
+内部工作智能体经常用相同的提示词和采样参数重复调用大模型（如同一道课本数学题），
+以 (模型, 消息, 采样参数) 的哈希为键缓存调用结果：内存中保留最近使用的条目，
+同时写入本地SQLite文件，服务重启后仍然有效。SQLite只在一个专用线程中访问，查询时等待结果，写入不等待
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from core.config import settings
+from core.metrics import metrics_registry
+from core.utils.prompt_utils import PROJECT_ROOT
+
+# 默认的缓存文件
+DEFAULT_COMPLETION_CACHE_PATH = os.path.join(PROJECT_ROOT, "cache", "completion_cache.db")
+
+# 不影响调用结果、不参与缓存键的参数
+NON_KEY_PARAMS = ("timeout", "stream", "extra_headers", "extra_query", "user")
+
+# 磁盘缓存超过容量时每次删除的最旧条目数
+DISK_PRUNE_BATCH = 100
+
+llm_completion_cache_lookups_total = metrics_registry.counter(
+    "llm_completion_cache_lookups_total", "大模型调用结果缓存的查询次数，result为memory_hit、disk_hit或miss", ("result",)
+)
+llm_completion_cache_bytes = metrics_registry.gauge(
+    "llm_completion_cache_bytes", "大模型调用结果缓存已保存的字节数", ("tier",)
+)
+
+_cache_override: "contextvars.ContextVar[Optional[bool]]" = contextvars.ContextVar(
+    "llm_completion_cache", default=None
+)
+
+
+def set_completion_cache(enabled: Optional[bool]) -> contextvars.Token:
+    """
+    设置当前上下文中的大模型调用是否使用结果缓存，覆盖各调用方的默认设置
+
+    Args:
+        enabled: 是否使用缓存，为None时使用调用方的默认设置
+
+    Returns:
+        contextvars.Token: 用于恢复上下文的令牌
+    """
+    return _cache_override.set(enabled)
+
+
+def reset_completion_cache(token: contextvars.Token):
+    """
+    恢复设置之前的上下文
+    """
+    _cache_override.reset(token)
+
+
+class CompletionCache:
+    """
+    内存LRU + SQLite两级的大模型调用结果缓存
+
+    内存层只在事件循环中访问；SQLite连接只在专用线程中创建和使用
+    """
+
+    def __init__(self, max_size: int, ttl: float, path: str, max_disk_bytes: int):
+        """
+        初始化调用结果缓存
+
+        Args:
+            max_size: 内存中最多保留的条目数，为0时不使用内存层
+            ttl: 缓存条目的存活时间（秒）
+            path: SQLite缓存文件路径
+            max_disk_bytes: 磁盘缓存的最大字节数，为0时不使用磁盘层
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        # 键 -> (过期时间, 序列化后的调用结果)，过期时间为墙上时间，与磁盘层一致
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_errors = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        if max_disk_bytes > 0:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="completion-cache")
+
+    @staticmethod
+    def make_key(params: Dict[str, Any]) -> str:
+        """
+        根据调用参数生成缓存键
+
+        Args:
+            params: chat.completions.create 的参数，包括模型、消息和采样参数
+
+        Returns:
+            str: 缓存键
+        """
+        payload = {name: value for name, value in params.items() if name not in NON_KEY_PARAMS}
+        serialized = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def _memory_get(self, key: str, now: float) -> Optional[bytes]:
+        """
+        查询内存层，过期条目直接删除
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[key]
+                self.memory_bytes -= len(entry[1])
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _memory_set(self, key: str, value: bytes, expires_at: float):
+        """
+        写入内存层，超过条目数上限时淘汰最久未使用的条目
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.memory_bytes -= len(previous[1])
+            self._entries[key] = (expires_at, value)
+            self.memory_bytes += len(value)
+            while len(self._entries) > self.max_size:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.memory_bytes -= len(evicted)
+        llm_completion_cache_bytes.set(self.memory_bytes, tier="memory")
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        在专用线程中打开SQLite文件，清理过期条目并统计已保存的字节数
+        """
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS completions_created_at ON completions (created_at)")
+            connection.execute("DELETE FROM completions WHERE expires_at <= ?", (time.time(),))
+            connection.commit()
+            self.disk_bytes = connection.execute(
+                "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM completions"
+            ).fetchone()[0]
+            llm_completion_cache_bytes.set(self.disk_bytes, tier="disk")
+            self._connection = connection
+        return self._connection
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, bytes]]:
+        """
+        查询磁盘层，在专用线程中执行
+        """
+        connection = self._connect()
+        row = connection.execute("SELECT expires_at, value FROM completions WHERE key = ?", (key,)).fetchone()
+        if row is None or row[0] <= now:
+            return None
+        return row[0], bytes(row[1])
+
+    def _disk_set(self, key: str, value: bytes, now: float, expires_at: float):
+        """
+        写入磁盘层，超过容量时删除最早写入的条目，在专用线程中执行
+        """
+        connection = self._connect()
+        row = connection.execute("SELECT LENGTH(value) FROM completions WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self.disk_bytes -= row[0]
+        connection.execute(
+            "INSERT OR REPLACE INTO completions (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, sqlite3.Binary(value), now, expires_at)
+        )
+        self.disk_bytes += len(value)
+        while self.disk_bytes > self.max_disk_bytes:
+            rows = connection.execute(
+                "SELECT key, LENGTH(value) FROM completions ORDER BY created_at LIMIT ?", (DISK_PRUNE_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            for old_key, size in rows:
+                connection.execute("DELETE FROM completions WHERE key = ?", (old_key,))
+                self.disk_bytes -= size
+                if self.disk_bytes <= self.max_disk_bytes:
+                    break
+        connection.commit()
+        llm_completion_cache_bytes.set(self.disk_bytes, tier="disk")
+
+    def _on_disk_write_done(self, future: Future):
+        """
+        磁盘写入结束后记录错误，写入失败只影响缓存，不影响调用
+        """
+        if not future.cancelled() and future.exception() is not None:
+            self.disk_errors += 1
+            from core.utils.log_utils import warning
+            warning("写入大模型调用结果缓存失败: %s", future.exception())
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """
+        依次查询内存层和磁盘层，磁盘层命中时放入内存层
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            Optional[bytes]: 序列化后的调用结果，未命中返回None
+        """
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            self.memory_hits += 1
+            llm_completion_cache_lookups_total.inc(result="memory_hit")
+            return value
+        if self._executor is not None:
+            try:
+                loop = asyncio.get_running_loop()
+                entry = await loop.run_in_executor(self._executor, self._disk_get, key, now)
+            except Exception as e:
+                self.disk_errors += 1
+                entry = None
+                from core.utils.log_utils import warning
+                warning("读取大模型调用结果缓存失败: %s", e)
+            if entry is not None:
+                expires_at, value = entry
+                self._memory_set(key, value, expires_at)
+                self.disk_hits += 1
+                llm_completion_cache_lookups_total.inc(result="disk_hit")
+                return value
+        self.misses += 1
+        llm_completion_cache_lookups_total.inc(result="miss")
+        return None
+
+    def set(self, key: str, value: bytes):
+        """
+        写入缓存，磁盘层在专用线程中异步写入，不等待写入完成
+
+        Args:
+            key: 缓存键
+            value: 序列化后的调用结果
+        """
+        now = time.time()
+        expires_at = now + self.ttl
+        self._memory_set(key, value, expires_at)
+        if self._executor is not None:
+            try:
+                future = self._executor.submit(self._disk_set, key, value, now, expires_at)
+            except RuntimeError:
+                # 已关闭
+                return
+            future.add_done_callback(self._on_disk_write_done)
+
+    def is_enabled(self, default: bool) -> bool:
+        """
+        判断当前上下文中的调用是否使用缓存
+
+        Args:
+            default: 调用方的默认设置
+
+        Returns:
+            bool: 请求通过 set_completion_cache 指定时以请求为准，否则使用调用方的默认设置
+        """
+        if not settings.COMPLETION_CACHE_ENABLED or (self.max_size <= 0 and self._executor is None):
+            return False
+        override = _cache_override.get()
+        return default if override is None else override
+
+    def _close_connection(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def close(self):
+        """
+        等待未完成的磁盘写入并关闭SQLite连接
+        """
+        if self._executor is not None:
+            executor = self._executor
+            self._executor = None
+            executor.submit(self._close_connection)
+            executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计信息
+
+        Returns:
+            Dict[str, Any]: 条目数、各层字节数、命中和未命中次数以及命中率
+        """
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "memory_bytes": self.memory_bytes,
+            "disk_bytes": self.disk_bytes,
+            "max_disk_bytes": self.max_disk_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "disk_errors": self.disk_errors,
+            "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+        }
+
+
+# 全局调用结果缓存实例
+completion_cache = CompletionCache(
+    settings.COMPLETION_CACHE_MAX_SIZE,
+    settings.COMPLETION_CACHE_TTL,
+    settings.COMPLETION_CACHE_PATH or DEFAULT_COMPLETION_CACHE_PATH,
+    settings.COMPLETION_CACHE_DISK_MAX_BYTES
+)
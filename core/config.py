@@ -15,7 +15,106 @@ class Settings(BaseModel):
     QWEN_API_KEY: str = os.getenv("LLM_API_KEY", "dummy-key")  # Qwen API可能不需要有效的API密钥
     QWEN_MODEL_NAME: str = os.getenv("LLM_MODEL", "qwen2.5-32b")
     QWEN_API_BASE: Optional[str] = os.getenv("LLM_API_BASE", "http://106.227.68.83:8000/v1")
+    # 同一模型的多个副本地址，逗号分隔，未配置时只使用 LLM_API_BASE
+    QWEN_API_BASES: List[str] = [
+        base.strip() for base in os.getenv("LLM_API_BASES", "").split(",") if base.strip()
+    ] or [QWEN_API_BASE]
+    # 多副本调度：无会话调用的选择方式（least_outstanding|ewma）、是否按会话固定副本
+    LLM_ROUTING_STRATEGY: str = os.getenv("LLM_ROUTING_STRATEGY", "least_outstanding").lower()
+    LLM_STICKY_SESSIONS: bool = os.getenv("LLM_STICKY_SESSIONS", "true").lower() == "true"
+    # 对冲请求：同类调用超过近期延迟的该分位数仍未返回时向另一个副本再发一次，为0时不发送；计算分位数所需的最少样本数
+    LLM_HEDGE_PERCENTILE: float = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+    LLM_HEDGE_MIN_SAMPLES: int = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    # 副本连续失败多少次后暂停使用，以及暂停的秒数
+    LLM_EJECT_FAILURES: int = int(os.getenv("LLM_EJECT_FAILURES", "3"))
+    LLM_EJECT_SECONDS: float = float(os.getenv("LLM_EJECT_SECONDS", "30"))
     EXTERNAL_API_URL: str = os.getenv("EXTERNAL_API_URL", "http://192.168.1.15:8000/api/v1")
+    # LLM连接池配置，进程内所有LLM调用共享同一个连接池
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    LLM_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+    # 意图识别结果缓存配置
+    INTENT_CACHE_MAX_SIZE: int = int(os.getenv("INTENT_CACHE_MAX_SIZE", "10000"))
+    INTENT_CACHE_TTL: float = float(os.getenv("INTENT_CACHE_TTL", "3600"))
+    # 大模型调用结果缓存：是否启用、内存中最多保留的条目数、存活时间（秒）、SQLite文件路径（未配置时使用 cache/completion_cache.db）和磁盘最大字节数（为0时只使用内存）
+    COMPLETION_CACHE_ENABLED: bool = os.getenv("COMPLETION_CACHE_ENABLED", "true").lower() == "true"
+    COMPLETION_CACHE_MAX_SIZE: int = int(os.getenv("COMPLETION_CACHE_MAX_SIZE", "1000"))
+    COMPLETION_CACHE_TTL: float = float(os.getenv("COMPLETION_CACHE_TTL", "604800"))
+    COMPLETION_CACHE_PATH: str = os.getenv("COMPLETION_CACHE_PATH", "")
+    COMPLETION_CACHE_DISK_MAX_BYTES: int = int(os.getenv("COMPLETION_CACHE_DISK_MAX_BYTES", "268435456"))
+    # 语义近似意图缓存配置
+    SEMANTIC_CACHE_MAX_SIZE: int = int(os.getenv("SEMANTIC_CACHE_MAX_SIZE", "2048"))
+    SEMANTIC_CACHE_DIM: int = int(os.getenv("SEMANTIC_CACHE_DIM", "1024"))
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8"))
+    SEMANTIC_CACHE_TTL: float = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+    # 能力索引快速路由配置，最高得分达到下限且领先第二名足够倍数时跳过大模型
+    FAST_ROUTE_ENABLED: bool = os.getenv("FAST_ROUTE_ENABLED", "true").lower() == "true"
+    FAST_ROUTE_MIN_SCORE: float = float(os.getenv("FAST_ROUTE_MIN_SCORE", "4.0"))
+    FAST_ROUTE_MARGIN: float = float(os.getenv("FAST_ROUTE_MARGIN", "2.0"))
+    # 非首次查询时是否与意图识别并发预先生成引导词，找到智能体后取消
+    SPECULATIVE_GUIDANCE: bool = os.getenv("SPECULATIVE_GUIDANCE", "true").lower() == "true"
+    # 会话存储配置
+    SESSION_TTL: float = float(os.getenv("SESSION_TTL", "1800"))
+    SESSION_MAX_SESSIONS: int = int(os.getenv("SESSION_MAX_SESSIONS", "100000"))
+    SESSION_MAX_TOTAL_CHARS: int = int(os.getenv("SESSION_MAX_TOTAL_CHARS", "50000000"))
+    SESSION_MAX_MESSAGES: int = int(os.getenv("SESSION_MAX_MESSAGES", "50"))
+    SESSION_LOCK_STRIPES: int = int(os.getenv("SESSION_LOCK_STRIPES", "64"))
+    # 提示词文件修改检查间隔（秒），间隔内直接使用内存中的提示词
+    PROMPT_RELOAD_CHECK_INTERVAL: float = float(os.getenv("PROMPT_RELOAD_CHECK_INTERVAL", "5"))
+    # 领域智能体定义文件，未配置时使用 agents/domain_agents.json
+    DOMAIN_AGENTS_FILE: str = os.getenv("DOMAIN_AGENTS_FILE", "")
+    # 批量查询接口单次请求的最多查询数和并发处理的查询数
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+    # 异步任务：执行任务的并发worker数、排队任务数上限、单个任务的执行时限（秒，为0时不限制）、
+    # 任务结果保留时间（秒）和保留数量，以及查询结果时最长的等待秒数
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_MAX_QUEUE: int = int(os.getenv("JOB_MAX_QUEUE", "1000"))
+    JOB_TIMEOUT: float = float(os.getenv("JOB_TIMEOUT", "600"))
+    JOB_RESULT_TTL: float = float(os.getenv("JOB_RESULT_TTL", "3600"))
+    JOB_MAX_RESULTS: int = int(os.getenv("JOB_MAX_RESULTS", "10000"))
+    JOB_MAX_WAIT: float = float(os.getenv("JOB_MAX_WAIT", "60"))
+    # 请求截止时间（秒）：未通过 X-Request-Timeout 请求头指定时使用默认值，为0时不限制；请求头指定的值不超过上限
+    REQUEST_TIMEOUT: float = float(os.getenv("REQUEST_TIMEOUT", "60"))
+    REQUEST_TIMEOUT_MAX: float = float(os.getenv("REQUEST_TIMEOUT_MAX", "300"))
+    # 单次大模型调用的默认超时时间（秒）
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "60"))
+    # 大模型调用准入控制：每个后端同时进行的最多调用数、等待队列长度和队列已满时建议客户端重试的等待秒数
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+    LLM_MAX_QUEUE: int = int(os.getenv("LLM_MAX_QUEUE", "256"))
+    LLM_RETRY_AFTER: float = float(os.getenv("LLM_RETRY_AFTER", "1"))
+    # 自适应并发上限：启用后以 LLM_MAX_CONCURRENCY 为初始值，在上下限之间按延迟和错误率调整
+    LLM_ADAPTIVE_LIMIT: bool = os.getenv("LLM_ADAPTIVE_LIMIT", "false").lower() == "true"
+    LLM_ADAPTIVE_MIN_LIMIT: int = int(os.getenv("LLM_ADAPTIVE_MIN_LIMIT", "2"))
+    LLM_ADAPTIVE_MAX_LIMIT: int = int(os.getenv("LLM_ADAPTIVE_MAX_LIMIT", "100"))
+    LLM_ADAPTIVE_WINDOW: int = int(os.getenv("LLM_ADAPTIVE_WINDOW", "20"))
+    LLM_ADAPTIVE_TOLERANCE: float = float(os.getenv("LLM_ADAPTIVE_TOLERANCE", "1.5"))
+    LLM_ADAPTIVE_BACKOFF: float = float(os.getenv("LLM_ADAPTIVE_BACKOFF", "0.8"))
+    LLM_ADAPTIVE_MAX_ERROR_RATE: float = float(os.getenv("LLM_ADAPTIVE_MAX_ERROR_RATE", "0.1"))
+    # 意图识别候选筛选：注册表中的智能体多于top_k个时只把最相近的top_k个放入提示词
+    INTENT_SHORTLIST_TOP_K: int = int(os.getenv("INTENT_SHORTLIST_TOP_K", "10"))
+    INTENT_SHORTLIST_MIN_SCORE: float = float(os.getenv("INTENT_SHORTLIST_MIN_SCORE", "0.15"))
+    AGENT_VECTOR_DIM: int = int(os.getenv("AGENT_VECTOR_DIM", "2048"))
+    # 按调用方的令牌桶限流：各组接口每秒补充的令牌数和突发上限，速率为0时该组不限流
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+    RATE_LIMIT_SCHEDULER_RATE: float = float(os.getenv("RATE_LIMIT_SCHEDULER_RATE", "10"))
+    RATE_LIMIT_SCHEDULER_BURST: float = float(os.getenv("RATE_LIMIT_SCHEDULER_BURST", "20"))
+    RATE_LIMIT_WORKER_RATE: float = float(os.getenv("RATE_LIMIT_WORKER_RATE", "20"))
+    RATE_LIMIT_WORKER_BURST: float = float(os.getenv("RATE_LIMIT_WORKER_BURST", "40"))
+    RATE_LIMIT_MANAGER_RATE: float = float(os.getenv("RATE_LIMIT_MANAGER_RATE", "5"))
+    RATE_LIMIT_MANAGER_BURST: float = float(os.getenv("RATE_LIMIT_MANAGER_BURST", "20"))
+    # 每组最多保存的调用方令牌桶数、是否信任 X-Forwarded-For 请求头中的客户端IP、Retry-After 的最大秒数
+    RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+    # 单独限流的 API Key，逗号分隔；未配置的 API Key 与其他请求一样按客户端IP限流
+    RATE_LIMIT_API_KEYS: str = os.getenv("RATE_LIMIT_API_KEYS", "")
+    RATE_LIMIT_TRUST_FORWARDED: bool = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+    RATE_LIMIT_MAX_RETRY_AFTER: float = float(os.getenv("RATE_LIMIT_MAX_RETRY_AFTER", "60"))
+    # 日志配置：输出格式（text|json）、待写入日志的队列长度、单个大对象参数的最大输出字符数
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text").lower()
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_MAX_PAYLOAD_CHARS: int = int(os.getenv("LOG_MAX_PAYLOAD_CHARS", "2000"))
+    # 每个请求都会输出的高频日志的采样比例
+    LOG_SAMPLE_RATE: float = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
     # QWEN_API_KEY: str = os.getenv("LLM_API_KEY", "")  # Qwen API可能不需要有效的API密钥
     # QWEN_MODEL_NAME: str = os.getenv("LLM_MODEL", "qwen-plus")
     # QWEN_API_BASE: Optional[str] = os.getenv("LLM_API_BASE", "https://dashscope.aliyuncs.com/compatible-mode/v1")
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+请求截止时间模块
+
+每个HTTP请求的截止时间保存在上下文变量中，请求处理过程中创建的任务会自动继承。
+调用大模型和外部接口时用剩余时间作为超时时间，请求超时后不再发起新的调用。
+上下文变量中保存的是可修改的截止时间对象，流式响应开始后延长截止时间，已创建的任务也能看到
+"""
+import contextvars
+import time
+from typing import Callable, Optional, Tuple
+
+
+class DeadlineExceeded(Exception):
+    """请求已超过截止时间"""
+
+
+class _Deadline:
+    """
+    截止时间（time.monotonic），同一请求中的任务共享同一个对象
+    """
+    __slots__ = ("at",)
+
+    def __init__(self, at: float):
+        self.at = at
+
+
+_deadline: "contextvars.ContextVar[Optional[_Deadline]]" = contextvars.ContextVar("request_deadline", default=None)
+
+
+def set_deadline(timeout: Optional[float]) -> contextvars.Token:
+    """
+    设置当前请求的截止时间
+
+    Args:
+        timeout: 从现在起允许的处理时间（秒），为None或不大于0时不设截止时间
+
+    Returns:
+        contextvars.Token: 用于恢复上下文的令牌
+    """
+    deadline = _Deadline(time.monotonic() + timeout) if timeout and timeout > 0 else None
+    return _deadline.set(deadline)
+
+
+def reset_deadline(token: contextvars.Token):
+    """
+    恢复设置截止时间之前的上下文
+    """
+    _deadline.reset(token)
+
+
+def extend_deadline(timeout: float):
+    """
+    把当前请求的截止时间推迟到从现在起 timeout 秒后，已创建的任务同样生效；
+    没有截止时间或原截止时间更晚时不变
+
+    Args:
+        timeout: 从现在起允许的处理时间（秒）
+    """
+    deadline = _deadline.get()
+    if deadline is not None:
+        deadline.at = max(deadline.at, time.monotonic() + timeout)
+
+
+def current_deadline() -> Optional[float]:
+    """
+    获取当前请求的截止时刻
+
+    Returns:
+        Optional[float]: 截止时刻（time.monotonic），没有截止时间时返回None
+    """
+    deadline = _deadline.get()
+    return None if deadline is None else deadline.at
+
+
+def shared_deadline(at: Optional[float]) -> Tuple[contextvars.Token, Callable[[Optional[float]], None]]:
+    """
+    在当前上下文中设置一个新的截止时间对象，供多个请求共享的调用在其中创建任务
+
+    Args:
+        at: 初始截止时刻（time.monotonic），为None时没有截止时间
+
+    Returns:
+        Tuple[contextvars.Token, Callable[[Optional[float]], None]]: 用于恢复上下文的令牌，
+        以及把截止时间推迟到给定时刻的函数（参数为None时不再有截止时间）
+    """
+    deadline = _Deadline(float("inf") if at is None else at)
+
+    def extend(later: Optional[float]):
+        deadline.at = max(deadline.at, float("inf") if later is None else later)
+
+    return _deadline.set(deadline), extend
+
+
+def remaining() -> Optional[float]:
+    """
+    获取当前请求的剩余时间
+
+    Returns:
+        Optional[float]: 剩余秒数，可能为负数；没有截止时间时返回None
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline.at - time.monotonic()
+
+
+def remaining_timeout(default: Optional[float] = None) -> Optional[float]:
+    """
+    计算下游调用的超时时间，取剩余时间和默认超时时间中较小的一个
+
+    Args:
+        default: 下游调用自身的默认超时时间（秒）
+
+    Returns:
+        Optional[float]: 超时时间，两者都不存在时返回None
+
+    Raises:
+        DeadlineExceeded: 请求已超过截止时间
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("请求已超过截止时间")
+    return left if default is None else min(left, default)
+
+
+def check_deadline():
+    """
+    检查当前请求是否已超过截止时间，供流式读取下游响应时逐段检查
+
+    Raises:
+        DeadlineExceeded: 请求已超过截止时间
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("请求已超过截止时间")
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+声明式领域智能体模块
+
+领域智能体（数学、古诗、生物学等）都是同一个流程：取系统提示词和用户提示词模板、调用大模型、
+把回答填入固定结构的结果。每个领域智能体的名称、提示词文件、内置默认提示词、采样参数和结果结构
+都写在定义文件（默认 agents/domain_agents.json）中，启动时加载一次并预编译模板，由同一个异步执行器运行。
+新增领域智能体或调整采样参数只需修改定义文件，不需要修改代码
+"""
+import hashlib
+import json
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from core.agent_handlers import AgentHandlerRegistry
+from core.config import settings
+from core.deadline import DeadlineExceeded
+from core.llm_admission import AdmissionRejected
+from core.utils.prompt_utils import PROJECT_ROOT, PromptTemplate, get_prompt_template
+
+# 默认的领域智能体定义文件
+DEFAULT_DOMAIN_AGENTS_FILE = os.path.join(PROJECT_ROOT, "agents", "domain_agents.json")
+
+# 结果结构中的字符串可以引用的参数
+OUTPUT_FIELDS = ("query", "answer", "error")
+
+
+class DomainAgentSpec(BaseModel):
+    """
+    领域智能体定义
+    """
+    name: str
+    system_prompt_file: Optional[str] = None
+    user_prompt_file: Optional[str] = None
+    # 提示词文件不存在或为空时使用的内置提示词，用户提示词模板可以引用 {query}
+    default_system_prompt: str = ""
+    default_user_prompt: str = "{query}"
+    temperature: float = 0.7
+    max_tokens: int = 1000
+    # 是否缓存大模型调用结果，相同的问题直接返回缓存的回答；请求元数据中的 cache 字段可以覆盖
+    cache: bool = True
+    # 结果结构，其中的字符串是模板，可以引用 {query}、{answer}、{error}
+    output: Dict[str, Any] = {"result": "{answer}"}
+    error_output: Dict[str, Any] = {"result": "处理问题时出错: {query}", "explanation": "错误信息: {error}"}
+
+
+def _compile_output(value: Any, name: str) -> Any:
+    """
+    把结果结构中的字符串预编译为模板，其余值原样保留
+    """
+    if isinstance(value, str):
+        template = PromptTemplate(name, value, 0.0)
+        if template.error:
+            raise ValueError(f"结果模板格式不正确: {value}, 错误: {template.error}")
+        return template
+    if isinstance(value, dict):
+        return {key: _compile_output(item, name) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_compile_output(item, name) for item in value]
+    return value
+
+
+def _render_output(value: Any, values: Dict[str, str]) -> Any:
+    """
+    按预编译的结果结构生成结果，每次生成新的容器，调用方可以放心修改
+    """
+    if isinstance(value, PromptTemplate):
+        return value.format(**values)
+    if isinstance(value, dict):
+        return {key: _render_output(item, values) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_render_output(item, values) for item in value]
+    return value
+
+
+class DomainAgent:
+    """
+    加载并预编译后的领域智能体
+    """
+
+    def __init__(self, spec: DomainAgentSpec):
+        """
+        预编译提示词模板和结果结构
+
+        Args:
+            spec: 领域智能体定义
+
+        Raises:
+            ValueError: 模板格式不正确或引用了不支持的参数
+        """
+        self.spec = spec
+        self.name = spec.name
+        self.agent_id = hashlib.md5(spec.name.encode('utf-8')).hexdigest()
+        self.default_user_template = PromptTemplate(spec.name, spec.default_user_prompt, 0.0)
+        if self.default_user_template.error:
+            raise ValueError(f"默认用户提示词格式不正确: {self.default_user_template.error}")
+        self.output = _compile_output(spec.output, spec.name)
+        self.error_output = _compile_output(spec.error_output, spec.name)
+        # 加载时试生成一次，模板引用了不支持的参数时尽早报错
+        empty_values = {field: "" for field in OUTPUT_FIELDS}
+        try:
+            self.default_user_template.format(query="")
+            _render_output(self.output, empty_values)
+            _render_output(self.error_output, empty_values)
+        except (KeyError, IndexError, ValueError) as e:
+            raise ValueError(f"模板引用了不支持的参数: {e}")
+
+    def system_prompt(self) -> str:
+        """
+        获取系统提示词，提示词文件不存在或为空时使用内置提示词
+        """
+        if self.spec.system_prompt_file:
+            template = get_prompt_template(self.spec.system_prompt_file)
+            if template is not None and not template.is_empty:
+                return template.content
+        return self.spec.default_system_prompt
+
+    def user_prompt(self, query: str) -> str:
+        """
+        生成用户提示词，提示词文件不存在、为空或格式化失败时使用内置模板
+
+        Args:
+            query: 用户查询
+
+        Returns:
+            str: 用户提示词
+        """
+        template = None
+        if self.spec.user_prompt_file:
+            template = get_prompt_template(self.spec.user_prompt_file)
+        if template is not None and not template.is_empty:
+            try:
+                return template.format(query=query)
+            except Exception as e:
+                from core.utils.log_utils import error
+                error("格式化%s提示词时出错: %s, 模板文件: %s", self.name, e, self.spec.user_prompt_file)
+        return self.default_user_template.format(query=query)
+
+    def messages(self, query: str) -> List[Dict[str, str]]:
+        """
+        构建调用大模型的对话消息
+        """
+        return [
+            {"role": "system", "content": self.system_prompt()},
+            {"role": "user", "content": self.user_prompt(query)}
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取领域智能体的定义摘要
+        """
+        return {
+            "name": self.name,
+            "agent_id": self.agent_id,
+            "temperature": self.spec.temperature,
+            "max_tokens": self.spec.max_tokens,
+            "cache": self.spec.cache
+        }
+
+
+class DomainAgentEngine:
+    """
+    领域智能体执行器，所有领域智能体共用
+    """
+
+    def __init__(self, path: str):
+        """
+        加载领域智能体定义文件
+
+        Args:
+            path: 定义文件路径
+        """
+        self.path = path
+        # 智能体ID -> 领域智能体
+        self._agents: Dict[str, DomainAgent] = {}
+        # 已注册到处理函数注册表的智能体ID，重新加载时移除不再定义的智能体
+        self._registered: List[str] = []
+        try:
+            self.load()
+        except ValueError as e:
+            from core.utils.log_utils import error
+            error("加载领域智能体定义失败，领域智能体将使用通用处理逻辑: %s", e)
+
+    def load(self) -> Dict[str, Any]:
+        """
+        读取并预编译定义文件中的全部领域智能体，单个智能体定义有误时跳过该智能体
+
+        Returns:
+            Dict[str, Any]: 加载结果，包括已加载和定义有误的智能体
+
+        Raises:
+            ValueError: 定义文件不存在或不是JSON数组，此时保留原有的领域智能体
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                definitions = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"无法读取领域智能体定义文件 {self.path}: {e}")
+        if not isinstance(definitions, list):
+            raise ValueError(f"领域智能体定义文件 {self.path} 应为JSON数组")
+
+        from core.utils.log_utils import error, info
+        agents: Dict[str, DomainAgent] = {}
+        invalid = []
+        for index, definition in enumerate(definitions):
+            try:
+                agent = DomainAgent(DomainAgentSpec(**definition))
+            except Exception as e:
+                name = definition.get("name", index) if isinstance(definition, dict) else index
+                error("领域智能体定义有误，已跳过: %s, 错误: %s", name, e)
+                invalid.append(str(name))
+                continue
+            agents[agent.agent_id] = agent
+        self._agents = agents
+        info("已加载 %s 个领域智能体", len(agents))
+        return {
+            "loaded": [agent.name for agent in agents.values()],
+            "invalid": invalid
+        }
+
+    def get(self, agent_id: str) -> Optional[DomainAgent]:
+        """
+        按智能体ID获取领域智能体
+        """
+        return self._agents.get(agent_id)
+
+    def get_by_name(self, name: str) -> Optional[DomainAgent]:
+        """
+        按智能体名称获取领域智能体
+        """
+        return self._agents.get(hashlib.md5(name.encode('utf-8')).hexdigest())
+
+    def register_handlers(self, handlers: AgentHandlerRegistry):
+        """
+        把全部领域智能体的处理函数注册到处理函数注册表，并移除已不在定义文件中的智能体
+
+        Args:
+            handlers: 处理函数注册表
+        """
+        for agent_id in self._registered:
+            if agent_id not in self._agents:
+                handlers.unregister(agent_id)
+        for agent in self._agents.values():
+            handlers.register(agent.agent_id, self._make_handler(agent.agent_id),
+                              self._make_stream_handler(agent.agent_id))
+        self._registered = list(self._agents)
+
+    def _make_handler(self, agent_id: str):
+        """
+        生成按智能体ID执行的处理函数，执行时取最新加载的定义
+        """
+        async def handler(input_data: Dict[str, Any]) -> Dict[str, Any]:
+            agent = self._agents.get(agent_id)
+            if agent is None:
+                from core.qwen_client import get_qwen_client
+                return await get_qwen_client().execute_generic_task(agent_id, input_data)
+            return await self.execute(agent, input_data)
+        return handler
+
+    def _make_stream_handler(self, agent_id: str):
+        """
+        生成按智能体ID执行的流式处理函数，执行时取最新加载的定义
+        """
+        async def stream_handler(input_data: Dict[str, Any]) -> AsyncIterator[Any]:
+            agent = self._agents.get(agent_id)
+            if agent is None:
+                from core.qwen_client import get_qwen_client
+                stream = get_qwen_client().stream_generic_task(agent_id, input_data)
+            else:
+                stream = self.stream(agent, input_data)
+            async for item in stream:
+                yield item
+        return stream_handler
+
+    async def execute(self, agent: DomainAgent, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        执行领域智能体任务：生成提示词、调用大模型并按结果结构生成结果
+
+        Args:
+            agent: 领域智能体
+            input_data: 输入数据，包含查询和其他相关信息
+
+        Returns:
+            Dict[str, Any]: 任务执行结果，出错时返回按出错结果结构生成的结果
+        """
+        from core.qwen_client import get_qwen_client
+
+        query = input_data.get("query", "")
+        try:
+            response = await get_qwen_client().chat_completion(
+                messages=agent.messages(query),
+                temperature=agent.spec.temperature,
+                max_tokens=agent.spec.max_tokens,
+                cache=agent.spec.cache
+            )
+            answer = response.choices[0].message.content
+            if not answer:
+                answer = "无法生成解答"
+            return _render_output(agent.output, {"query": query, "answer": answer, "error": ""})
+        except (AdmissionRejected, DeadlineExceeded):
+            # 准入控制拒绝和超过请求截止时间时交给接口返回503/504
+            raise
+        except Exception as e:
+            from core.utils.log_utils import error
+            error("执行%s任务时出错: %s", agent.name, e)
+            return _render_output(agent.error_output, {"query": query, "answer": "", "error": str(e)})
+
+    async def stream(self, agent: DomainAgent, input_data: Dict[str, Any]) -> AsyncIterator[Any]:
+        """
+        以流式方式执行领域智能体任务，模型每输出一段内容就产出一段，结束后按结果结构产出完整结果
+
+        Args:
+            agent: 领域智能体
+            input_data: 输入数据，包含查询和其他相关信息
+
+        Yields:
+            Any: 模型生成的文本片段（str），最后产出与 execute 相同结构的任务结果（dict）
+        """
+        from core.qwen_client import get_qwen_client
+
+        query = input_data.get("query", "")
+        parts: List[str] = []
+        try:
+            async for chunk in get_qwen_client().stream_chat_completion(
+                messages=agent.messages(query),
+                temperature=agent.spec.temperature,
+                max_tokens=agent.spec.max_tokens,
+                cache=agent.spec.cache
+            ):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        except (AdmissionRejected, DeadlineExceeded):
+            # 准入控制拒绝和超过请求截止时间时交给接口处理
+            raise
+        except Exception as e:
+            from core.utils.log_utils import error
+            error("流式执行%s任务时出错: %s", agent.name, e)
+            yield _render_output(agent.error_output, {"query": query, "answer": "".join(parts), "error": str(e)})
+            return
+        answer = "".join(parts) or "无法生成解答"
+        yield _render_output(agent.output, {"query": query, "answer": answer, "error": ""})
+
+    async def execute_by_name(self, name: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        按智能体名称执行领域智能体任务，定义文件中没有该智能体时使用通用处理逻辑
+
+        Args:
+            name: 智能体名称
+            input_data: 输入数据
+
+        Returns:
+            Dict[str, Any]: 任务执行结果
+        """
+        agent = self.get_by_name(name)
+        if agent is None:
+            from core.qwen_client import get_qwen_client
+            agent_id = hashlib.md5(name.encode('utf-8')).hexdigest()
+            return await get_qwen_client().execute_generic_task(agent_id, input_data)
+        return await self.execute(agent, input_data)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        获取全部领域智能体的定义摘要
+        """
+        return [agent.stats() for agent in self._agents.values()]
+
+
+# 全局实例
+_domain_agent_engine: Optional[DomainAgentEngine] = None
+
+
+def get_domain_agent_engine() -> DomainAgentEngine:
+    """
+    获取领域智能体执行器实例（单例模式），首次调用时加载定义文件
+
+    Returns:
+        DomainAgentEngine: 进程内共享的领域智能体执行器
+    """
+    global _domain_agent_engine
+    if _domain_agent_engine is None:
+        _domain_agent_engine = DomainAgentEngine(settings.DOMAIN_AGENTS_FILE or DEFAULT_DOMAIN_AGENTS_FILE)
+    return _domain_agent_engine
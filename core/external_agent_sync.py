@@ -4,7 +4,8 @@ import asyncio
 from typing import List, Dict, Any, Optional
 from core.agent_registry import AgentRegistry
 from schemas.agent import AgentCreate, AgentType, AgentSource
-from core.utils.log_utils import info, error, warning
+from core.utils.log_utils import debug, info, error, warning, truncate
+from core.metrics import stage_timer
 
 
 # 设置日志
@@ -101,7 +102,7 @@ class ExternalAgentSync:
             ValueError: 当输入数据格式不正确时抛出异常
         """
         # 验证输入数据类型
-        info(f"验证输入类型{agent_data}")
+        debug("验证输入类型%s", truncate(agent_data))
         if not isinstance(agent_data, dict):
             raise ValueError(f"期望agent_data为字典类型，但实际类型为: {type(agent_data)}")
         
@@ -140,6 +141,13 @@ class ExternalAgentSync:
         Returns:
             Dict[str, Any]: 同步结果统计信息
         """
+        with stage_timer("external_sync"):
+            return await self._sync_agents(overwrite)
+
+    async def _sync_agents(self, overwrite: bool) -> Dict[str, Any]:
+        """
+        执行外部智能体同步
+        """
         stats = {
             "total": 0,
             "registered": 0,
@@ -152,7 +160,7 @@ class ExternalAgentSync:
             # 从外部API获取智能体列表
             agents_data = await self.fetch_external_agents()
             stats["total"] = len(agents_data)
-            info(f"DDDDDD{agents_data}")
+            debug("外部智能体原始数据: %s", truncate(agents_data))
             # 验证数据格式
             if not isinstance(agents_data, list):
                 raise ValueError(f"期望agents_data为列表类型，但实际类型为: {type(agents_data)}")
@@ -170,13 +178,13 @@ class ExternalAgentSync:
                     
                     # 根据overwrite参数决定是否覆盖已存在的智能体
                     if agent_exists and not overwrite:
-                        info(f"智能体 {agent_create.name} 已存在，跳过注册")
+                        debug("智能体 %s 已存在，跳过注册", agent_create.name)
                         stats["skipped"] += 1
                         continue
                     
                     # 注册智能体
                     self.registry.register_agent(agent_create, agent_id)
-                    info(f"成功注册外部智能体: {agent_create.name}")
+                    info("成功注册外部智能体: %s", agent_create.name)
                     stats["registered"] += 1
                     
                 except Exception as e:
@@ -203,7 +211,7 @@ class ExternalAgentSync:
             # 确保关闭HTTP客户端
             await self.client.aclose()
             
-        info(f"外部智能体同步完成: {stats}")
+        info("外部智能体同步完成: %s", truncate(stats))
         return stats
 
     async def close(self):
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+意图识别结果缓存模块
+
+以归一化后的查询和注册表版本号为键缓存意图识别结果，
+注册表发生变化后旧版本的缓存条目自然失效
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import settings
+from core.utils.text_utils import normalize_query
+
+
+class IntentCache:
+    """
+    意图识别结果的LRU+TTL缓存
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        """
+        初始化意图缓存
+
+        Args:
+            max_size: 最大缓存条目数，为0时禁用缓存
+            ttl: 缓存条目的存活时间（秒）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, List[Dict[str, str]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, query: str, registry_version: int) -> Optional[List[Dict[str, str]]]:
+        """
+        查询缓存
+
+        Args:
+            query: 用户查询
+            registry_version: 当前注册表版本号
+
+        Returns:
+            Optional[List[Dict[str, str]]]: 命中时返回智能体列表的副本，未命中返回None
+        """
+        key = (normalize_query(query), registry_version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, agents = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return [dict(agent) for agent in agents]
+
+    def set(self, query: str, registry_version: int, agents: List[Dict[str, str]]):
+        """
+        写入缓存
+
+        Args:
+            query: 用户查询
+            registry_version: 得到该结果时的注册表版本号
+            agents: 意图识别得到的智能体列表
+        """
+        if self.max_size <= 0:
+            return
+        key = (normalize_query(query), registry_version)
+        value = (time.monotonic() + self.ttl, [dict(agent) for agent in agents])
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计信息
+
+        Returns:
+            Dict[str, Any]: 命中、未命中、淘汰等计数
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+
+# 全局意图缓存实例
+intent_cache = IntentCache(settings.INTENT_CACHE_MAX_SIZE, settings.INTENT_CACHE_TTL)
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""
+异步任务队列模块
+
+耗时较长的智能体任务可以提交为异步任务：任务放入进程内的队列，由固定数量的worker依次执行，
+结果按 task_id 保存一段时间，客户端轮询、长轮询或通过WebSocket等待结果，不需要一直占用HTTP连接。
+同一 task_id 的任务在结果过期前重复提交时直接返回已有任务，客户端重试不会重复执行
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.config import settings
+from core.deadline import reset_deadline, set_deadline
+from core.metrics import metrics_registry
+from schemas.agent import AgentExecutionRequest, AgentExecutionResponse, JobState, JobStatus
+
+# 执行任务的函数：接收智能体ID和任务执行请求，返回任务执行响应
+JobRunner = Callable[[str, AgentExecutionRequest], Awaitable[AgentExecutionResponse]]
+
+agent_job_queue_depth = metrics_registry.gauge(
+    "agent_job_queue_depth", "各智能体排队等待执行的异步任务数", ("agent",)
+)
+agent_jobs_running = metrics_registry.gauge(
+    "agent_jobs_running", "各智能体正在执行的异步任务数", ("agent",)
+)
+agent_job_wait_seconds = metrics_registry.histogram(
+    "agent_job_wait_seconds", "异步任务从提交到开始执行的等待时间", ("agent",)
+)
+agent_jobs_total = metrics_registry.counter(
+    "agent_jobs_total", "已结束的异步任务数，status为succeeded、failed或cancelled", ("agent", "status")
+)
+
+
+class JobQueueFull(Exception):
+    """异步任务队列已满"""
+
+
+class Job:
+    """
+    一个异步任务及其执行结果
+    """
+
+    def __init__(self, agent_id: str, agent_name: str, request: AgentExecutionRequest):
+        """
+        Args:
+            agent_id: 智能体ID
+            agent_name: 智能体名称，用于指标标签
+            request: 任务执行请求
+        """
+        self.task_id = request.task_id
+        self.agent_id = agent_id
+        self.agent_name = agent_name
+        self.request = request
+        self.state = JobState.QUEUED
+        self.submitted_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[AgentExecutionResponse] = None
+        self.error: Optional[str] = None
+        self.enqueued = time.monotonic()
+        # 结果过期的时刻，任务结束后设置
+        self.expires_at: Optional[float] = None
+        self._done = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        """
+        任务是否已结束（成功、失败或已取消）
+        """
+        return self._done.is_set()
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待任务结束
+
+        Args:
+            timeout: 最长等待秒数，为None时一直等待
+
+        Returns:
+            bool: 任务是否已结束
+        """
+        if not self.done:
+            try:
+                await asyncio.wait_for(self._done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.done
+
+    def to_status(self) -> JobStatus:
+        """
+        转换为接口返回的任务状态
+        """
+        return JobStatus(
+            task_id=self.task_id,
+            agent_id=self.agent_id,
+            status=self.state,
+            submitted_at=self.submitted_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            result=self.result,
+            error=self.error
+        )
+
+
+class JobQueue:
+    """
+    有界的异步任务队列、worker和按 task_id 保存的任务结果
+
+    只在事件循环中调用，不加锁
+    """
+
+    def __init__(self, workers: int, max_queue: int, timeout: float, result_ttl: float, max_results: int):
+        """
+        初始化任务队列
+
+        Args:
+            workers: 同时执行任务的worker数
+            max_queue: 队列长度上限，超出时拒绝提交
+            timeout: 单个任务的执行时限（秒），为0时不限制
+            result_ttl: 任务结束后结果的保留时间（秒）
+            max_results: 最多保留的已结束任务数，超出时删除最早结束的任务
+        """
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self.max_results = max(1, max_results)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._runner: Optional[JobRunner] = None
+        # task_id -> 排队中或执行中的任务
+        self._active: Dict[str, Job] = {}
+        # task_id -> 已结束的任务，按结束时间排列
+        self._finished: "OrderedDict[str, Job]" = OrderedDict()
+        # 智能体名称 -> 排队中的任务数
+        self._queued_by_agent: Dict[str, int] = {}
+        self.queued = 0
+        self.running = 0
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def start(self, runner: JobRunner):
+        """
+        启动worker，系统启动时调用
+
+        Args:
+            runner: 执行任务的函数
+        """
+        if self._worker_tasks:
+            return
+        self._runner = runner
+        # 排队期间取消的任务仍留在队列中直到被worker取出，按队列实际长度限制，反复提交和取消不会让队列无限增长
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker_tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """
+        停止worker并取消正在执行的任务，系统关闭时调用
+        """
+        for task in self._worker_tasks:
+            task.cancel()
+        if self._worker_tasks:
+            await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        for job in list(self._active.values()):
+            if job.state == JobState.QUEUED:
+                self._change_queued(job, -1)
+            self._finish(job, JobState.CANCELLED, error="服务已停止")
+
+    def _expire(self):
+        """
+        删除结果已过期的任务
+        """
+        now = time.monotonic()
+        while self._finished:
+            task_id, job = next(iter(self._finished.items()))
+            if job.expires_at > now:
+                break
+            del self._finished[task_id]
+
+    def get(self, task_id: str) -> Optional[Job]:
+        """
+        按 task_id 获取任务
+
+        Returns:
+            Optional[Job]: 任务，不存在或结果已过期时返回None
+        """
+        job = self._active.get(task_id)
+        if job is not None:
+            return job
+        self._expire()
+        return self._finished.get(task_id)
+
+    def submit(self, agent_id: str, agent_name: str, request: AgentExecutionRequest) -> Tuple[Job, bool]:
+        """
+        提交任务
+
+        Args:
+            agent_id: 智能体ID
+            agent_name: 智能体名称
+            request: 任务执行请求
+
+        Returns:
+            Tuple[Job, bool]: 任务，以及是否为新提交的任务（同一 task_id 的任务已存在时返回已有任务和False）
+
+        Raises:
+            JobQueueFull: 队列长度（包括排队期间已取消、尚未被worker取出的任务）已达上限
+            RuntimeError: 任务队列未启动
+        """
+        existing = self.get(request.task_id)
+        if existing is not None:
+            self.deduplicated += 1
+            return existing, False
+        if self._queue is None:
+            raise RuntimeError("异步任务队列未启动")
+        if self._queue.full():
+            self.rejected += 1
+            raise JobQueueFull(f"异步任务队列已满（{self.max_queue}），请稍后重试")
+
+        job = Job(agent_id, agent_name, request)
+        self._active[job.task_id] = job
+        self._queue.put_nowait(job)
+        self.submitted += 1
+        self._change_queued(job, 1)
+        return job, True
+
+    def cancel(self, task_id: str) -> Optional[Job]:
+        """
+        取消任务：排队中的任务不再执行，执行中的任务被中断，已结束的任务不受影响
+
+        Returns:
+            Optional[Job]: 任务，不存在或结果已过期时返回None
+        """
+        job = self.get(task_id)
+        if job is None or job.done:
+            return job
+        if job.state == JobState.QUEUED:
+            # 仍留在队列中，worker取出后直接跳过
+            self._change_queued(job, -1)
+            self._finish(job, JobState.CANCELLED)
+        elif job._task is not None:
+            job._task.cancel()
+        return job
+
+    def _change_queued(self, job: Job, delta: int):
+        """
+        更新排队任务数和对应的指标
+        """
+        self.queued += delta
+        count = self._queued_by_agent.get(job.agent_name, 0) + delta
+        if count > 0:
+            self._queued_by_agent[job.agent_name] = count
+        else:
+            self._queued_by_agent.pop(job.agent_name, None)
+        agent_job_queue_depth.set(max(0, count), agent=job.agent_name)
+
+    def _finish(self, job: Job, state: JobState, result: Optional[AgentExecutionResponse] = None,
+                error: Optional[str] = None):
+        """
+        记录任务结果并通知等待方
+        """
+        job.state = state
+        job.result = result
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        job.expires_at = time.monotonic() + self.result_ttl
+        job._task = None
+        self._active.pop(job.task_id, None)
+        self._finished[job.task_id] = job
+        while len(self._finished) > self.max_results:
+            self._finished.popitem(last=False)
+        if state == JobState.SUCCEEDED:
+            self.succeeded += 1
+        elif state == JobState.FAILED:
+            self.failed += 1
+        else:
+            self.cancelled += 1
+        agent_jobs_total.inc(agent=job.agent_name, status=state.value)
+        job._done.set()
+
+    async def _work(self):
+        """
+        worker：依次取出排队的任务并执行
+        """
+        while True:
+            job = await self._queue.get()
+            if job.done:
+                # 排队期间已取消
+                continue
+            self._change_queued(job, -1)
+            await self._run(job)
+
+    async def _run(self, job: Job):
+        """
+        执行一个任务，超过执行时限或被取消时中断
+        """
+        job.state = JobState.RUNNING
+        job.started_at = datetime.utcnow()
+        agent_job_wait_seconds.observe(time.monotonic() - job.enqueued, agent=job.agent_name)
+        self.running += 1
+        agent_jobs_running.inc(agent=job.agent_name)
+        # 任务中的大模型和外部接口调用以执行时限的剩余时间作为超时时间
+        token = set_deadline(self.timeout)
+        try:
+            job._task = task = asyncio.ensure_future(self._runner(job.agent_id, job.request))
+        finally:
+            reset_deadline(token)
+        try:
+            done, _ = await asyncio.wait({task}, timeout=self.timeout if self.timeout > 0 else None)
+            if not done:
+                task.cancel()
+                await asyncio.wait({task})
+                self._finish(job, JobState.FAILED, error="任务执行超时")
+            elif task.cancelled():
+                self._finish(job, JobState.CANCELLED)
+            elif task.exception() is not None:
+                exc = task.exception()
+                self._finish(job, JobState.FAILED, error=str(getattr(exc, "detail", None) or exc))
+            else:
+                self._finish(job, JobState.SUCCEEDED, result=task.result())
+        except asyncio.CancelledError:
+            # worker被停止
+            task.cancel()
+            if not job.done:
+                self._finish(job, JobState.CANCELLED, error="服务已停止")
+            raise
+        finally:
+            self.running -= 1
+            agent_jobs_running.dec(agent=job.agent_name)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取任务队列统计信息
+
+        Returns:
+            Dict[str, Any]: worker数、排队和执行中的任务数、各智能体的排队任务数以及各状态的任务数
+        """
+        self._expire()
+        return {
+            "workers": self.workers,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "queued_by_agent": dict(self._queued_by_agent),
+            "running": self.running,
+            "stored_results": len(self._finished),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "rejected": self.rejected,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "cancelled": self.cancelled
+        }
+
+
+# 全局异步任务队列
+job_queue = JobQueue(
+    settings.JOB_WORKERS,
+    settings.JOB_MAX_QUEUE,
+    settings.JOB_TIMEOUT,
+    settings.JOB_RESULT_TTL,
+    settings.JOB_MAX_RESULTS
+)
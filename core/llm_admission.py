@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+大模型调用准入控制模块
+
+每个大模型后端同时进行的调用数有上限，超出上限的调用进入有界等待队列，
+按优先级（交互请求先于智能体执行，智能体执行先于批量任务）和截止时间从早到晚依次放行；
+队列已满时立即拒绝，由接口返回503和 Retry-After，避免过载时请求在服务内无限堆积。
+启用自适应并发上限时，并发上限根据调用延迟和错误率自动调整
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Hashable, List, Optional
+
+from core.adaptive_limit import AdaptiveConcurrencyLimit
+from core.config import settings
+from core.deadline import DeadlineExceeded, remaining
+from core.metrics import metrics_registry
+
+# 调用优先级，数值越小越先放行
+PRIORITY_INTERACTIVE = 0
+PRIORITY_AGENT = 1
+PRIORITY_BATCH = 2
+
+_PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_AGENT: "agent",
+    PRIORITY_BATCH: "batch"
+}
+
+llm_admission_queue_depth = metrics_registry.gauge(
+    "llm_admission_queue_depth", "等待调用大模型的请求数", ("backend",)
+)
+llm_admission_active = metrics_registry.gauge(
+    "llm_admission_active", "正在进行的大模型调用数", ("backend",)
+)
+llm_admission_limit = metrics_registry.gauge(
+    "llm_admission_limit", "大模型调用的当前并发上限", ("backend",)
+)
+llm_admission_wait_seconds = metrics_registry.histogram(
+    "llm_admission_wait_seconds", "大模型调用在准入队列中的等待时间（秒）", ("backend", "priority")
+)
+llm_admission_rejections_total = metrics_registry.counter(
+    "llm_admission_rejections_total", "被准入控制拒绝的大模型调用数", ("backend", "reason")
+)
+
+
+class AdmissionRejected(Exception):
+    """
+    大模型调用因等待队列已满被拒绝
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        """
+        Args:
+            message: 错误信息
+            retry_after: 建议客户端重试前等待的秒数
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+_priority: "contextvars.ContextVar[int]" = contextvars.ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+
+def set_llm_priority(priority: int) -> contextvars.Token:
+    """
+    设置当前上下文中大模型调用的优先级，之后创建的任务自动继承
+
+    Args:
+        priority: PRIORITY_INTERACTIVE、PRIORITY_AGENT 或 PRIORITY_BATCH
+
+    Returns:
+        contextvars.Token: 用于恢复上下文的令牌
+    """
+    return _priority.set(priority)
+
+
+def reset_llm_priority(token: contextvars.Token):
+    """
+    恢复设置优先级之前的上下文
+    """
+    _priority.reset(token)
+
+
+def current_llm_priority() -> int:
+    """
+    获取当前上下文中大模型调用的优先级
+    """
+    return _priority.get()
+
+
+class LLMAdmissionController:
+    """
+    单个大模型后端的并发上限和等待队列
+
+    等待队列是按 (优先级, 截止时间, 入队顺序) 排列的堆；调用结束时直接把名额交给队首的等待方。
+    已超过截止时间的等待方出队时直接失败，不占用名额；被取消的等待方留在堆中，出队时跳过
+    """
+
+    def __init__(self, backend: str, limit: int, max_queue: int,
+                 limiter: Optional[AdaptiveConcurrencyLimit] = None):
+        """
+        初始化准入控制器
+
+        Args:
+            backend: 后端名称，用作指标标签
+            limit: 同时进行的最多调用数，使用自适应上限时以自适应上限的初始值为准
+            max_queue: 等待队列的最大长度
+            limiter: 自适应并发上限，为None时使用固定上限
+        """
+        self.backend = backend
+        self.limiter = limiter
+        self.limit = limiter.limit if limiter is not None else max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.active = 0
+        # [优先级, 截止时间, 入队顺序, future]
+        self._heap: List[List[Any]] = []
+        self._queued = 0
+        self._sequence = itertools.count()
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self._update_gauges()
+
+    def _update_gauges(self):
+        llm_admission_queue_depth.set(self._queued, backend=self.backend)
+        llm_admission_active.set(self.active, backend=self.backend)
+        llm_admission_limit.set(self.limit, backend=self.backend)
+
+    def set_limit(self, limit: int):
+        """
+        修改并发上限，调高时立即放行等待方；调低时进行中的调用不受影响，结束后不再补位
+
+        Args:
+            limit: 新的并发上限
+        """
+        self.limit = max(1, limit)
+        self._wake()
+
+    def _wake(self):
+        """
+        在名额允许的范围内依次放行队首的等待方
+        """
+        now = time.monotonic()
+        while self._heap and self.active < self.limit:
+            _, deadline, _, future = heapq.heappop(self._heap)
+            if future.done():
+                continue
+            self._queued -= 1
+            if deadline < now:
+                self.expired += 1
+                llm_admission_rejections_total.inc(backend=self.backend, reason="deadline")
+                future.set_exception(DeadlineExceeded("请求已超过截止时间"))
+                continue
+            self.active += 1
+            future.set_result(None)
+        self._update_gauges()
+
+    async def acquire(self, priority: Optional[int] = None):
+        """
+        获取一个调用名额，名额已满时按优先级和截止时间排队等待
+
+        Args:
+            priority: 调用优先级，为None时使用当前上下文中的优先级
+
+        Raises:
+            AdmissionRejected: 等待队列已满
+            DeadlineExceeded: 请求在等待过程中超过了截止时间
+        """
+        if priority is None:
+            priority = current_llm_priority()
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded("请求已超过截止时间")
+        start = time.perf_counter()
+        if self.active < self.limit and not self._queued:
+            self.active += 1
+        else:
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                llm_admission_rejections_total.inc(backend=self.backend, reason="queue_full")
+                raise AdmissionRejected("大模型服务繁忙，请稍后重试", settings.LLM_RETRY_AFTER)
+            future = asyncio.get_event_loop().create_future()
+            deadline = time.monotonic() + left if left is not None else float("inf")
+            heapq.heappush(self._heap, [priority, deadline, next(self._sequence), future])
+            self._queued += 1
+            self._update_gauges()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    # 名额已经交给本调用，但调用方在恢复执行前被取消，归还名额
+                    self.release()
+                else:
+                    self._queued -= 1
+                    self._update_gauges()
+                raise
+        self.admitted += 1
+        self._update_gauges()
+        llm_admission_wait_seconds.observe(
+            time.perf_counter() - start, backend=self.backend, priority=_PRIORITY_NAMES.get(priority, str(priority))
+        )
+
+    def release(self):
+        """
+        归还调用名额并放行下一个等待方
+        """
+        self.active -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[int] = None, kind: Optional[Hashable] = None,
+                   sample: bool = True) -> AsyncIterator[None]:
+        """
+        在上下文中占用一个调用名额
+
+        Args:
+            priority: 调用优先级，为None时使用当前上下文中的优先级
+            kind: 调用类别，自适应上限按类别分别统计延迟基线
+            sample: 是否把调用耗时作为自适应上限的样本；流式调用的耗时包含调用方读取的时间，不作为样本
+
+        示例:
+            async with controller.slot():
+                response = await client.chat.completions.create(...)
+        """
+        await self.acquire(priority)
+        if self.limiter is None or not sample:
+            try:
+                yield
+            finally:
+                self.release()
+            return
+
+        in_flight = self.active
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except DeadlineExceeded:
+            # 请求已超时、未实际调用后端，不作为样本
+            in_flight = 0
+            raise
+        except Exception:
+            failed = True
+            raise
+        except BaseException:
+            # 调用方取消的调用不能反映后端状态，不作为样本
+            in_flight = 0
+            raise
+        finally:
+            if in_flight:
+                self.limit = self.limiter.on_sample(time.perf_counter() - start, in_flight, failed, kind)
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取准入控制统计信息
+
+        Returns:
+            Dict[str, Any]: 并发上限、进行中和排队中的调用数、放行、拒绝和等待超时次数以及自适应上限的统计信息
+        """
+        stats = {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self._queued,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "expired": self.expired
+        }
+        if self.limiter is not None:
+            stats["adaptive"] = self.limiter.stats()
+        return stats
+
+
+# 后端地址 -> 准入控制器
+_controllers: Dict[str, LLMAdmissionController] = {}
+
+
+def get_admission_controller(backend: str) -> LLMAdmissionController:
+    """
+    获取大模型后端的准入控制器，不存在时按配置创建
+
+    Args:
+        backend: 后端地址
+
+    Returns:
+        LLMAdmissionController: 该后端共享的准入控制器
+    """
+    controller = _controllers.get(backend)
+    if controller is None:
+        limiter = None
+        if settings.LLM_ADAPTIVE_LIMIT:
+            limiter = AdaptiveConcurrencyLimit(
+                initial=settings.LLM_MAX_CONCURRENCY,
+                min_limit=settings.LLM_ADAPTIVE_MIN_LIMIT,
+                max_limit=settings.LLM_ADAPTIVE_MAX_LIMIT,
+                window=settings.LLM_ADAPTIVE_WINDOW,
+                tolerance=settings.LLM_ADAPTIVE_TOLERANCE,
+                backoff=settings.LLM_ADAPTIVE_BACKOFF,
+                max_error_rate=settings.LLM_ADAPTIVE_MAX_ERROR_RATE
+            )
+        controller = LLMAdmissionController(
+            backend, settings.LLM_MAX_CONCURRENCY, settings.LLM_MAX_QUEUE, limiter
+        )
+        _controllers[backend] = controller
+    return controller
+
+
+def admission_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    获取全部后端的准入控制统计信息
+
+    Returns:
+        Dict[str, Dict[str, Any]]: 后端地址 -> 统计信息
+    """
+    return {backend: controller.stats() for backend, controller in _controllers.items()}
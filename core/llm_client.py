@@ -2,7 +2,9 @@
 
 from core.config import settings
 from core.utils.log_utils import info
-from typing import List, Dict, Any
+from core.metrics import stage_timer
+from core.agent_handlers import agent_handlers
+from typing import AsyncIterator, List, Dict, Any, Tuple
 import asyncio
 
 
@@ -17,59 +19,114 @@ class LLMClient:
         """
         解析用户意图并返回需要调用的智能体列表
         """
-        # 使用新的Qwen客户端
-        from core.qwen_client import QwenClient
-        qwen_client = QwenClient()
-        
-        # 调用Qwen客户端解析意图
-        agents = qwen_client.parse_intent(query)
-        info(f"本次推荐使用的智能体有########{agents}")
+        agents, _ = await self.route_intent(query)
         return agents
 
-    async def execute_task(self, agent_id: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def route_intent(self, query: str) -> Tuple[List[Dict[str, str]], str]:
         """
-        执行具体任务
+        解析用户意图，同时返回结果来源
+
+        依次查找精确匹配缓存和语义近似缓存，缓存均与注册表版本号绑定，注册表变化后自动失效
+
+        Returns:
+            Tuple[List[Dict[str, str]], str]: 智能体列表和来源（exact_cache|semantic_cache|llm）
         """
-        # 检查是否是数学智能体
-        try:
-            from core.registry_manager import agent_registry
-            agent = agent_registry.get_agent(agent_id)
-            
-            from agents.math_agent import MATH_AGENT_CONFIG, execute_math_task
-            if agent and MATH_AGENT_CONFIG["name"] == agent.name:
-                # 调用数学智能体的专用处理函数，该函数会使用Qwen大模型
-                return await execute_math_task(input_data)
-        except:
-            # 如果无法访问agent_registry，继续执行默认逻辑
-            pass
-            
-        # 检查是否是古诗智能体
-        try:
-            from core.registry_manager import agent_registry
-            agent = agent_registry.get_agent(agent_id)
-            
-            from agents.poetry_agent import POETRY_AGENT_CONFIG, execute_poetry_task
-            if agent and POETRY_AGENT_CONFIG["name"] == agent.name:
-                # 调用古诗智能体的专用处理函数，该函数会使用Qwen大模型
-                return await execute_poetry_task(input_data)
-        except:
-            # 如果无法访问agent_registry，继续执行默认逻辑
-            pass
-            
-        # 检查是否是生物学智能体
+        from core.registry_manager import agent_registry
+        from core.intent_cache import intent_cache
+        from core.semantic_cache import semantic_intent_cache
+        registry_version = agent_registry.version
+        cached_agents = intent_cache.get(query, registry_version)
+        if cached_agents is not None:
+            info("意图缓存命中，本次推荐使用的智能体有########%s", cached_agents, sample_rate=settings.LOG_SAMPLE_RATE)
+            return cached_agents, "exact_cache"
+
+        similar_agents = semantic_intent_cache.get(query, registry_version)
+        if similar_agents is not None:
+            info("语义缓存命中，本次推荐使用的智能体有########%s", similar_agents, sample_rate=settings.LOG_SAMPLE_RATE)
+            intent_cache.set(query, registry_version, similar_agents)
+            return similar_agents, "semantic_cache"
+
+        # 相同查询的并发请求合并为一次大模型调用，结果只在成功时写入缓存
+        from core.qwen_client import get_qwen_client
+        from core.single_flight import intent_single_flight
+        from core.utils.text_utils import normalize_query
+        from core.deadline import DeadlineExceeded
+        from core.llm_admission import AdmissionRejected, current_llm_priority
+        from core.llm_endpoints import set_llm_session
+
+        async def request_and_cache() -> List[Dict[str, str]]:
+            # 合并的调用属于多个会话，不固定到第一个调用方的副本
+            set_llm_session(None)
+            result = await get_qwen_client().request_intent(query)
+            if result:
+                intent_cache.set(query, registry_version, result)
+                semantic_intent_cache.set(query, registry_version, result)
+            return result
+
         try:
-            from core.registry_manager import agent_registry
-            agent = agent_registry.get_agent(agent_id)
-            
-            from agents.biology_agent import BIOLOGY_AGENT_CONFIG, execute_biology_task
-            if agent and BIOLOGY_AGENT_CONFIG["name"] == agent.name:
-                # 调用生物学智能体的专用处理函数，该函数会使用Qwen大模型
-                return await execute_biology_task(input_data)
-        except:
-            # 如果无法访问agent_registry，继续执行默认逻辑
-            pass
+            # 不同优先级的请求不合并，交互请求不会等待以批量优先级排队的调用
+            agents, shared = await intent_single_flight.do(
+                (normalize_query(query), registry_version, current_llm_priority()), request_and_cache
+            )
+        except (AdmissionRejected, DeadlineExceeded):
+            # 准入控制拒绝和超过请求截止时间时交给接口返回503/504
+            raise
+        except Exception as e:
+            # 出错时所有等待方都返回空列表，不写入缓存
+            from core.utils.log_utils import error
+            error(f"解析意图时出错: {e}")
+            return [], "llm"
+        agents = [dict(agent) for agent in agents]
+        if shared:
+            info("合并到进行中的意图识别请求，本次推荐使用的智能体有########%s", agents, sample_rate=settings.LOG_SAMPLE_RATE)
+        else:
+            info("本次推荐使用的智能体有########%s", agents, sample_rate=settings.LOG_SAMPLE_RATE)
+        return agents, "llm"
+
+    async def execute_task(self, agent_id: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        执行具体任务，按智能体记录执行耗时
+        """
+        from core.registry_manager import agent_registry
+        agent = agent_registry.get_agent(agent_id)
+        with stage_timer("agent_execute", agent=agent.name if agent else agent_id, model=self.model_name):
+            return await self._execute_task(agent_id, input_data)
+
+    async def _execute_task(self, agent_id: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        按智能体ID查找启动时注册的处理函数执行任务，未注册处理函数的智能体使用通用处理逻辑
+        """
+        handler = agent_handlers.get(agent_id)
+        if handler is not None:
+            return await handler(input_data)
         
         # 对于其他智能体，使用通用的Qwen客户端
-        from core.qwen_client import QwenClient
-        qwen_client = QwenClient()
-        return qwen_client.execute_generic_task(agent_id, input_data)
\ No newline at end of file
+        from core.qwen_client import get_qwen_client
+        qwen_client = get_qwen_client()
+        return await qwen_client.execute_generic_task(agent_id, input_data)
+
+    async def stream_task(self, agent_id: str, input_data: Dict[str, Any]) -> AsyncIterator[Any]:
+        """
+        以流式方式执行具体任务，按智能体记录执行耗时
+
+        注册了流式处理函数的智能体逐段产出模型生成的文本；只注册了普通处理函数的智能体直接产出任务结果；
+        其余智能体使用通用处理逻辑流式执行
+
+        Yields:
+            Any: 模型生成的文本片段（str），最后产出任务结果（dict）
+        """
+        from core.registry_manager import agent_registry
+        agent = agent_registry.get_agent(agent_id)
+        with stage_timer("agent_execute", agent=agent.name if agent else agent_id, model=self.model_name):
+            stream_handler = agent_handlers.get_stream(agent_id)
+            if stream_handler is not None:
+                stream = stream_handler(input_data)
+            else:
+                handler = agent_handlers.get(agent_id)
+                if handler is not None:
+                    yield await handler(input_data)
+                    return
+                from core.qwen_client import get_qwen_client
+                stream = get_qwen_client().stream_generic_task(agent_id, input_data)
+            async for item in stream:
+                yield item
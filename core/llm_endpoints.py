@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+大模型多副本负载均衡模块
+
+同一模型部署了多个副本（如多个vLLM实例）时，每次调用从健康的副本中选择一个：
+有会话的调用按会话ID做一致性哈希固定到同一副本，以复用副本上的前缀缓存；其余调用选择进行中的请求最少
+或按EWMA延迟估算最快的副本。连续失败的副本暂时剔除，一段时间后重新参与选择。
+非流式调用在超过近期延迟的指定分位数仍未返回时，可以向另一个副本发送一份相同的请求，取先返回的结果
+"""
+import asyncio
+import contextvars
+import hashlib
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Hashable, List, Optional, Sequence
+
+import openai
+
+from core.config import settings
+from core.llm_admission import LLMAdmissionController, get_admission_controller
+from core.metrics import metrics_registry
+
+# EWMA延迟的平滑系数，越大越偏向最近的调用
+EWMA_ALPHA = 0.3
+
+# 每类调用保留的近期延迟样本数，用于计算对冲请求的发送时机
+HEDGE_SAMPLE_SIZE = 200
+
+llm_endpoint_requests_total = metrics_registry.counter(
+    "llm_endpoint_requests_total", "各大模型副本的调用次数", ("backend", "outcome")
+)
+llm_endpoint_ejections_total = metrics_registry.counter(
+    "llm_endpoint_ejections_total", "大模型副本因连续失败被暂时剔除的次数", ("backend",)
+)
+llm_hedged_requests_total = metrics_registry.counter(
+    "llm_hedged_requests_total", "对冲请求的次数，outcome为sent（已发送）或won（先于原请求返回）", ("outcome",)
+)
+
+_session_key: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar("llm_session_key", default=None)
+
+
+def set_llm_session(session_id: Optional[str]) -> contextvars.Token:
+    """
+    设置当前上下文中大模型调用所属的会话，同一会话的调用尽量发往同一副本
+
+    Args:
+        session_id: 会话ID，为None时不固定副本
+
+    Returns:
+        contextvars.Token: 用于恢复上下文的令牌
+    """
+    return _session_key.set(session_id)
+
+
+def reset_llm_session(token: contextvars.Token):
+    """
+    恢复设置会话之前的上下文
+    """
+    _session_key.reset(token)
+
+
+def is_backend_failure(exc: BaseException) -> bool:
+    """
+    判断异常是否说明副本本身出了问题（连接失败、超时或5xx），请求参数错误等不计入
+    """
+    if isinstance(exc, openai.APIConnectionError):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code >= 500
+
+
+class LLMEndpoint:
+    """
+    单个大模型副本及其运行状态
+    """
+
+    def __init__(self, base_url: str, client: Any, admission: LLMAdmissionController):
+        """
+        Args:
+            base_url: 副本地址
+            client: 该副本的 AsyncOpenAI 客户端
+            admission: 该副本的准入控制器
+        """
+        self.base_url = base_url
+        self.client = client
+        self.admission = admission
+        self._hash_seed = base_url.encode("utf-8")
+        self.outstanding = 0
+        self.ewma_latency = 0.0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def is_available(self, now: float) -> bool:
+        """
+        副本是否未被剔除
+        """
+        return now >= self.ejected_until
+
+    def rendezvous_score(self, key: str) -> int:
+        """
+        会话在该副本上的一致性哈希得分，得分最高的副本负责该会话
+        """
+        digest = hashlib.md5(key.encode("utf-8") + b"\x00" + self._hash_seed).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    def load_score(self) -> float:
+        """
+        按EWMA延迟估算的排队完成时间，数值越小越优先
+        """
+        return (self.ewma_latency or 1.0) * (self.outstanding + 1)
+
+    def record(self, latency: float, failed: bool):
+        """
+        记录一次调用结果，连续失败达到阈值时剔除副本
+
+        Args:
+            latency: 调用耗时（秒）
+            failed: 是否因副本故障失败
+        """
+        self.requests += 1
+        if failed:
+            self.failures += 1
+            self.consecutive_failures += 1
+            llm_endpoint_requests_total.inc(backend=self.base_url, outcome="failure")
+            if self.consecutive_failures >= settings.LLM_EJECT_FAILURES:
+                self.ejected_until = time.monotonic() + settings.LLM_EJECT_SECONDS
+                self.consecutive_failures = 0
+                llm_endpoint_ejections_total.inc(backend=self.base_url)
+                from core.utils.log_utils import warning
+                warning("大模型副本 %s 连续失败，暂停使用 %s 秒", self.base_url, settings.LLM_EJECT_SECONDS)
+            return
+        self.consecutive_failures = 0
+        llm_endpoint_requests_total.inc(backend=self.base_url, outcome="success")
+        if self.ewma_latency <= 0:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency += EWMA_ALPHA * (latency - self.ewma_latency)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取副本状态
+        """
+        return {
+            "base_url": self.base_url,
+            "outstanding": self.outstanding,
+            "ewma_latency": round(self.ewma_latency, 4),
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejected": not self.is_available(time.monotonic())
+        }
+
+
+class LLMEndpointPool:
+    """
+    大模型副本集合，负责选择副本、记录延迟和发送对冲请求
+    """
+
+    def __init__(self, endpoints: Sequence[LLMEndpoint], strategy: str = "least_outstanding"):
+        """
+        Args:
+            endpoints: 副本列表，至少一个
+            strategy: 无会话调用的选择方式，least_outstanding 或 ewma
+        """
+        self.endpoints = list(endpoints)
+        self.strategy = strategy
+        # 调用类别 -> 近期成功调用的延迟
+        self._latencies: Dict[Hashable, Deque[float]] = {}
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def available_endpoints(self, exclude: Optional[LLMEndpoint] = None) -> List[LLMEndpoint]:
+        """
+        获取未被剔除的副本，全部被剔除时返回全部副本
+        """
+        now = time.monotonic()
+        candidates = [endpoint for endpoint in self.endpoints if endpoint is not exclude]
+        available = [endpoint for endpoint in candidates if endpoint.is_available(now)]
+        return available or candidates
+
+    def choose(self, session_key: Optional[str] = None, exclude: Optional[LLMEndpoint] = None) -> Optional[LLMEndpoint]:
+        """
+        选择处理本次调用的副本
+
+        Args:
+            session_key: 会话ID，不为空且启用会话固定时按一致性哈希选择
+            exclude: 不参与选择的副本（发送对冲请求时排除原副本）
+
+        Returns:
+            Optional[LLMEndpoint]: 选中的副本，没有可选副本时返回None
+        """
+        candidates = self.available_endpoints(exclude)
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        if session_key and settings.LLM_STICKY_SESSIONS:
+            return max(candidates, key=lambda endpoint: endpoint.rendezvous_score(session_key))
+        if self.strategy == "ewma":
+            return min(candidates, key=LLMEndpoint.load_score)
+        return min(candidates, key=lambda endpoint: (endpoint.outstanding, endpoint.ewma_latency))
+
+    def hedge_delay(self, kind: Hashable) -> Optional[float]:
+        """
+        计算对冲请求的发送时机：同类调用近期延迟的 LLM_HEDGE_PERCENTILE 分位数
+
+        Returns:
+            Optional[float]: 等待秒数，未启用对冲、副本不足或样本不足时返回None
+        """
+        if settings.LLM_HEDGE_PERCENTILE <= 0 or len(self.endpoints) < 2:
+            return None
+        samples = self._latencies.get(kind)
+        if samples is None or len(samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * settings.LLM_HEDGE_PERCENTILE))
+        return ordered[index]
+
+    async def call(self, endpoint: LLMEndpoint, kind: Hashable, func) -> Any:
+        """
+        占用副本的调用名额后执行调用，并记录延迟和失败
+
+        Args:
+            endpoint: 副本
+            kind: 调用类别，同类调用的延迟用于计算对冲时机和自适应并发上限的基线
+            func: 以副本为参数的异步函数
+
+        Returns:
+            Any: 调用结果
+        """
+        async with endpoint.admission.slot(kind=kind):
+            endpoint.outstanding += 1
+            start = time.perf_counter()
+            try:
+                result = await func(endpoint)
+            except Exception as e:
+                endpoint.record(time.perf_counter() - start, is_backend_failure(e))
+                raise
+            finally:
+                endpoint.outstanding -= 1
+        latency = time.perf_counter() - start
+        endpoint.record(latency, False)
+        self._latencies.setdefault(kind, deque(maxlen=HEDGE_SAMPLE_SIZE)).append(latency)
+        return result
+
+    async def request(self, kind: Hashable, func) -> Any:
+        """
+        选择副本执行调用，超过对冲时机仍未返回时向另一个副本发送相同的调用，取先成功的结果
+
+        Args:
+            kind: 调用类别
+            func: 以副本为参数的异步函数
+
+        Returns:
+            Any: 调用结果
+        """
+        session_key = _session_key.get()
+        primary = self.choose(session_key)
+        delay = self.hedge_delay(kind)
+        if delay is None:
+            return await self.call(primary, kind, func)
+
+        primary_task = asyncio.ensure_future(self.call(primary, kind, func))
+        tasks = [primary_task]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                secondary = self.choose(exclude=primary)
+                if secondary is not None:
+                    self.hedges_sent += 1
+                    llm_hedged_requests_total.inc(outcome="sent")
+                    tasks.append(asyncio.ensure_future(self.call(secondary, kind, func)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary_task:
+                            self.hedges_won += 1
+                            llm_hedged_requests_total.inc(outcome="won")
+                        return task.result()
+            # 全部失败时抛出原请求的异常
+            return primary_task.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()
+
+    async def stream(self, func) -> AsyncIterator[Any]:
+        """
+        选择副本执行流式调用，读取完整个响应流之前一直占用该副本的调用名额，流式调用不发送对冲请求。
+        调用方处理每个片段的时间不计入副本延迟，流式调用也不作为自适应并发上限的样本
+
+        Args:
+            func: 以副本为参数、返回异步响应流的异步函数
+
+        Yields:
+            Any: 响应片段
+        """
+        endpoint = self.choose(_session_key.get())
+        async with endpoint.admission.slot(sample=False):
+            endpoint.outstanding += 1
+            # 只累计等待后端的时间，交给调用方处理片段期间暂停计时
+            busy = 0.0
+            start = time.perf_counter()
+            try:
+                async for chunk in await func(endpoint):
+                    busy += time.perf_counter() - start
+                    yield chunk
+                    start = time.perf_counter()
+            except Exception as e:
+                endpoint.record(busy + time.perf_counter() - start, is_backend_failure(e))
+                raise
+            finally:
+                endpoint.outstanding -= 1
+        endpoint.record(busy + time.perf_counter() - start, False)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取各副本状态和对冲请求统计信息
+        """
+        return {
+            "strategy": self.strategy,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won
+        }
+
+
+def create_endpoint_pool(http_client: Any) -> LLMEndpointPool:
+    """
+    按配置创建大模型副本集合，所有副本共享同一个HTTP连接池
+
+    Args:
+        http_client: 共享的 httpx.AsyncClient
+
+    Returns:
+        LLMEndpointPool: 副本集合
+    """
+    endpoints = []
+    for base_url in settings.QWEN_API_BASES:
+        client = openai.AsyncOpenAI(
+            api_key=settings.QWEN_API_KEY,
+            base_url=base_url,
+            http_client=http_client,
+            timeout=settings.LLM_TIMEOUT
+        )
+        endpoints.append(LLMEndpoint(base_url, client, get_admission_controller(base_url)))
+    return LLMEndpointPool(endpoints, settings.LLM_ROUTING_STRATEGY)
@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标模块
+
+提供计数器、仪表和直方图三种指标，以Prometheus文本格式导出。
+请求处理过程中的各阶段耗时先记录在请求级的上下文中，请求结束时按匹配到的接口路径统一写入直方图，
+同时通过 Server-Timing 响应头返回给客户端
+"""
+import bisect
+import contextvars
+from abc import ABC, abstractmethod
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 耗时直方图的默认分桶（秒），覆盖本地处理到大模型长回答的范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 不在任何HTTP请求中执行的阶段（如启动时同步外部智能体）使用的接口标签
+BACKGROUND_ENDPOINT = "background"
+
+
+def _escape_label_value(value: str) -> str:
+    """
+    转义标签值中的特殊字符
+    """
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str],
+                   extra: Optional[Tuple[str, str]] = None) -> str:
+    """
+    构造 {name="value",...} 形式的标签文本
+    """
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """
+    格式化指标数值，整数不带小数部分
+    """
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric(ABC):
+    """
+    指标基类，按标签值组合分别保存数据
+    """
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """
+        初始化指标
+
+        Args:
+            name: 指标名称
+            documentation: 指标说明
+            labelnames: 标签名列表
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """
+        将标签字典转换为按标签名顺序排列的元组
+        """
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        """
+        以Prometheus文本格式导出指标
+
+        Returns:
+            List[str]: 文本行
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    @abstractmethod
+    def _render_samples(self) -> List[str]:
+        """
+        导出各标签值组合的样本行，由具体的指标类型实现
+        """
+
+
+class Counter(_Metric):
+    """
+    只增不减的计数器
+    """
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        """
+        增加计数
+
+        Args:
+            amount: 增加量
+            **labels: 标签值
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """
+    可增可减的仪表
+    """
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        """
+        增加数值
+
+        Args:
+            amount: 增加量
+            **labels: 标签值
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        """
+        减少数值
+
+        Args:
+            amount: 减少量
+            **labels: 标签值
+        """
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        """
+        设置数值
+
+        Args:
+            value: 新的数值
+            **labels: 标签值
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """
+    分桶统计的直方图
+
+    记录时只定位一个分桶并累加，导出时再计算累计值
+    """
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各分桶计数（最后一个为+Inf）, 总和, 次数]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str):
+        """
+        记录一次观测值
+
+        Args:
+            value: 观测值
+            **labels: 标签值
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = entry
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+    """
+
+    def __init__(self):
+        """
+        初始化指标注册表
+        """
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """
+        注册指标，同名指标已存在时返回已有的指标
+
+        Args:
+            metric: 指标对象
+
+        Returns:
+            _Metric: 注册表中的指标对象
+        """
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """
+        创建并注册计数器
+        """
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """
+        创建并注册仪表
+        """
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """
+        创建并注册直方图
+        """
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        以Prometheus文本格式导出全部指标
+
+        Returns:
+            str: 指标文本
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+metrics_registry = MetricsRegistry()
+
+http_requests_total = metrics_registry.counter(
+    "http_requests_total", "HTTP请求总数", ("method", "endpoint", "status")
+)
+http_request_errors_total = metrics_registry.counter(
+    "http_request_errors_total", "返回5xx或处理时抛出异常的HTTP请求数", ("method", "endpoint")
+)
+http_requests_in_flight = metrics_registry.gauge(
+    "http_requests_in_flight", "正在处理的HTTP请求数", ("method",)
+)
+http_request_duration_seconds = metrics_registry.histogram(
+    "http_request_duration_seconds", "HTTP请求处理耗时（秒）", ("method", "endpoint")
+)
+stage_duration_seconds = metrics_registry.histogram(
+    "stage_duration_seconds", "请求处理各阶段耗时（秒）", ("endpoint", "stage", "agent", "model")
+)
+request_cancellations_total = metrics_registry.counter(
+    "request_cancellations_total", "因超过截止时间或客户端断开而取消的请求数", ("endpoint", "reason")
+)
+stage_in_flight = metrics_registry.gauge(
+    "stage_in_flight", "正在执行的处理阶段数", ("stage",)
+)
+rate_limited_requests_total = metrics_registry.counter(
+    "rate_limited_requests_total", "因调用方请求过于频繁被拒绝的请求数", ("group",)
+)
+
+
+class RequestTimings:
+    """
+    单个请求的阶段耗时记录
+
+    请求结束前各阶段耗时暂存在这里，请求结束后匹配到接口路径时统一写入直方图；
+    请求结束后仍在执行的后台任务（如被合并的大模型调用）直接写入直方图
+    """
+    __slots__ = ("endpoint", "stages", "finished")
+
+    def __init__(self):
+        self.endpoint: Optional[str] = None
+        # (阶段, 智能体, 模型, 耗时)
+        self.stages: List[Tuple[str, str, str, float]] = []
+        self.finished = False
+
+    def record(self, stage: str, agent: str, model: str, duration: float):
+        """
+        记录一个阶段的耗时
+        """
+        if self.finished:
+            stage_duration_seconds.observe(
+                duration, endpoint=self.endpoint or BACKGROUND_ENDPOINT, stage=stage, agent=agent, model=model
+            )
+        else:
+            self.stages.append((stage, agent, model, duration))
+
+    def finish(self, endpoint: str):
+        """
+        请求结束，按接口路径写入全部阶段耗时
+        """
+        self.endpoint = endpoint
+        self.finished = True
+        for stage, agent, model, duration in self.stages:
+            stage_duration_seconds.observe(duration, endpoint=endpoint, stage=stage, agent=agent, model=model)
+
+    def server_timing(self) -> str:
+        """
+        构造 Server-Timing 响应头，同名阶段的耗时合并
+
+        Returns:
+            str: 响应头内容，如 intent;dur=812.3, validate;dur=0.2
+        """
+        totals: Dict[str, float] = {}
+        for stage, _, _, duration in self.stages:
+            totals[stage] = totals.get(stage, 0.0) + duration
+        return ", ".join(f"{stage};dur={duration * 1000:.1f}" for stage, duration in totals.items())
+
+
+_request_timings: "contextvars.ContextVar[Optional[RequestTimings]]" = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def start_request_timings() -> Tuple[RequestTimings, contextvars.Token]:
+    """
+    为当前请求创建阶段耗时记录
+
+    Returns:
+        Tuple[RequestTimings, contextvars.Token]: 耗时记录和用于恢复上下文的令牌
+    """
+    timings = RequestTimings()
+    return timings, _request_timings.set(timings)
+
+
+def reset_request_timings(token: contextvars.Token):
+    """
+    恢复请求开始前的上下文
+    """
+    _request_timings.reset(token)
+
+
+class stage_timer:
+    """
+    阶段计时上下文管理器，同步和异步代码中均使用 with 语句
+
+    示例:
+        with stage_timer("intent", model=settings.QWEN_MODEL_NAME):
+            agents = await llm_client.route_intent(query)
+    """
+    __slots__ = ("stage", "agent", "model", "_start")
+
+    def __init__(self, stage: str, agent: str = "", model: str = ""):
+        """
+        初始化阶段计时器
+
+        Args:
+            stage: 阶段名称
+            agent: 智能体名称
+            model: 大模型名称
+        """
+        self.stage = stage
+        self.agent = agent
+        self.model = model
+        self._start = 0.0
+
+    def __enter__(self) -> "stage_timer":
+        stage_in_flight.inc(stage=self.stage)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self._start
+        stage_in_flight.dec(stage=self.stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.record(self.stage, self.agent, self.model, duration)
+        else:
+            stage_duration_seconds.observe(
+                duration, endpoint=BACKGROUND_ENDPOINT, stage=self.stage, agent=self.agent, model=self.model
+            )
+        return False
+
+
+def render_metrics() -> str:
+    """
+    以Prometheus文本格式导出全部指标
+
+    Returns:
+        str: 指标文本
+    """
+    return metrics_registry.render()
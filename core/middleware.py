@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI中间件模块
+
+直接实现ASGI接口而不是基于BaseHTTPMiddleware，不缓冲响应，也不影响流式响应
+"""
+import asyncio
+import hashlib
+import json
+import time
+from typing import Optional
+
+from core.config import settings
+from core.deadline import extend_deadline, reset_deadline, set_deadline
+from core.rate_limit import rate_limiters, retry_after_seconds, route_group
+from core.metrics import (
+    http_request_duration_seconds,
+    http_request_errors_total,
+    http_requests_in_flight,
+    http_requests_total,
+    rate_limited_requests_total,
+    request_cancellations_total,
+    reset_request_timings,
+    start_request_timings,
+)
+
+# 未匹配到任何路由的请求使用的接口标签，避免把任意路径写入指标标签
+UNMATCHED_ENDPOINT = "unmatched"
+
+
+def _endpoint_label(scope) -> str:
+    """
+    获取请求匹配到的路由路径模板，如 /api/v1/worker/execute/{agent_id}
+    """
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path if path else UNMATCHED_ENDPOINT
+
+
+class MetricsMiddleware:
+    """
+    HTTP请求指标中间件
+
+    统计请求数、错误数、处理中的请求数和处理耗时，为每个请求建立阶段耗时记录，
+    并在响应头中以 Server-Timing 返回响应开始前已完成的各阶段耗时
+    """
+
+    def __init__(self, app):
+        """
+        初始化中间件
+
+        Args:
+            app: 下游ASGI应用
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get("method", "")
+        timings, token = start_request_timings()
+        # 没有发送任何响应就结束的请求（客户端已断开）按499统计
+        status_code = 499
+        start_time = time.perf_counter()
+        http_requests_in_flight.inc(method=method)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                server_timing = timings.server_timing()
+                if server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing.encode("latin-1")))
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            status_code = 500
+            raise
+        finally:
+            http_requests_in_flight.dec(method=method)
+            endpoint = _endpoint_label(scope)
+            duration = time.perf_counter() - start_time
+            http_requests_total.inc(method=method, endpoint=endpoint, status=str(status_code))
+            http_request_duration_seconds.observe(duration, method=method, endpoint=endpoint)
+            if status_code >= 500:
+                http_request_errors_total.inc(method=method, endpoint=endpoint)
+            timings.finish(endpoint)
+            reset_request_timings(token)
+
+
+# 客户端指定请求截止时间的请求头
+REQUEST_TIMEOUT_HEADER = b"x-request-timeout"
+
+# 流式响应超过截止时间后，留给处理过程发送错误事件的时间（秒），之后中间件直接结束响应
+STREAM_DEADLINE_GRACE = 5.0
+
+
+def _request_timeout(scope) -> Optional[float]:
+    """
+    获取请求的处理时限，请求头未指定或格式不正确时使用默认值
+
+    Returns:
+        Optional[float]: 处理时限（秒），不限制时返回None
+    """
+    timeout = settings.REQUEST_TIMEOUT
+    for name, value in scope.get("headers", []):
+        if name == REQUEST_TIMEOUT_HEADER:
+            try:
+                timeout = min(float(value.decode("latin-1")), settings.REQUEST_TIMEOUT_MAX)
+            except ValueError:
+                pass
+            break
+    return timeout if timeout > 0 else None
+
+
+class DeadlineMiddleware:
+    """
+    请求截止时间中间件
+
+    为每个请求设置截止时间（X-Request-Timeout 请求头或 REQUEST_TIMEOUT），下游调用据此计算超时时间；
+    超过截止时间或客户端断开时取消仍在执行的处理任务。超时且尚未开始响应时返回504。
+    响应开始后（流式响应）截止时间延长到从请求开始起 REQUEST_TIMEOUT_MAX 秒，由处理过程在超时后发送错误事件；
+    超过后仍未结束时取消处理任务，并发送空的最后一块结束响应，不留下未完成的响应
+    """
+
+    def __init__(self, app):
+        """
+        初始化中间件
+
+        Args:
+            app: 下游ASGI应用
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timeout = _request_timeout(scope)
+        token = set_deadline(timeout)
+        start = time.monotonic()
+        response_started = False
+        response_finished = False
+        cancel_reason: Optional[str] = None
+        timer = None
+        # 由后台任务持续读取客户端消息，以便在处理过程中及时发现断开
+        messages: asyncio.Queue = asyncio.Queue()
+
+        async def receive_wrapper():
+            return await messages.get()
+
+        async def send_wrapper(message):
+            nonlocal response_started, response_finished
+            if message["type"] == "http.response.start":
+                response_started = True
+                extend_for_stream()
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_finished = True
+            await send(message)
+
+        app_task = asyncio.ensure_future(self.app(scope, receive_wrapper, send_wrapper))
+
+        def cancel(reason: str):
+            nonlocal cancel_reason
+            if cancel_reason is None and not app_task.done():
+                cancel_reason = reason
+                app_task.cancel()
+
+        def extend_for_stream():
+            # 已开始发送的响应不再按原截止时间中断，以免流式响应被截断
+            nonlocal timer
+            if timer is None:
+                return
+            timer.cancel()
+            left = max(settings.REQUEST_TIMEOUT_MAX, timeout) - (time.monotonic() - start)
+            extend_deadline(left)
+            # 留出发送错误事件的时间后再强制结束
+            timer = asyncio.get_event_loop().call_later(max(0.0, left) + STREAM_DEADLINE_GRACE, cancel, "deadline")
+
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    cancel("disconnect")
+                    return
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        timer = asyncio.get_event_loop().call_later(timeout, cancel, "deadline") if timeout else None
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            # 不是由本中间件发起的取消（如服务关闭）继续向上传递
+            if cancel_reason is None:
+                raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            watcher.cancel()
+            reset_deadline(token)
+
+        if cancel_reason is None:
+            return
+        request_cancellations_total.inc(endpoint=_endpoint_label(scope), reason=cancel_reason)
+        if cancel_reason == "deadline" and response_started:
+            if not response_finished:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        if cancel_reason == "deadline":
+            body = json.dumps({"detail": "请求处理超时"}, ensure_ascii=False).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 504,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+            })
+            await send({"type": "http.response.body", "body": body})
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    """
+    获取请求头的值，不存在时返回None
+    """
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _key_digest(api_key: str) -> str:
+    """
+    API Key 的摘要，避免在内存中保留完整密钥，也让每个令牌桶的键长度固定
+    """
+    return hashlib.blake2b(api_key.encode("utf-8"), digest_size=8).hexdigest()
+
+
+# RATE_LIMIT_API_KEYS 中配置的 API Key 摘要
+_known_api_keys = frozenset(
+    _key_digest(key.strip()) for key in settings.RATE_LIMIT_API_KEYS.split(",") if key.strip()
+)
+
+
+def _caller_key(scope) -> str:
+    """
+    确定限流使用的调用方标识：RATE_LIMIT_API_KEYS 中的 API Key 各自限流，其余请求按客户端IP限流
+
+    调用方可以随意填写的请求头（未配置的 API Key、会话ID）不作为标识，
+    否则每次换一个值就能绕过限流，还会挤占令牌桶数上限、让其他调用方的令牌桶被淘汰
+    """
+    if _known_api_keys:
+        api_key = _header(scope, b"x-api-key")
+        if not api_key:
+            authorization = _header(scope, b"authorization") or ""
+            if authorization.lower().startswith("bearer "):
+                api_key = authorization[7:].strip()
+        if api_key:
+            digest = _key_digest(api_key)
+            if digest in _known_api_keys:
+                return "key:" + digest
+
+    if settings.RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = _header(scope, b"x-forwarded-for")
+        if forwarded:
+            # 取可信反向代理追加的最后一个地址，前面的地址可能由客户端伪造
+            return "ip:" + forwarded.split(",")[-1].strip()
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+class RateLimitMiddleware:
+    """
+    按调用方的令牌桶限流中间件
+
+    调度、工作和管理接口分别限流，同一调用方在各组接口上的令牌桶互不影响；
+    被限流的请求直接返回429和 Retry-After，不进入后续处理
+    """
+
+    def __init__(self, app):
+        """
+        初始化中间件
+
+        Args:
+            app: 下游ASGI应用
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        group = route_group(scope.get("path", ""))
+        limiter = rate_limiters.get(group) if group else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        wait = limiter.acquire(_caller_key(scope))
+        if not wait:
+            await self.app(scope, receive, send)
+            return
+
+        rate_limited_requests_total.inc(group=group)
+        body = json.dumps({"detail": "请求过于频繁，请稍后重试"}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after_seconds(wait)).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -2,81 +2,34 @@
 
 import json
 import hashlib
-import os
-import asyncio
-from openai import OpenAI
-from typing import List, Dict, Any, Optional
+import httpx
+import openai
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
 from core.config import settings
-from core.utils.prompt_utils import read_prompt_from_file, format_prompt
+from core.completion_cache import completion_cache
+from core.deadline import DeadlineExceeded, check_deadline, remaining_timeout
+from core.llm_admission import AdmissionRejected
+from core.llm_endpoints import create_endpoint_pool
+from core.utils.prompt_utils import PromptTemplate, read_prompt_from_file, get_prompt_template, format_prompt
 from core.registry_manager import agent_registry
+from core.agent_vector_index import agent_vector_index
 from schemas.agent import AgentInDB
 
-# 获取项目根目录
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 预渲染意图提示词时代替用户查询的占位符
+_QUERY_PLACEHOLDER = "\x00QUERY\x00"
 
-
-class QwenClient:
-    def __init__(self):
-        """
-        初始化Qwen客户端
-        """
-        self.client = OpenAI(
-            api_key=settings.QWEN_API_KEY,
-            base_url=settings.QWEN_API_BASE
-        )
-        self.model_name = settings.QWEN_MODEL_NAME
-
-    def _generate_consistent_id(self, agent_name: str) -> str:
-        """
-        根据智能体名称生成一致的ID
-        
-        Args:
-            agent_name: 智能体名称
-            
-        Returns:
-            str: 一致的智能体ID
-        """
-        return hashlib.md5(agent_name.encode('utf-8')).hexdigest()
-
-    def parse_intent(self, query: str) -> List[Dict[str, str]]:
-        """
-        解析用户意图并返回需要调用的智能体列表
-        
-        Args:
-            query: 用户查询
-            
-        Returns:
-            List[Dict[str, str]]: 智能体列表
-        """
-        # 获取所有可用的智能体
-        available_agents = agent_registry.list_agents()
-        
-        # 构建智能体描述列表
-        agent_descriptions = []
-        agent_names = []  # 存储智能体名称列表
-        for agent in available_agents:
-            agent_descriptions.append(f"{agent.name} - {agent.description}")
-            agent_names.append(agent.name)
-        
-        # 从文件读取提示词
-        prompt_file_path = os.path.join(PROJECT_ROOT, "prompt", "intent_prompt.txt")
-        try:
-            with open(prompt_file_path, "r", encoding="utf-8") as f:
-                prompt_template = f.read()
-        except FileNotFoundError:
-            # 如果找不到文件，使用默认提示词
-            agent_list_str = "\n".join([f"{i+1}. {desc}" for i, desc in enumerate(agent_descriptions)])
-            agent_names_str = ", ".join([f'"{name}"' for name in agent_names])
-            prompt_template = f"""你是一个智能体调度系统，需要根据用户的问题决定应该由哪个智能体来处理。
+# 找不到或无法格式化intent_prompt.txt时使用的默认意图识别提示词
+DEFAULT_INTENT_PROMPT_TEMPLATE = """你是一个智能体调度系统，需要根据用户的问题决定应该由哪个智能体来处理。
 请分析以下用户查询，并确定最适合处理该查询的智能体。
 
-用户查询: "{{query}}"
+用户查询: "{query}"
 
 可用的智能体包括:
-{agent_list_str}
+{agent_list}
 
 请从以下智能体名称中选择匹配的智能体:
-{agent_names_str}
+{agent_names_list}
 
 请按照以下格式回复:
 {{
@@ -90,359 +43,361 @@ class QwenClient:
 根据智能体的描述和用户查询内容的匹配度来判断应该推荐哪个智能体。
 只返回JSON格式的结果，不要添加其他解释。"""
 
-        # 构建提示词
-        try:
-            agent_list_str = "\n".join([f"{i+1}. {desc}" for i, desc in enumerate(agent_descriptions)])
-            agent_names_str = ", ".join([f'"{name}"' for name in agent_names])
-            prompt = format_prompt(prompt_template, 
-                                 query=query,
-                                 agent_list=agent_list_str,
-                                 agent_names_list=agent_names_str)
-        except Exception as e:
-            from core.utils.log_utils import error
-            error(f"-----格式化提示词时出错--: {e}")
-            error(f"错误详情: {str(e)}")
-            # 使用默认模板
-            agent_list_str = "\n".join([f"{i+1}. {desc}" for i, desc in enumerate(agent_descriptions)])
-            agent_names_str = ", ".join([f'"{name}"' for name in agent_names])
-            prompt = f"""你是一个智能体调度系统，需要根据用户的问题决定应该由哪个智能体来处理。
-请分析以下用户查询，并确定最适合处理该查询的智能体。
-
-用户查询: "{{query}}"
-
-可用的智能体包括:
-{{agent_list_str}}
 
-请从以下智能体名称中选择匹配的智能体:
-{{agent_names_str}}
+def _completion_to_chunk(completion: ChatCompletion) -> ChatCompletionChunk:
+    """
+    把缓存的完整响应转换为一个流式响应片段
+    """
+    choice = completion.choices[0]
+    return ChatCompletionChunk.model_validate({
+        "id": completion.id,
+        "object": "chat.completion.chunk",
+        "created": completion.created,
+        "model": completion.model,
+        "choices": [{
+            "index": 0,
+            "delta": {"role": "assistant", "content": choice.message.content},
+            "finish_reason": choice.finish_reason
+        }]
+    })
+
+
+def _chunks_to_completion(last_chunk: ChatCompletionChunk, content: str, finish_reason: str) -> ChatCompletion:
+    """
+    把读取完的流式响应拼成完整响应，用于写入缓存
+    """
+    return ChatCompletion.model_validate({
+        "id": last_chunk.id,
+        "object": "chat.completion",
+        "created": last_chunk.created,
+        "model": last_chunk.model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": finish_reason
+        }]
+    })
+
+
+
+def _raise_if_deadline_timeout(exc: Exception, timeout: float):
+    """
+    超时时间受请求截止时间限制时，调用超时说明请求已超过截止时间而不是副本出了问题，转换为 DeadlineExceeded
+
+    Args:
+        exc: 大模型调用的超时异常
+        timeout: 本次调用使用的超时时间（秒）
+
+    Raises:
+        DeadlineExceeded: 超时时间小于 LLM_TIMEOUT，即受请求截止时间限制
+    """
+    if timeout < settings.LLM_TIMEOUT:
+        raise DeadlineExceeded("请求已超过截止时间") from exc
 
-请按照以下格式回复:
-{{
-    "agents": [
-        {{
-            "name": "智能体名称"
-        }}
-    ]
-}}
+class QwenClient:
+    def __init__(self):
+        """
+        初始化Qwen客户端
 
-根据智能体的描述和用户查询内容的匹配度来判断应该推荐哪个智能体。
-只返回JSON格式的结果，不要添加其他解释。"""
-        from core.utils.log_utils import info
-        info(f"prompt---------{prompt}")
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": "你是一个智能体调度系统，能够根据用户问题选择合适的智能体，你能选择的智能体有多个。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=500
+        使用异步客户端和有上限的长连接池，进程内所有调用方共享同一个实例，
+        请通过 get_qwen_client() 获取，不要在请求中重复创建。
+        配置了多个模型副本时，所有副本共享同一个连接池，每次调用由副本集合选择副本
+        """
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
             )
-            info(f"response---------{response}")
-            # 解析响应
-            content = response.choices[0].message.content
-            if content:
-                result = json.loads(content)
-                agents = result.get("agents", [])
-                # 为每个智能体生成一致的ID
-                for agent in agents:
-                    agent_name = agent.get("name", "")
-                    if agent_name:
-                        agent["id"] = self._generate_consistent_id(agent_name)
-                info(f"agents---------{agents}")
-                return agents
-            else:
-                return []
-        except Exception as e:
-            # 出错时返回空列表
-            from core.utils.log_utils import error
-            error(f"解析意图时出错: {e}")
-            return []
+        )
+        # 所有大模型调用都经过所选副本的准入控制
+        self.endpoints = create_endpoint_pool(self.http_client)
+        self.model_name = settings.QWEN_MODEL_NAME
+        # (注册表版本号, 提示词模板, 意图提示词片段)，注册表或模板文件变化后重新渲染
+        self._intent_prompt_cache: Optional[Tuple[int, Optional[PromptTemplate], List[str]]] = None
 
-        
-    async def execute_math_task(self, query: str) -> Dict[str, Any]:
+    async def close(self):
         """
-        执行数学任务，调用Qwen模型解答数学问题
-        
-        Args:
-            query: 数学问题查询
-            
-        Returns:
-            Dict[str, Any]: 数学问题解答结果
+        关闭底层HTTP连接池
         """
-        # 从文件读取系统提示词和用户提示词
-        system_prompt = read_prompt_from_file("system_math_prompt.txt")
-        if not system_prompt:
-            system_prompt = "你是一个专业的初二数学老师，能够详细解答各种初二数学问题。"
-            
-        user_prompt_template = read_prompt_from_file("user_math_prompt.txt")
-        if not user_prompt_template:
-            user_prompt_template = """你是一个专业的初二数学老师，能够详细解答各种初二数学问题。
-请解答以下数学问题，并提供详细的解题过程：
+        await self.http_client.aclose()
 
-问题: "{query}"
+    async def chat_completion(self, cache: bool = False, **kwargs) -> Any:
+        """
+        选择模型副本并获取调用名额后请求大模型，超时时间在获得名额后按请求剩余时间计算；
+        启用对冲请求时，超过同类调用（按 max_tokens 区分）近期延迟的分位数仍未返回则向另一个副本再发一次。
+        使用结果缓存时，模型、消息和采样参数都相同的调用直接返回缓存的结果
 
-请按照以下结构回复:
-1. 问题分析: 简要分析问题类型和解题思路
-2. 解题步骤: 详细列出解题的每一步
-3. 最终答案: 给出最终的答案
-4. 相关知识点: 列出涉及的数学知识点
+        Args:
+            cache: 是否使用结果缓存，请求通过 set_completion_cache 指定时以请求为准
+            **kwargs: chat.completions.create 的参数，未指定 model 时使用默认模型
 
-请用中文回复，确保解答清晰易懂，适合初二学生理解。"""
-            
-        # 构建数学问题解答的提示词
-        try:
-            user_prompt = format_prompt(user_prompt_template, query=query)
-        except Exception as e:
-            from core.utils.log_utils import error
-            error(f"格式化数学助手提示词时出错: {e}")
-            error(f"user_prompt_template内容: {user_prompt_template}")
-            error(f"query内容: {query}")
-            # 使用默认模板
-            user_prompt = f"""你是一个专业的初二数学老师，能够详细解答各种初二数学问题。
-请解答以下数学问题，并提供详细的解题过程：
+        Returns:
+            Any: 大模型响应
 
-问题: "{query}"
+        Raises:
+            AdmissionRejected: 准入等待队列已满
+        """
+        kwargs.setdefault("model", self.model_name)
+
+        cache_key = None
+        if completion_cache.is_enabled(cache):
+            cache_key = completion_cache.make_key(kwargs)
+            cached = await completion_cache.get(cache_key)
+            if cached is not None:
+                return ChatCompletion.model_validate_json(cached)
+
+        async def create(endpoint):
+            timeout = remaining_timeout(settings.LLM_TIMEOUT)
+            try:
+                return await endpoint.client.chat.completions.create(timeout=timeout, **kwargs)
+            except openai.APITimeoutError as e:
+                _raise_if_deadline_timeout(e, timeout)
+                raise
+
+        response = await self.endpoints.request(kwargs.get("max_tokens"), create)
+        # 只缓存正常结束且有内容的结果，截断或空的回答下次重新生成
+        if cache_key is not None and response.choices and response.choices[0].message.content \
+                and response.choices[0].finish_reason != "length":
+            completion_cache.set(cache_key, response.model_dump_json().encode("utf-8"))
+        return response
+
+    async def stream_chat_completion(self, cache: bool = False, **kwargs) -> AsyncIterator[Any]:
+        """
+        以流式方式请求大模型，读取完整个响应流之前一直占用调用名额。
+        使用结果缓存时与 chat_completion 共用缓存：命中时以一个片段返回缓存的回答，未命中时在响应流正常结束后写入缓存
 
-请按照以下结构回复:
-1. 问题分析: 简要分析问题类型和解题思路
-2. 解题步骤: 详细列出解题的每一步
-3. 最终答案: 给出最终的答案
-4. 相关知识点: 列出涉及的数学知识点
+        Args:
+            cache: 是否使用结果缓存，请求通过 set_completion_cache 指定时以请求为准
+            **kwargs: chat.completions.create 的参数，未指定 model 时使用默认模型
 
-请用中文回复，确保解答清晰易懂，适合初二学生理解。"""
-            
-        try:
-            # 使用asyncio运行阻塞的API调用
-            response = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=0.3,
-                    max_tokens=1500
-                )
-            )
+        Yields:
+            Any: 大模型响应片段
 
-            # 返回结果
-            answer = response.choices[0].message.content
-            if not answer:
-                answer = "无法生成解答"
-            
-            return {
-                "result": f"初二数学问题解答: {query}",
-                "explanation": answer,
-                "formula": "根据具体问题而定",
-                "steps": ["请参考解答过程"],
-                "final_answer": "请查看详细解答"
-            }
-        except Exception as e:
-            from core.utils.log_utils import error
-            error(f"处理数学任务时出错: {e}")
-            return {
-                "result": f"处理数学问题时出错: {query}",
-                "explanation": f"错误信息: {str(e)}",
-                "formula": "",
-                "steps": [],
-                "final_answer": "处理失败"
-            }
+        Raises:
+            AdmissionRejected: 准入等待队列已满
+            DeadlineExceeded: 读取响应流时超过请求截止时间
+        """
+        kwargs.setdefault("model", self.model_name)
+
+        cache_key = None
+        if completion_cache.is_enabled(cache):
+            cache_key = completion_cache.make_key(kwargs)
+            cached = await completion_cache.get(cache_key)
+            if cached is not None:
+                yield _completion_to_chunk(ChatCompletion.model_validate_json(cached))
+                return
+
+        timeout = settings.LLM_TIMEOUT
+
+        async def create(endpoint):
+            nonlocal timeout
+            timeout = remaining_timeout(settings.LLM_TIMEOUT)
+            return await endpoint.client.chat.completions.create(timeout=timeout, stream=True, **kwargs)
+
+        parts: List[str] = []
+        last_chunk = None
+        finish_reason = None
+        stream = self.endpoints.stream(create)
+        try:
+            async for chunk in stream:
+                # 连接的读超时只限制相邻两块之间的间隔，逐块检查截止时间，超时后由调用方发送错误事件
+                check_deadline()
+                if cache_key is not None and chunk.choices:
+                    last_chunk = chunk
+                    if chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                yield chunk
+        except openai.APITimeoutError as e:
+            _raise_if_deadline_timeout(e, timeout)
+            raise
+        finally:
+            # 立即释放调用名额和连接
+            await stream.aclose()
+        # 只缓存正常结束且有内容的结果
+        if cache_key is not None and parts and finish_reason == "stop":
+            completion = _chunks_to_completion(last_chunk, "".join(parts), finish_reason)
+            completion_cache.set(cache_key, completion.model_dump_json().encode("utf-8"))
 
-    async def execute_poetry_task(self, query: str) -> Dict[str, Any]:
+    def _generate_consistent_id(self, agent_name: str) -> str:
         """
-        执行古诗任务，调用Qwen模型处理古诗相关问题
+        根据智能体名称生成一致的ID
         
         Args:
-            query: 古诗相关问题查询
+            agent_name: 智能体名称
             
         Returns:
-            Dict[str, Any]: 古诗问题解答结果
+            str: 一致的智能体ID
         """
-        # 从文件读取系统提示词和用户提示词
-        system_prompt = read_prompt_from_file("system_poetry_prompt.txt")
-        if not system_prompt:
-            system_prompt = "你是一个专业的古典文学老师，能够详细解答各种古诗相关问题。"
-            
-        user_prompt_template = read_prompt_from_file("user_poetry_prompt.txt")
-        if not user_prompt_template:
-            user_prompt_template = """你是一个专业的古典文学老师，能够详细解答各种古诗相关问题。
-请处理以下古诗相关问题，并提供详细的解答：
+        return hashlib.md5(agent_name.encode('utf-8')).hexdigest()
 
-问题: "{query}"
+    def _render_intent_prompt_parts(self, prompt_template: Optional[PromptTemplate],
+                                    agents: List[AgentInDB]) -> List[str]:
+        """
+        用给定的智能体渲染意图识别提示词，返回以用户查询为分隔的片段
 
-请按照以下结构回复:
-1. 问题分析: 简要分析问题类型和解答思路
-2. 详细解答: 详细回答问题的各个方面
-3. 相关知识点: 列出涉及的古诗知识点或文学常识
+        Args:
+            prompt_template: intent_prompt.txt 模板，不存在或为空时使用默认模板
+            agents: 放入提示词的智能体
 
-请用中文回复，确保解答清晰易懂，适合古诗爱好者理解。"""
-            
-        # 构建古诗问题解答的提示词
+        Returns:
+            List[str]: 提示词片段，使用 query.join(parts) 得到完整提示词
+        """
+        agent_list_str = "\n".join(
+            [f"{i+1}. {agent.name} - {agent.description}" for i, agent in enumerate(agents)]
+        )
+        agent_names_str = ", ".join([f'"{agent.name}"' for agent in agents])
+        
+        # 查询位置先用占位符渲染，智能体描述中的花括号不会影响后续插入查询
         try:
-            user_prompt = format_prompt(user_prompt_template, query=query)
+            if prompt_template is None or prompt_template.is_empty:
+                # 如果找不到文件，使用默认提示词
+                raise FileNotFoundError("提示词文件不存在或为空: intent_prompt.txt")
+            rendered_prompt = format_prompt(prompt_template,
+                                            query=_QUERY_PLACEHOLDER,
+                                            agent_list=agent_list_str,
+                                            agent_names_list=agent_names_str)
         except Exception as e:
             from core.utils.log_utils import error
-            error(f"格式化古诗助手提示词时出错: {e}")
-            error(f"user_prompt_template内容: {user_prompt_template}")
-            error(f"query内容: {query}")
+            error(f"-----格式化提示词时出错--: {e}")
             # 使用默认模板
-            user_prompt = f"""你是一个专业的古典文学老师，能够详细解答各种古诗相关问题。
-请处理以下古诗相关问题，并提供详细的解答：
-
-问题: "{query}"
-
-请按照以下结构回复:
-1. 问题分析: 简要分析问题类型和解答思路
-2. 详细解答: 详细回答问题的各个方面
-3. 相关知识点: 列出涉及的古诗知识点或文学常识
+            rendered_prompt = format_prompt(DEFAULT_INTENT_PROMPT_TEMPLATE,
+                                            query=_QUERY_PLACEHOLDER,
+                                            agent_list=agent_list_str,
+                                            agent_names_list=agent_names_str)
 
-请用中文回复，确保解答清晰易懂，适合古诗爱好者理解。"""
-            
-        try:
-            # 使用asyncio运行阻塞的API调用
-            response = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=0.3,
-                    max_tokens=1500
-                )
-            )
+        return rendered_prompt.split(_QUERY_PLACEHOLDER)
 
-            # 返回结果
-            answer = response.choices[0].message.content
-            if not answer:
-                answer = "无法生成解答"
-            
-            return {
-                "result": f"古诗问题解答: {query}",
-                "explanation": answer,
-                "author": "根据具体问题而定",
-                "dynasty": "根据具体问题而定",
-                "poem": "根据具体问题而定"
-            }
-        except Exception as e:
-            return {
-                "result": f"处理古诗问题时出错: {query}",
-                "explanation": f"错误信息: {str(e)}",
-                "author": "",
-                "dynasty": "",
-                "poem": ""
-            }
-
-    async def execute_biology_task(self, query: str) -> Dict[str, Any]:
+    def _shortlist_agents(self, query: str) -> Optional[List[AgentInDB]]:
         """
-        执行生物学任务，调用Qwen模型解答生物学问题
-        
+        注册表较大时用向量索引选出与查询最相近的候选智能体
+
         Args:
-            query: 生物学问题查询
-            
+            query: 用户查询
+
         Returns:
-            Dict[str, Any]: 生物学问题解答结果
+            Optional[List[AgentInDB]]: 候选智能体，无需筛选或没有候选达到得分下限时返回None
         """
-        # 从文件读取系统提示词和用户提示词
-        system_prompt = read_prompt_from_file("system_biology_prompt.txt")
-        if not system_prompt:
-            system_prompt = "你是一个专业的生物学老师，能够详细解答各种生物学问题。"
-            
-        user_prompt_template = read_prompt_from_file("user_biology_prompt.txt")
-        if not user_prompt_template:
-            user_prompt_template = """你是一个专业的生物学老师，能够详细解答各种生物学问题。
-请解答以下生物学问题，并提供详细的解释：
+        top_k = settings.INTENT_SHORTLIST_TOP_K
+        if top_k <= 0 or len(agent_vector_index) <= top_k:
+            return None
+        ranked = agent_vector_index.top_k(query, top_k, settings.INTENT_SHORTLIST_MIN_SCORE)
+        candidates = [agent_registry.get_agent(agent_id) for agent_id, _ in ranked]
+        candidates = [agent for agent in candidates if agent is not None]
+        if not candidates:
+            return None
+        from core.utils.log_utils import debug
+        debug("意图识别候选智能体: %s", ranked)
+        return candidates
+
+    def _get_intent_prompt_parts(self, query: str) -> List[str]:
+        """
+        获取以用户查询为分隔的意图识别提示词片段
 
-问题: "{query}"
+        注册表中的智能体超过 INTENT_SHORTLIST_TOP_K 个时只放入向量索引选出的候选；
+        没有候选达到得分下限时放入全部智能体。全部智能体的版本只在注册表版本或提示词文件变化时重新渲染，
+        每次请求只需将查询插入各片段之间
 
-请按照以下结构回复:
-1. 问题分析: 简要分析问题类型和解题思路
-2. 详细解答: 详细解释问题的各个方面
-3. 相关知识点: 列出涉及的生物学知识点
+        Args:
+            query: 用户查询
 
-请用中文回复，确保解答清晰易懂，适合生物学学习者理解。"""
-            
-        # 构建生物学问题解答的提示词
-        try:
-            user_prompt = format_prompt(user_prompt_template, query=query)
-        except Exception as e:
-            from core.utils.log_utils import error
-            error(f"格式化生物学助手提示词时出错: {e}")
-            error(f"user_prompt_template内容: {user_prompt_template}")
-            error(f"query内容: {query}")
-            # 使用默认模板
-            user_prompt = f"""你是一个专业的生物学老师，能够详细解答各种生物学问题。
-请解答以下生物学问题，并提供详细的解释：
+        Returns:
+            List[str]: 提示词片段，使用 query.join(parts) 得到完整提示词
+        """
+        prompt_template = get_prompt_template("intent_prompt.txt")
+        candidates = self._shortlist_agents(query)
+        if candidates is not None:
+            return self._render_intent_prompt_parts(prompt_template, candidates)
+
+        registry_version = agent_registry.version
+        cached = self._intent_prompt_cache
+        if cached is not None and cached[0] == registry_version and cached[1] is prompt_template:
+            return cached[2]
 
-问题: "{query}"
+        # 获取所有可用的智能体
+        prompt_parts = self._render_intent_prompt_parts(prompt_template, agent_registry.list_agents())
+        self._intent_prompt_cache = (registry_version, prompt_template, prompt_parts)
+        return prompt_parts
 
-请按照以下结构回复:
-1. 问题分析: 简要分析问题类型和解题思路
-2. 详细解答: 详细解释问题的各个方面
-3. 相关知识点: 列出涉及的生物学知识点
+    async def request_intent(self, query: str) -> List[Dict[str, str]]:
+        """
+        调用大模型识别用户意图，出错时直接抛出异常
 
-请用中文回复，确保解答清晰易懂，适合生物学学习者理解。"""
+        Args:
+            query: 用户查询
 
-        try:
-            # 使用asyncio运行阻塞的API调用
-            response = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=0.3,
-                    max_tokens=1500
-                )
-            )
+        Returns:
+            List[Dict[str, str]]: 智能体列表
 
-            # 返回结果
-            answer = response.choices[0].message.content
-            if not answer:
-                answer = "无法生成解答"
+        Raises:
+            Exception: 请求大模型或解析响应失败
+        """
+        prompt = query.join(self._get_intent_prompt_parts(query))
+        from core.utils.log_utils import debug, info, truncate
+        debug("prompt---------%s", truncate(prompt))
+        response = await self.chat_completion(
+            messages=[
+                {"role": "system", "content": "你是一个智能体调度系统，能够根据用户问题选择合适的智能体，你能选择的智能体有多个。"},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.1,
+            max_tokens=500
+        )
+        debug("response---------%s", truncate(response))
+        # 解析响应
+        content = response.choices[0].message.content
+        if not content:
+            return []
+        result = json.loads(content)
+        agents = result.get("agents", [])
+        # 为每个智能体生成一致的ID
+        for agent in agents:
+            agent_name = agent.get("name", "")
+            if agent_name:
+                agent["id"] = self._generate_consistent_id(agent_name)
+        info("agents---------%s", agents, sample_rate=settings.LOG_SAMPLE_RATE)
+        return agents
+
+    async def parse_intent(self, query: str) -> List[Dict[str, str]]:
+        """
+        解析用户意图并返回需要调用的智能体列表
+        
+        Args:
+            query: 用户查询
             
-            return {
-                "result": f"生物学问题解答: {query}",
-                "explanation": answer,
-                "key_points": ["请参考详细解答"],
-                "related_terms": ["根据具体问题而定"],
-                "example": "根据具体问题而定"
-            }
+        Returns:
+            List[Dict[str, str]]: 智能体列表，出错时返回空列表
+        """
+        try:
+            return await self.request_intent(query)
+        except (AdmissionRejected, DeadlineExceeded):
+            # 准入控制拒绝和超过请求截止时间时交给接口返回503/504
+            raise
         except Exception as e:
-            return {
-                "result": f"处理生物学问题时出错: {query}",
-                "explanation": f"错误信息: {str(e)}",
-                "key_points": [],
-                "related_terms": [],
-                "example": ""
-            }
+            # 出错时返回空列表
+            from core.utils.log_utils import error
+            error(f"解析意图时出错: {e}")
+            return []
 
-    def execute_generic_task(self, agent_id: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _generic_task_messages(self, agent_id: str, query: str) -> List[Dict[str, str]]:
         """
-        执行通用任务
-        
+        构建通用任务的对话消息
+
         Args:
             agent_id: 智能体ID
-            input_data: 输入数据
-            
+            query: 请求内容
+
         Returns:
-            Dict[str, Any]: 任务执行结果
+            List[Dict[str, str]]: 系统提示词和用户提示词
         """
-        query = input_data.get("query", "")
-        
-        # 从文件读取系统提示词和用户提示词
+        # 获取内存中的系统提示词和用户提示词
         system_prompt = read_prompt_from_file("system_generic_prompt.txt")
         if not system_prompt:
             system_prompt = "你是一个通用任务处理助手。"
             
-        user_prompt_template = read_prompt_from_file("user_generic_prompt.txt")
-        if not user_prompt_template:
+        user_prompt_template = get_prompt_template("user_generic_prompt.txt")
+        if user_prompt_template is None or user_prompt_template.is_empty:
             user_prompt_template = """你是一个通用任务处理助手，需要处理各种类型的任务。
 请处理以下任务请求：
 
@@ -467,13 +422,26 @@ class QwenClient:
 请求内容: "{query}"
 
 请提供适当的回复来处理这个任务。"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    async def execute_generic_task(self, agent_id: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        执行通用任务
+        
+        Args:
+            agent_id: 智能体ID
+            input_data: 输入数据
+            
+        Returns:
+            Dict[str, Any]: 任务执行结果
+        """
+        query = input_data.get("query", "")
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+            response = await self.chat_completion(
+                messages=self._generic_task_messages(agent_id, query),
                 temperature=0.7,
                 max_tokens=1000
             )
@@ -487,8 +455,75 @@ class QwenClient:
                 "input": input_data,
                 "output": result
             }
+        except (AdmissionRejected, DeadlineExceeded):
+            # 准入控制拒绝和超过请求截止时间时交给接口返回503/504
+            raise
         except Exception as e:
             return {
                 "result": f"处理问题时出错: {query}",
                 "answer": f"错误信息: {str(e)}"
-            }
\ No newline at end of file
+            }
+
+    async def stream_generic_task(self, agent_id: str, input_data: Dict[str, Any]) -> AsyncIterator[Any]:
+        """
+        以流式方式执行通用任务
+
+        Args:
+            agent_id: 智能体ID
+            input_data: 输入数据
+
+        Yields:
+            Any: 模型生成的文本片段（str），最后产出与 execute_generic_task 相同结构的任务结果（dict）
+        """
+        query = input_data.get("query", "")
+        parts: List[str] = []
+        try:
+            async for chunk in self.stream_chat_completion(
+                messages=self._generic_task_messages(agent_id, query),
+                temperature=0.7,
+                max_tokens=1000
+            ):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        except (AdmissionRejected, DeadlineExceeded):
+            # 准入控制拒绝和超过请求截止时间时交给接口处理
+            raise
+        except Exception as e:
+            yield {
+                "result": f"处理问题时出错: {query}",
+                "answer": f"错误信息: {str(e)}"
+            }
+            return
+        yield {
+            "result": f"Processed by agent {agent_id}",
+            "input": input_data,
+            "output": "".join(parts) or "无法生成回复"
+        }
+
+
+# 全局实例和便捷函数
+_qwen_client: Optional[QwenClient] = None
+
+
+def get_qwen_client() -> QwenClient:
+    """
+    获取Qwen客户端实例（单例模式）
+
+    Returns:
+        QwenClient: 进程内共享的Qwen客户端实例
+    """
+    global _qwen_client
+    if _qwen_client is None:
+        _qwen_client = QwenClient()
+    return _qwen_client
+
+
+async def close_qwen_client():
+    """
+    关闭共享的Qwen客户端，在系统关闭时调用
+    """
+    global _qwen_client
+    if _qwen_client is not None:
+        await _qwen_client.close()
+        _qwen_client = None
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+令牌桶限流模块
+
+每个调用方（API Key、会话或客户端IP）在每组接口上各有一个令牌桶，令牌按固定速率补充，最多累积到突发上限。
+令牌桶只保存 (剩余令牌数, 上次补充时间) 两个数，按最近使用顺序排列；空闲到令牌已经补满的桶与新建的桶没有区别，
+直接删除，同时限制桶的总数，调用方数量再多内存占用也保持不变
+"""
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from core.config import settings
+
+
+class TokenBucketLimiter:
+    """
+    一组接口的令牌桶集合
+
+    只在事件循环中调用，不加锁
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        """
+        初始化限流器
+
+        Args:
+            rate: 每秒补充的令牌数
+            burst: 令牌桶容量，即允许的突发请求数
+            max_keys: 最多保存的令牌桶数，超出时淘汰最久未使用的桶
+        """
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_keys = max(1, max_keys)
+        # 空闲超过该时间的桶已经补满，可以删除
+        self.idle_ttl = self.burst / rate if rate > 0 else float("inf")
+        # 调用方 -> (剩余令牌数, 上次补充时间)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.allowed = 0
+        self.limited = 0
+        self.evictions = 0
+
+    def _expire(self, now: float):
+        """
+        从最久未使用的一端删除已经补满的令牌桶
+        """
+        buckets = self._buckets
+        while buckets:
+            key, (_, updated) = next(iter(buckets.items()))
+            if now - updated < self.idle_ttl:
+                break
+            del buckets[key]
+
+    def acquire(self, key: str, now: Optional[float] = None) -> float:
+        """
+        为调用方取出一个令牌
+
+        Args:
+            key: 调用方标识
+            now: 当前时间（单调时钟），默认取当前时间
+
+        Returns:
+            float: 0表示允许；大于0表示被限流，值为需要等待的秒数
+        """
+        if now is None:
+            now = time.monotonic()
+        self._expire(now)
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            tokens = self.burst
+        else:
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+
+        if tokens >= 1.0:
+            tokens -= 1.0
+            wait = 0.0
+            self.allowed += 1
+        else:
+            wait = (1.0 - tokens) / self.rate if self.rate > 0 else float("inf")
+            self.limited += 1
+
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+            self.evictions += 1
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取限流统计信息
+
+        Returns:
+            Dict[str, Any]: 速率、容量、当前令牌桶数以及放行、限流和淘汰次数
+        """
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "keys": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "evictions": self.evictions
+        }
+
+
+def retry_after_seconds(wait: float) -> int:
+    """
+    将等待时间转换为 Retry-After 响应头使用的整数秒
+    """
+    if math.isinf(wait):
+        return int(settings.RATE_LIMIT_MAX_RETRY_AFTER)
+    return max(1, min(int(math.ceil(wait)), int(settings.RATE_LIMIT_MAX_RETRY_AFTER)))
+
+
+# 接口路径前缀 -> 限流分组
+ROUTE_GROUPS = (
+    (settings.API_V1_STR + "/scheduler", "scheduler"),
+    (settings.API_V1_STR + "/worker", "worker"),
+    (settings.API_V1_STR + "/manager", "manager"),
+)
+
+
+def route_group(path: str) -> Optional[str]:
+    """
+    获取请求路径所属的限流分组
+
+    Returns:
+        Optional[str]: 分组名称，不限流的路径（如 /health、/metrics）返回None
+    """
+    for prefix, group in ROUTE_GROUPS:
+        if path == prefix or path.startswith(prefix + "/"):
+            return group
+    return None
+
+
+def _create_limiters() -> Dict[str, TokenBucketLimiter]:
+    """
+    按配置为各分组创建限流器，速率为0的分组不限流
+    """
+    group_limits = {
+        "scheduler": (settings.RATE_LIMIT_SCHEDULER_RATE, settings.RATE_LIMIT_SCHEDULER_BURST),
+        "worker": (settings.RATE_LIMIT_WORKER_RATE, settings.RATE_LIMIT_WORKER_BURST),
+        "manager": (settings.RATE_LIMIT_MANAGER_RATE, settings.RATE_LIMIT_MANAGER_BURST),
+    }
+    return {
+        group: TokenBucketLimiter(rate, burst, settings.RATE_LIMIT_MAX_KEYS)
+        for group, (rate, burst) in group_limits.items()
+        if rate > 0
+    }
+
+
+# 全局限流器，分组 -> 令牌桶集合
+rate_limiters = _create_limiters()
+
+
+def rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    获取各分组的限流统计信息
+    """
+    return {group: limiter.stats() for group, limiter in rate_limiters.items()}
@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 
 from core.agent_registry import AgentRegistry
+from core.capability_index import capability_index
+from core.agent_vector_index import agent_vector_index
 
 # 创建全局agent_registry实例
 agent_registry = AgentRegistry()
 
+# 能力倒排索引随注册表变化增量更新
+agent_registry.add_listener(capability_index.on_registry_event)
+# 智能体向量矩阵随注册表变化增量更新，用于筛选意图识别的候选智能体
+agent_registry.add_listener(agent_vector_index.on_registry_event)
+
 # 导入外部智能体同步相关函数
 from core.external_agent_sync import sync_external_agents, get_external_agent_sync
 
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+语义近似意图缓存模块
+
+将查询在本地转换为哈希字符n-gram向量，通过余弦相似度查找最相近的已缓存查询，
+相似度超过阈值时直接复用其路由到的智能体
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import settings
+from core.utils.text_utils import extract_query_core
+from core.utils.vector_utils import hashed_ngram_vector
+
+
+class SemanticIntentCache:
+    """
+    基于向量相似度的意图缓存
+
+    所有条目的向量存放在一个预先分配的矩阵中，查找时一次矩阵乘法得到全部相似度，
+    内存占用固定为 max_size * dim 个float32
+    """
+
+    def __init__(self, max_size: int, dim: int, threshold: float, ttl: float):
+        """
+        初始化语义缓存
+
+        Args:
+            max_size: 最大缓存条目数，为0时禁用缓存
+            dim: 查询向量维度
+            threshold: 复用缓存结果所需的最低余弦相似度
+            ttl: 缓存条目的存活时间（秒）
+        """
+        self.max_size = max_size
+        self.dim = dim
+        self.threshold = threshold
+        self.ttl = ttl
+        self._matrix = np.zeros((max_size, dim), dtype=np.float32)
+        # 各槽位的过期时间，空闲槽位为-inf，查找时过期和空闲的槽位不参与比较
+        self._expires = np.full(max_size, -np.inf)
+        # 槽位 -> (查询核心内容, 过期时间, 智能体列表)，按最近使用顺序排列
+        self._slots: "OrderedDict[int, Tuple[str, float, List[Dict[str, str]]]]" = OrderedDict()
+        self._slot_by_text: Dict[str, int] = {}
+        self._free_slots: List[int] = list(range(max_size - 1, -1, -1))
+        self._registry_version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, registry_version: int) -> bool:
+        """
+        注册表版本升高时清空缓存，调用方需持有锁
+
+        Returns:
+            bool: 传入的版本号早于缓存当前版本时返回False
+        """
+        if self._registry_version is not None and registry_version < self._registry_version:
+            return False
+        if self._registry_version != registry_version:
+            if self._slots:
+                self.invalidations += 1
+            self._clear()
+            self._registry_version = registry_version
+        return True
+
+    def _clear(self):
+        """
+        清空所有条目，调用方需持有锁
+        """
+        self._matrix.fill(0.0)
+        self._expires.fill(-np.inf)
+        self._slots.clear()
+        self._slot_by_text.clear()
+        self._free_slots = list(range(self.max_size - 1, -1, -1))
+
+    def _release(self, slot: int):
+        """
+        释放指定槽位，调用方需持有锁
+        """
+        text, _, _ = self._slots.pop(slot)
+        del self._slot_by_text[text]
+        self._matrix[slot] = 0.0
+        self._expires[slot] = -np.inf
+        self._free_slots.append(slot)
+
+    def get(self, query: str, registry_version: int) -> Optional[List[Dict[str, str]]]:
+        """
+        查找与查询最相近的缓存条目
+
+        Args:
+            query: 用户查询
+            registry_version: 当前注册表版本号
+
+        Returns:
+            Optional[List[Dict[str, str]]]: 相似度达到阈值时返回智能体列表的副本，否则返回None
+        """
+        if self.max_size <= 0:
+            return None
+        text = extract_query_core(query)
+        if not text:
+            return None
+        vector = hashed_ngram_vector(text, self.dim)
+        with self._lock:
+            if not self._check_version(registry_version) or not self._slots:
+                self.misses += 1
+                return None
+            # 先排除已过期的条目再取最相近的，过期的最近条目不会挡住其他达到阈值的条目
+            scores = np.where(self._expires > time.monotonic(), self._matrix @ vector, -np.inf)
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                self.misses += 1
+                return None
+            _, _, agents = self._slots[slot]
+            self._slots.move_to_end(slot)
+            self.hits += 1
+        return [dict(agent) for agent in agents]
+
+    def set(self, query: str, registry_version: int, agents: List[Dict[str, str]]):
+        """
+        写入缓存，缓存已满时淘汰最久未使用的条目
+
+        Args:
+            query: 用户查询
+            registry_version: 得到该结果时的注册表版本号
+            agents: 意图识别得到的智能体列表
+        """
+        if self.max_size <= 0:
+            return
+        text = extract_query_core(query)
+        if not text:
+            return
+        vector = hashed_ngram_vector(text, self.dim)
+        expires_at = time.monotonic() + self.ttl
+        value = (text, expires_at, [dict(agent) for agent in agents])
+        with self._lock:
+            # 结果基于旧版本注册表得到时不再写入
+            if not self._check_version(registry_version):
+                return
+            slot = self._slot_by_text.get(text)
+            if slot is None:
+                if not self._free_slots:
+                    self._release(next(iter(self._slots)))
+                    self.evictions += 1
+                slot = self._free_slots.pop()
+                self._slot_by_text[text] = slot
+                self._matrix[slot] = vector
+            self._slots[slot] = value
+            self._expires[slot] = expires_at
+            self._slots.move_to_end(slot)
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计信息
+
+        Returns:
+            Dict[str, Any]: 命中、未命中、淘汰等计数
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._slots),
+                "max_size": self.max_size,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+
+# 全局语义缓存实例
+semantic_intent_cache = SemanticIntentCache(
+    settings.SEMANTIC_CACHE_MAX_SIZE,
+    settings.SEMANTIC_CACHE_DIM,
+    settings.SEMANTIC_CACHE_THRESHOLD,
+    settings.SEMANTIC_CACHE_TTL
+)
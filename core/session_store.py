@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+会话存储模块
+
+保存调度器的对话历史，限制单个会话的消息数和全部会话的总内存占用，
+长时间不活跃的会话按TTL过期，超过总量上限时淘汰最久未使用的会话
+"""
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List
+
+from core.config import settings
+
+
+class _Session:
+    """
+    单个会话的数据
+    """
+    __slots__ = ("messages", "message_count", "size", "expires_at")
+
+    def __init__(self, max_messages: int):
+        """
+        初始化会话
+
+        Args:
+            max_messages: 保留的最多消息数
+        """
+        self.messages: Deque[Dict[str, str]] = deque(maxlen=max_messages)
+        # 会话中累计写入的消息数，不受消息数上限截断的影响
+        self.message_count = 0
+        # 当前保留消息的字符数，用于估算内存占用
+        self.size = 0
+        self.expires_at = 0.0
+
+
+class SessionStore:
+    """
+    有界的会话存储
+
+    同一会话的读写通过分段锁串行化，不同会话大多落在不同的锁上，互不阻塞；
+    会话索引和总量统计由一把短暂持有的全局锁保护，加锁顺序固定为先分段锁后全局锁
+    """
+
+    def __init__(self, ttl: float, max_sessions: int, max_total_chars: int,
+                 max_messages: int, lock_stripes: int):
+        """
+        初始化会话存储
+
+        Args:
+            ttl: 会话不活跃多久后过期（秒）
+            max_sessions: 最多保留的会话数
+            max_total_chars: 所有会话消息的总字符数上限
+            max_messages: 单个会话保留的最多消息数，超出时丢弃最早的消息
+            lock_stripes: 分段锁的数量
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_total_chars = max_total_chars
+        self.max_messages = max_messages
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._stripes = [threading.Lock() for _ in range(max(1, lock_stripes))]
+        self._index_lock = threading.Lock()
+        self._total_chars = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.trimmed_messages = 0
+
+    def _stripe(self, session_id: str) -> threading.Lock:
+        """
+        获取会话对应的分段锁
+        """
+        return self._stripes[zlib.crc32(session_id.encode("utf-8")) % len(self._stripes)]
+
+    def _drop(self, session_id: str):
+        """
+        移除会话并扣减总量，调用方需持有全局锁
+        """
+        session = self._sessions.pop(session_id)
+        self._total_chars -= session.size
+
+    def _expire(self, now: float):
+        """
+        清理已过期的会话，调用方需持有全局锁
+
+        会话按最近访问顺序排列，从最旧的一端开始检查，遇到未过期的会话即可停止
+        """
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.expires_at > now:
+                break
+            self._drop(session_id)
+            self.expirations += 1
+
+    def _enforce_limits(self, keep_session_id: str):
+        """
+        超过会话数或总字符数上限时淘汰最久未使用的会话，调用方需持有全局锁
+        """
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions or self._total_chars > self.max_total_chars
+        ):
+            session_id = next(iter(self._sessions))
+            if session_id == keep_session_id:
+                break
+            self._drop(session_id)
+            self.evictions += 1
+
+    def append(self, session_id: str, role: str, content: str) -> int:
+        """
+        向会话追加一条消息，会话不存在时自动创建
+
+        Args:
+            session_id: 会话ID
+            role: 消息角色
+            content: 消息内容
+
+        Returns:
+            int: 追加后该会话累计写入的消息数
+        """
+        now = time.monotonic()
+        with self._stripe(session_id):
+            with self._index_lock:
+                self._expire(now)
+                session = self._sessions.get(session_id)
+                if session is None:
+                    session = _Session(self.max_messages)
+                    self._sessions[session_id] = session
+                else:
+                    self._sessions.move_to_end(session_id)
+                session.expires_at = now + self.ttl
+
+            delta = len(content)
+            trimmed = len(session.messages) == session.messages.maxlen
+            if trimmed:
+                delta -= len(session.messages[0]["content"])
+            session.messages.append({"role": role, "content": content})
+            session.message_count += 1
+            message_count = session.message_count
+
+            with self._index_lock:
+                session.size += delta
+                if trimmed:
+                    self.trimmed_messages += 1
+                # 会话可能已被其他请求淘汰，此时不再计入总量
+                if self._sessions.get(session_id) is session:
+                    self._total_chars += delta
+                    self._enforce_limits(session_id)
+        return message_count
+
+    def get_messages(self, session_id: str) -> List[Dict[str, str]]:
+        """
+        获取会话当前保留的消息
+
+        Args:
+            session_id: 会话ID
+
+        Returns:
+            List[Dict[str, str]]: 消息列表的副本，会话不存在或已过期时返回空列表
+        """
+        now = time.monotonic()
+        with self._stripe(session_id):
+            with self._index_lock:
+                self._expire(now)
+                session = self._sessions.get(session_id)
+                if session is None:
+                    return []
+                self._sessions.move_to_end(session_id)
+                session.expires_at = now + self.ttl
+            return [dict(message) for message in session.messages]
+
+    def __contains__(self, session_id: str) -> bool:
+        """
+        判断会话是否存在且未过期
+        """
+        with self._index_lock:
+            session = self._sessions.get(session_id)
+            return session is not None and session.expires_at > time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取会话存储统计信息
+
+        Returns:
+            Dict[str, Any]: 存活会话数、总字符数及淘汰、过期计数
+        """
+        with self._index_lock:
+            self._expire(time.monotonic())
+            return {
+                "live_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "total_chars": self._total_chars,
+                "max_total_chars": self.max_total_chars,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "trimmed_messages": self.trimmed_messages
+            }
+
+
+# 全局会话存储实例
+session_store = SessionStore(
+    settings.SESSION_TTL,
+    settings.SESSION_MAX_SESSIONS,
+    settings.SESSION_MAX_TOTAL_CHARS,
+    settings.SESSION_MAX_MESSAGES,
+    settings.SESSION_LOCK_STRIPES
+)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+并发请求合并模块
+
+相同键的并发调用只实际执行一次，其余调用等待同一个结果，
+常用于同一问题被大量用户同时提交时合并意图识别的大模型调用
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from core.deadline import DeadlineExceeded, current_deadline, remaining, reset_deadline, shared_deadline
+
+
+class SingleFlight:
+    """
+    按键合并进行中的异步调用
+
+    实际调用在独立的任务中执行，某个等待方被取消或超时不会影响其他等待方，所有等待方都离开后才取消实际调用；
+    调用出错时异常会传递给所有等待方，结果不做任何保留，下一次调用重新执行。
+    实际调用使用自己的截止时间，取所有等待方中最晚的截止时间，不受第一个调用方较短的截止时间限制；
+    每个等待方按自己的截止时间等待结果
+    """
+
+    def __init__(self):
+        """
+        初始化请求合并器
+        """
+        self._in_flight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        # 键 -> 推迟实际调用截止时间的函数
+        self._extend_deadline: Dict[Hashable, Callable[[Optional[float]], None]] = {}
+        # 键 -> 仍在等待结果的调用方数量
+        self._waiters: Dict[Hashable, int] = {}
+        # 实际执行的调用次数
+        self.executions = 0
+        # 被合并、直接等待已有调用结果的次数
+        self.coalesced = 0
+        self.failures = 0
+        # 所有等待方都已取消、因而被取消的实际调用次数
+        self.abandoned = 0
+
+    def _on_done(self, key: Hashable, task: "asyncio.Future[Any]"):
+        """
+        调用结束后移除键，并标记异常已被读取，避免无人等待时产生警告
+        """
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+            del self._extend_deadline[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.failures += 1
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        执行调用，已有相同键的调用在进行时直接等待其结果
+
+        Args:
+            key: 合并调用的键
+            func: 无参数的异步函数，只在没有进行中的调用时执行
+
+        Returns:
+            Tuple[Any, bool]: 调用结果，以及本次是否合并到了已有调用
+
+        Raises:
+            DeadlineExceeded: 本次调用方在得到结果之前超过了截止时间
+        """
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded("请求已超过截止时间")
+        task = self._in_flight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+            self._extend_deadline[key](current_deadline())
+        else:
+            self.executions += 1
+            # 实际调用在使用独立截止时间对象的上下文中创建，之后加入的等待方可以推迟它
+            token, extend = shared_deadline(current_deadline())
+            try:
+                task = asyncio.ensure_future(func())
+            finally:
+                reset_deadline(token)
+            self._in_flight[key] = task
+            self._extend_deadline[key] = extend
+            task.add_done_callback(lambda done: self._on_done(key, done))
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), left), shared
+        except asyncio.TimeoutError:
+            self._abandon(key, task)
+            raise DeadlineExceeded("请求已超过截止时间")
+        except asyncio.CancelledError:
+            # 最后一个等待方被取消（如客户端断开）时不再需要该结果
+            self._abandon(key, task)
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def _abandon(self, key: Hashable, task: "asyncio.Future[Any]"):
+        """
+        等待方提前离开，最后一个等待方离开时取消实际调用
+        """
+        if self._waiters[key] == 1 and not task.done():
+            task.cancel()
+            self.abandoned += 1
+            # 立即移除，之后到来的相同请求重新发起调用，而不是等待已取消的调用
+            if self._in_flight.get(key) is task:
+                del self._in_flight[key]
+                del self._extend_deadline[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取请求合并统计信息
+
+        Returns:
+            Dict[str, Any]: 进行中的调用数、实际执行次数、合并次数、失败次数和放弃次数
+        """
+        return {
+            "in_flight": len(self._in_flight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "abandoned": self.abandoned
+        }
+
+
+# 意图识别请求合并实例
+intent_single_flight = SingleFlight()
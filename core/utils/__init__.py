@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
 
-from .prompt_utils import PromptManager
-from .log_utils import LogManager, get_logger, debug, info, warning, error, critical, log_manager
+from .prompt_utils import PromptManager, PromptTemplate
+from .log_utils import LogManager, get_logger, debug, info, warning, error, critical, log_manager, truncate
+from .text_utils import normalize_query, extract_query_core
+from .stream_utils import format_sse, wants_event_stream
 
 __all__ = [
     'PromptManager',
+    'PromptTemplate',
     'LogManager',
     'get_logger',
     'debug',
@@ -12,5 +15,10 @@ __all__ = [
     'warning',
     'error',
     'critical',
-    'log_manager'
+    'log_manager',
+    'truncate',
+    'normalize_query',
+    'extract_query_core',
+    'format_sse',
+    'wants_event_stream'
 ]
\ No newline at end of file
@@ -1,9 +1,22 @@
 # -*- coding: utf-8 -*-
+"""
+日志工具模块
+
+日志记录在调用线程中只生成LogRecord并放入有界队列，由后台线程完成消息格式化和文件、控制台输出。
+消息使用 %s 占位符时，参数只在记录真正输出时才被格式化；大对象可以用 truncate() 包装，
+输出时再截断；高频调用点可以通过 sample_rate 参数按比例采样
+"""
+import atexit
+import json
 import logging
-
+import logging.handlers
 import os
+import queue
+import random
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
+
+from core.config import settings
 
 # 创建logs目录（如果不存在）
 LOGS_DIR = "logs"
@@ -11,6 +24,62 @@ if not os.path.exists(LOGS_DIR):
     os.makedirs(LOGS_DIR)
 
 
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "name": record.name,
+            "level": record.levelname,
+            "file": record.filename,
+            "line": record.lineno,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    不在调用线程中格式化消息的队列处理器
+
+    标准QueueHandler入队前会调用format()，这里直接把原始记录放入队列，
+    由后台线程输出时再格式化；队列已满时丢弃记录而不阻塞请求
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class Truncated:
+    """
+    延迟截断的日志参数，只在日志真正输出时转换为字符串
+    """
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = str(self.value)
+        if self.limit <= 0 or len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}...(共{len(text)}字符)"
+
+
 class LogManager:
     """日志管理器，提供统一的日志记录功能"""
     
@@ -28,6 +97,8 @@ class LogManager:
             
         self.logger = logging.getLogger("agent_manager")
         self.logger.setLevel(log_level)
+        self.queue_handler: Optional[_LazyQueueHandler] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
         
         # 避免重复添加处理器
         if not self.logger.handlers:
@@ -44,37 +115,77 @@ class LogManager:
             console_handler.setLevel(log_level)
             
             # 创建格式器，包含模块名和行号
-            formatter = logging.Formatter(
-                '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s'
-            )
+            if settings.LOG_FORMAT == "json":
+                formatter = JsonFormatter()
+            else:
+                formatter = logging.Formatter(
+                    '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s'
+                )
             file_handler.setFormatter(formatter)
             console_handler.setFormatter(formatter)
             
+            # 由后台线程把队列中的日志写入文件和控制台
+            log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+            self.queue_handler = _LazyQueueHandler(log_queue)
+            self.listener = logging.handlers.QueueListener(
+                log_queue, file_handler, console_handler, respect_handler_level=True
+            )
+            self.listener.start()
+            atexit.register(self.shutdown)
+            
             # 添加处理器到日志记录器
-            self.logger.addHandler(file_handler)
-            self.logger.addHandler(console_handler)
+            self.logger.addHandler(self.queue_handler)
         
         LogManager._initialized = True
     
-    def debug(self, message: str):
+    def shutdown(self):
+        """停止后台线程，输出队列中剩余的日志"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+    
+    @property
+    def dropped(self) -> int:
+        """队列已满时丢弃的日志条数"""
+        return self.queue_handler.dropped if self.queue_handler else 0
+    
+    def log(self, level: int, message: str, *args: Any, sample_rate: float = 1.0, stacklevel: int = 1):
+        """
+        记录日志
+
+        Args:
+            level: 日志级别
+            message: 日志消息，可以包含 %s 占位符
+            *args: 占位符参数，只在日志真正输出时格式化
+            sample_rate: 采样比例，小于1时按比例随机丢弃，用于高频调用点
+            stacklevel: 与标准库logging相同，为1时记录调用本方法的位置，每经过一层封装加1
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+        if sample_rate < 1.0 and random.random() >= sample_rate:
+            return
+        # 再跳过本方法这一层
+        self.logger.log(level, message, *args, stacklevel=stacklevel + 1)
+    
+    def debug(self, message: str, *args: Any, sample_rate: float = 1.0, stacklevel: int = 1):
         """记录调试信息"""
-        self.logger.debug(message, stacklevel=3)  # 跳过debug->_log->实际调用者
+        self.log(logging.DEBUG, message, *args, sample_rate=sample_rate, stacklevel=stacklevel + 1)
     
-    def info(self, message: str):
+    def info(self, message: str, *args: Any, sample_rate: float = 1.0, stacklevel: int = 1):
         """记录一般信息"""
-        self.logger.info(message, stacklevel=3)
+        self.log(logging.INFO, message, *args, sample_rate=sample_rate, stacklevel=stacklevel + 1)
     
-    def warning(self, message: str):
+    def warning(self, message: str, *args: Any, sample_rate: float = 1.0, stacklevel: int = 1):
         """记录警告信息"""
-        self.logger.warning(message, stacklevel=3)
+        self.log(logging.WARNING, message, *args, sample_rate=sample_rate, stacklevel=stacklevel + 1)
     
-    def error(self, message: str):
+    def error(self, message: str, *args: Any, sample_rate: float = 1.0, stacklevel: int = 1):
         """记录错误信息"""
-        self.logger.error(message, stacklevel=3)
+        self.log(logging.ERROR, message, *args, sample_rate=sample_rate, stacklevel=stacklevel + 1)
     
-    def critical(self, message: str):
+    def critical(self, message: str, *args: Any, sample_rate: float = 1.0, stacklevel: int = 1):
         """记录严重错误信息"""
-        self.logger.critical(message, stacklevel=3)
+        self.log(logging.CRITICAL, message, *args, sample_rate=sample_rate, stacklevel=stacklevel + 1)
 
 
 # 创建全局日志管理器实例
@@ -86,27 +197,41 @@ def get_logger() -> logging.Logger:
     return log_manager.logger
 
 
+def truncate(value: Any, limit: Optional[int] = None) -> Truncated:
+    """
+    包装日志参数，输出时截断过长的内容
+
+    Args:
+        value: 日志参数，如大模型响应对象、完整提示词
+        limit: 最大字符数，默认为 LOG_MAX_PAYLOAD_CHARS
+
+    Returns:
+        Truncated: 延迟截断的参数
+    """
+    return Truncated(value, settings.LOG_MAX_PAYLOAD_CHARS if limit is None else limit)
+
+
 # 提供便捷的日志函数
-def debug(message: str):
+def debug(message: str, *args: Any, sample_rate: float = 1.0, stacklevel: int = 1):
     """记录调试信息的便捷函数"""
-    log_manager.debug(message)
+    log_manager.debug(message, *args, sample_rate=sample_rate, stacklevel=stacklevel + 1)
 
 
-def info(message: str):
+def info(message: str, *args: Any, sample_rate: float = 1.0, stacklevel: int = 1):
     """记录一般信息的便捷函数"""
-    log_manager.info(message)
+    log_manager.info(message, *args, sample_rate=sample_rate, stacklevel=stacklevel + 1)
 
 
-def warning(message: str):
+def warning(message: str, *args: Any, sample_rate: float = 1.0, stacklevel: int = 1):
     """记录警告信息的便捷函数"""
-    log_manager.warning(message)
+    log_manager.warning(message, *args, sample_rate=sample_rate, stacklevel=stacklevel + 1)
 
 
-def error(message: str):
+def error(message: str, *args: Any, sample_rate: float = 1.0, stacklevel: int = 1):
     """记录错误信息的便捷函数"""
-    log_manager.error(message)
+    log_manager.error(message, *args, sample_rate=sample_rate, stacklevel=stacklevel + 1)
 
 
-def critical(message: str):
+def critical(message: str, *args: Any, sample_rate: float = 1.0, stacklevel: int = 1):
     """记录严重错误信息的便捷函数"""
-    log_manager.critical(message)
\ No newline at end of file
+    log_manager.critical(message, *args, sample_rate=sample_rate, stacklevel=stacklevel + 1)
@@ -4,40 +4,191 @@
 """
 提示词工具模块
 用于处理提示词文件的读取、管理和格式化等功能
+
+prompt/ 目录下的文件在启动时一次性加载到内存并预编译，之后只在文件修改时间变化
+（最多每 PROMPT_RELOAD_CHECK_INTERVAL 秒检查一次）或显式调用 reload() 时重新读取
 """
 
 import os
 import json
-from typing import Dict, Any, Optional
+import string
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
 from core.config import settings
 
 # 获取项目根目录
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
+class PromptTemplate:
+    """
+    预编译的提示词模板
+
+    加载时解析一次模板结构，格式化时直接拼接文本片段和参数，
+    语义与 str.format 一致
+    """
+
+    def __init__(self, name: str, content: str, mtime: float):
+        """
+        初始化提示词模板
+
+        Args:
+            name: 提示词文件名
+            content: 模板内容
+            mtime: 文件修改时间
+        """
+        self.name = name
+        self.content = content
+        self.mtime = mtime
+        self.error: Optional[str] = None
+        self._segments: Optional[List[Tuple[str, Optional[str]]]] = None
+        try:
+            segments = []
+            simple = True
+            for literal, field_name, format_spec, conversion in string.Formatter().parse(content):
+                if field_name is not None and (
+                    not field_name.isidentifier() or format_spec or conversion
+                ):
+                    simple = False
+                    break
+                segments.append((literal, field_name))
+            if simple:
+                self._segments = segments
+        except ValueError as e:
+            self.error = str(e)
+
+    @property
+    def is_empty(self) -> bool:
+        """
+        模板是否为空
+        """
+        return not self.content.strip()
+
+    def format(self, **kwargs) -> str:
+        """
+        格式化模板
+
+        Args:
+            **kwargs: 格式化参数
+
+        Returns:
+            str: 格式化后的提示词
+
+        Raises:
+            KeyError: 缺少模板需要的参数
+            ValueError: 模板格式不正确
+        """
+        if self._segments is None:
+            # 包含位置参数、格式说明等复杂字段时交给str.format处理
+            return self.content.format(**kwargs)
+        parts = []
+        for literal, field_name in self._segments:
+            parts.append(literal)
+            if field_name is not None:
+                parts.append(format(kwargs[field_name]))
+        return "".join(parts)
+
+
 class PromptManager:
     """提示词管理器"""
     
     def __init__(self):
-        """初始化提示词管理器"""
+        """初始化提示词管理器，加载全部提示词文件"""
         self.prompt_dir = os.path.join(PROJECT_ROOT, "prompt")
+        self.check_interval = settings.PROMPT_RELOAD_CHECK_INTERVAL
+        self._templates: Dict[str, Optional[PromptTemplate]] = {}
+        # 文件名 -> 下次检查修改时间的时刻
+        self._next_check: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.reload()
     
-    def read_prompt_from_file(self, filename: str) -> str:
+    def _load(self, filename: str) -> Optional[PromptTemplate]:
         """
-        从文件中读取提示词
-        
+        从磁盘读取并预编译提示词文件，文件不存在时返回None
+        """
+        prompt_file_path = os.path.join(self.prompt_dir, filename)
+        try:
+            mtime = os.stat(prompt_file_path).st_mtime
+            with open(prompt_file_path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        template = PromptTemplate(filename, content, mtime)
+        from core.utils.log_utils import warning
+        if template.is_empty:
+            warning(f"提示词文件为空，将使用内置默认提示词: {filename}")
+        elif template.error:
+            warning(f"提示词文件格式不正确: {filename}, 错误: {template.error}")
+        return template
+    
+    def reload(self) -> Dict[str, Any]:
+        """
+        重新加载prompt目录下的全部提示词文件
+
+        Returns:
+            Dict[str, Any]: 加载结果，包括已加载、为空和格式不正确的文件
+        """
+        templates: Dict[str, Optional[PromptTemplate]] = {}
+        if os.path.isdir(self.prompt_dir):
+            for filename in sorted(os.listdir(self.prompt_dir)):
+                if os.path.isfile(os.path.join(self.prompt_dir, filename)):
+                    templates[filename] = self._load(filename)
+        next_check = time.monotonic() + self.check_interval
+        with self._lock:
+            self._templates = templates
+            self._next_check = {filename: next_check for filename in templates}
+        from core.utils.log_utils import info
+        info(f"已加载 {len(templates)} 个提示词文件")
+        return {
+            "loaded": sorted(name for name, template in templates.items() if template and not template.is_empty),
+            "empty": sorted(name for name, template in templates.items() if template and template.is_empty),
+            "invalid": sorted(name for name, template in templates.items() if template and template.error)
+        }
+    
+    def get_template(self, filename: str) -> Optional[PromptTemplate]:
+        """
+        获取预编译的提示词模板
+
         Args:
             filename: 提示词文件名
-            
+
         Returns:
-            str: 提示词内容
+            Optional[PromptTemplate]: 提示词模板，文件不存在时返回None
         """
+        now = time.monotonic()
+        with self._lock:
+            template = self._templates.get(filename)
+            if filename in self._templates and now < self._next_check.get(filename, 0.0):
+                return template
+            self._next_check[filename] = now + self.check_interval
+
+        # 到达检查间隔或首次请求该文件时，根据修改时间决定是否重新读取
         prompt_file_path = os.path.join(self.prompt_dir, filename)
         try:
-            with open(prompt_file_path, "r", encoding="utf-8") as f:
-                return f.read()
-        except FileNotFoundError:
-            return ""
+            mtime = os.stat(prompt_file_path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime is None:
+            template = None
+        elif template is None or template.mtime != mtime:
+            template = self._load(filename)
+        with self._lock:
+            self._templates[filename] = template
+        return template
+    
+    def read_prompt_from_file(self, filename: str) -> str:
+        """
+        从文件中读取提示词
+
+        Args:
+            filename: 提示词文件名
+
+        Returns:
+            str: 提示词内容，文件不存在或为空时返回空字符串
+        """
+        template = self.get_template(filename)
+        return template.content if template and not template.is_empty else ""
     
     def get_agent_prompt(self, agent_name: str) -> str:
         """
@@ -101,6 +252,29 @@ def read_prompt_from_file(filename: str) -> str:
     return prompt_manager.read_prompt_from_file(filename)
 
 
+def get_prompt_template(filename: str) -> Optional[PromptTemplate]:
+    """
+    获取预编译提示词模板的工具函数
+
+    Args:
+        filename: 提示词文件名
+
+    Returns:
+        Optional[PromptTemplate]: 提示词模板，文件不存在时返回None
+    """
+    return prompt_manager.get_template(filename)
+
+
+def reload_prompts() -> Dict[str, Any]:
+    """
+    重新加载全部提示词文件的工具函数
+
+    Returns:
+        Dict[str, Any]: 加载结果
+    """
+    return prompt_manager.reload()
+
+
 def get_agent_prompt(agent_name: str) -> str:
     """
     根据agent名称获取对应的提示词
@@ -119,7 +293,7 @@ def format_prompt(template: str, **kwargs) -> str:
     格式化提示词模板的工具函数
     
     Args:
-        template: 提示词模板
+        template: 提示词模板，可以是字符串或PromptTemplate
         **kwargs: 格式化参数
         
     Returns:
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式响应工具模块
+用于构造Server-Sent Events、NDJSON等流式响应的数据帧
+"""
+
+import json
+from typing import Any, Optional
+
+# NDJSON流式响应的媒体类型，每行一个JSON对象
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# 流式响应的公共响应头，禁止中间代理缓冲
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+
+def wants_event_stream(accept: str) -> bool:
+    """
+    判断客户端是否通过Accept请求头要求SSE流式响应
+
+    Args:
+        accept: Accept请求头内容
+
+    Returns:
+        bool: 要求 text/event-stream 时返回True
+    """
+    return "text/event-stream" in (accept or "")
+
+
+def format_sse(event: str, data: Any) -> str:
+    """
+    构造一条SSE事件
+
+    Args:
+        event: 事件名称
+        data: 事件数据，序列化为JSON
+
+    Returns:
+        str: SSE事件文本
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def stream_format(accept: str) -> Optional[str]:
+    """
+    根据Accept请求头选择流式响应格式
+
+    Args:
+        accept: Accept请求头内容
+
+    Returns:
+        Optional[str]: sse 或 ndjson，不要求流式响应时返回None
+    """
+    if wants_event_stream(accept):
+        return "sse"
+    if NDJSON_MEDIA_TYPE in (accept or ""):
+        return "ndjson"
+    return None
+
+
+def format_ndjson(event: str, data: Any) -> str:
+    """
+    构造一行NDJSON事件
+
+    Args:
+        event: 事件名称
+        data: 事件数据
+
+    Returns:
+        str: 形如 {"event": ..., "data": ...} 的一行JSON
+    """
+    return json.dumps({"event": event, "data": data}, ensure_ascii=False) + "\n"
+
+
+def format_stream_event(fmt: str, event: str, data: Any) -> str:
+    """
+    按流式响应格式构造一条事件
+
+    Args:
+        fmt: sse 或 ndjson
+        event: 事件名称
+        data: 事件数据
+
+    Returns:
+        str: 事件文本
+    """
+    if fmt == "ndjson":
+        return format_ndjson(event, data)
+    return format_sse(event, data)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文本处理工具模块
+用于查询文本的归一化等功能
+"""
+
+import re
+import unicodedata
+from typing import List
+
+# 对判断查询意图没有帮助的常见疑问词和语气词，按长度从长到短匹配
+FILLER_WORDS = (
+    "为什么", "是什么", "怎么样", "怎么", "怎样", "如何", "什么", "请问", "一下", "使用",
+    "吗", "呢", "吧", "啊", "的", "了", "请"
+)
+_FILLER_PATTERN = re.compile("|".join(sorted(FILLER_WORDS, key=len, reverse=True)))
+_NON_WORD_PATTERN = re.compile(r"[\W_]+")
+# 连续的中日韩文字，或连续的字母数字
+_TERM_RUN_PATTERN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+|[^\W_\u3400-\u9fff\uf900-\ufaff]+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    归一化用户查询，使仅在格式上不同的查询得到相同的结果
+
+    依次进行全角转半角（NFKC）、大小写折叠和空白合并
+
+    Args:
+        query: 用户查询
+
+    Returns:
+        str: 归一化后的查询
+    """
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+def extract_query_core(query: str) -> str:
+    """
+    提取查询的核心内容，用于近似匹配
+
+    在归一化的基础上去除标点、空白以及常见的疑问词和语气词，
+    例如"勾股定理怎么用"与"勾股定理如何使用"会得到相近的结果。
+    去除的位置用空格分隔成多个片段，切分检索词和n-gram时不会跨越原本不相邻的字，
+    例如"方程的根"得到"方程 根"，不会产生"程根"
+
+    Args:
+        query: 用户查询
+
+    Returns:
+        str: 查询的核心内容，多个片段以单个空格分隔
+    """
+    text = _NON_WORD_PATTERN.sub(" ", normalize_query(query))
+    return " ".join(_FILLER_PATTERN.sub(" ", text).split())
+
+
+def tokenize_terms(text: str) -> List[str]:
+    """
+    将文本切分为检索词
+
+    中文按字符二元组切分（单字片段保留单字），字母数字按单词切分，
+    下划线视为分隔符，例如"problem_solving"切分为"problem"和"solving"
+
+    Args:
+        text: 输入文本
+
+    Returns:
+        List[str]: 检索词列表，保持出现顺序，可能包含重复项
+    """
+    terms = []
+    for run in _TERM_RUN_PATTERN.findall(normalize_query(text)):
+        if "\u3400" <= run[0] <= "\u9fff" or "\uf900" <= run[0] <= "\ufaff":
+            if len(run) == 1:
+                terms.append(run)
+            else:
+                terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return terms
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+向量工具模块
+用于在本地将文本转换为哈希字符n-gram向量，不依赖外部向量服务
+"""
+
+import zlib
+from typing import Sequence
+
+import numpy as np
+
+
+def hashed_ngram_vector(text: str, dim: int, ngram_sizes: Sequence[int] = (1, 2)) -> np.ndarray:
+    """
+    将文本转换为L2归一化的哈希字符n-gram向量
+
+    使用crc32作为哈希函数，保证不同进程间结果一致。空白分隔的片段分别切分，n-gram不跨越空白
+
+    Args:
+        text: 输入文本
+        dim: 向量维度
+        ngram_sizes: 使用的n-gram长度
+
+    Returns:
+        np.ndarray: float32向量，文本为空时返回全零向量
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for segment in text.split():
+        for n in ngram_sizes:
+            for i in range(len(segment) - n + 1):
+                vector[zlib.crc32(segment[i:i + n].encode("utf-8")) % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from core.config import settings
 import asyncio
 from core.registry_manager import agent_registry
@@ -11,6 +12,36 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# 后添加的中间件在外层：先统计指标，再限流，最后设置请求截止时间
+from core.middleware import DeadlineMiddleware, MetricsMiddleware, RateLimitMiddleware
+# 设置请求截止时间，超时或客户端断开时取消处理
+app.add_middleware(DeadlineMiddleware)
+# 按调用方限流，被限流的请求直接返回429
+app.add_middleware(RateLimitMiddleware)
+# 统计请求数、错误数、处理中的请求数和各阶段耗时
+app.add_middleware(MetricsMiddleware)
+
+from core.llm_admission import AdmissionRejected
+from core.deadline import DeadlineExceeded
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """
+    大模型调用等待队列已满时返回503，并通过 Retry-After 提示客户端稍后重试
+    """
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, int(round(exc.retry_after))))}
+    )
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    """
+    处理过程中超过请求截止时间时返回504，与截止时间中间件超时时的响应相同
+    """
+    return JSONResponse(status_code=504, content={"detail": "请求处理超时"})
+
 @app.on_event("startup")
 async def startup_event():
     """
@@ -19,12 +50,20 @@ async def startup_event():
     # 延迟导入并注册路由以避免循环导入
     from agents.scheduler import scheduler_router
     from agents.worker import worker_router
-    from agents.manager import manager_router
+    from agents.manager import manager_router, register_default_agent_handlers
     
     app.include_router(scheduler_router, prefix="/api/v1/scheduler", tags=["scheduler"])
     app.include_router(worker_router, prefix="/api/v1/worker", tags=["worker"])
     app.include_router(manager_router, prefix="/api/v1/manager", tags=["manager"])
     
+    # 注册内置领域智能体的处理函数，执行任务时按智能体ID直接分派
+    register_default_agent_handlers()
+    
+    # 启动执行异步任务的worker
+    from agents.worker import run_agent_task
+    from core.job_queue import job_queue
+    job_queue.start(run_agent_task)
+    
     # # 导入并注册数学智能体
     # from agents.math_agent import register_math_agent
     # register_math_agent(agent_registry)
@@ -46,6 +85,18 @@ async def startup_event():
     except Exception as e:
         error(f"同步外部智能体时发生错误: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    系统关闭时停止异步任务worker，释放共享的LLM连接池，并等待调用结果缓存写入磁盘
+    """
+    from core.qwen_client import close_qwen_client
+    from core.completion_cache import completion_cache
+    from core.job_queue import job_queue
+    await job_queue.stop()
+    await close_qwen_client()
+    completion_cache.close()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Agent Manager System"}
@@ -54,6 +105,14 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    以Prometheus文本格式导出运行指标
+    """
+    from core.metrics import render_metrics
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8847)
\ No newline at end of file
@@ -77,6 +77,23 @@ class TaskResponse(BaseModel):
     session_id: str = Field(..., description="会话ID")
     target_agents: List[Dict[str, str]] = Field(..., description="目标智能体列表")
     response: Optional[str] = Field(None, description="响应内容")
+    routing_source: Optional[str] = Field(None, description="路由来源: capability_index|exact_cache|semantic_cache|llm")
+
+
+class BatchTaskRequest(BaseModel):
+    requests: List[TaskRequest] = Field(..., description="用户查询列表")
+
+
+class BatchTaskItem(BaseModel):
+    index: int = Field(..., description="查询在请求列表中的位置")
+    result: Optional[TaskResponse] = Field(None, description="处理成功时的任务响应")
+    error: Optional[str] = Field(None, description="处理失败时的错误信息")
+
+
+class BatchTaskResponse(BaseModel):
+    results: List[BatchTaskItem] = Field(..., description="按请求顺序排列的处理结果")
+    succeeded: int = Field(..., description="处理成功的查询数")
+    failed: int = Field(..., description="处理失败的查询数")
 
 
 class AgentExecutionRequest(BaseModel):
@@ -90,4 +107,23 @@ class AgentExecutionResponse(BaseModel):
     agent_id: str = Field(..., description="智能体ID")
     output_data: Dict[str, Any] = Field(..., description="输出数据")
     execution_time: float = Field(..., description="执行时间(秒)")
-    status: str = Field(..., description="执行状态")
\ No newline at end of file
+    status: str = Field(..., description="执行状态")
+
+
+class JobState(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class JobStatus(BaseModel):
+    task_id: str = Field(..., description="任务ID")
+    agent_id: str = Field(..., description="智能体ID")
+    status: JobState = Field(..., description="任务状态")
+    submitted_at: datetime = Field(..., description="提交时间")
+    started_at: Optional[datetime] = Field(None, description="开始执行时间")
+    finished_at: Optional[datetime] = Field(None, description="结束时间")
+    result: Optional[AgentExecutionResponse] = Field(None, description="执行结果，任务成功后返回")
+    error: Optional[str] = Field(None, description="错误信息，任务失败时返回")